@@ -0,0 +1,114 @@
+"""Benchmark CPU per stream untuk jalur playback musik.
+
+Membandingkan:
+  * pcm          - FFmpegPCMAudio + PCMVolumeTransformer + encode Opus di Python (jalur lama)
+  * opus-encode  - YTDLOpusSource, FFmpeg encode libopus + volume filter
+  * opus-copy    - YTDLOpusSource passthrough (source sudah Opus, tanpa filter)
+
+Setiap stream dibaca di thread sendiri dengan tempo 20 ms per frame seperti AudioPlayer
+discord.py, jadi angka yang keluar adalah CPU untuk memutar N stream secara real-time.
+
+Pemakaian:
+    python benchmarks/audio_cpu.py lagu.webm --streams 10 --seconds 30
+
+Butuh ffmpeg di PATH, dan libopus untuk jalur pcm.
+"""
+import argparse
+import ctypes.util
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from main import YTDLOpusSource, YTDLSource, ffmpeg_options, MUSIC_VOLUME  # noqa: E402
+
+FRAME_DELAY = discord.opus.Encoder.FRAME_LENGTH / 1000.0
+
+
+def cpu_times() -> tuple[float, float]:
+    """(CPU proses Python, CPU child process yang sudah selesai/ditunggu)."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def make_source(mode: str, path: str) -> discord.AudioSource:
+    data = {'title': os.path.basename(path), 'url': path}
+    if mode == 'pcm':
+        return YTDLSource(discord.FFmpegPCMAudio(path, **ffmpeg_options), data=data, volume=MUSIC_VOLUME)
+    return YTDLOpusSource(path, data=data, passthrough=(mode == 'opus-copy'))
+
+
+def run_stream(source: discord.AudioSource, seconds: float, frames: list[int]):
+    encoder = None if source.is_opus() else discord.opus.Encoder()
+    deadline = time.perf_counter() + seconds
+    next_tick = time.perf_counter()
+    count = 0
+    while time.perf_counter() < deadline:
+        frame = source.read()
+        if not frame:
+            break
+        if encoder is not None:
+            encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+        count += 1
+        next_tick += FRAME_DELAY
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    frames.append(count)
+
+
+def bench(mode: str, path: str, streams: int, seconds: float) -> dict:
+    sources = [make_source(mode, path) for _ in range(streams)]
+    frames: list[int] = []
+    py_before, ff_before = cpu_times()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_stream, args=(source, seconds, frames)) for source in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    for source in sources:
+        # cleanup menunggu proses FFmpeg, sehingga CPU-nya masuk RUSAGE_CHILDREN
+        source.cleanup()
+    py_after, ff_after = cpu_times()
+    python_cpu = py_after - py_before
+    ffmpeg_cpu = ff_after - ff_before
+    return {
+        'mode': mode,
+        'streams': streams,
+        'frames': sum(frames),
+        'python_pct_per_stream': python_cpu / wall / streams * 100,
+        'ffmpeg_pct_per_stream': ffmpeg_cpu / wall / streams * 100,
+        'total_pct_per_stream': (python_cpu + ffmpeg_cpu) / wall / streams * 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='File audio lokal (sebaiknya .webm/.opus dari YouTube)')
+    parser.add_argument('--streams', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--modes', default='pcm,opus-encode,opus-copy')
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    if 'pcm' in modes and not discord.opus.is_loaded():
+        library = ctypes.util.find_library('opus')
+        if library is None:
+            sys.exit('libopus tidak ditemukan; jalankan dengan --modes opus-encode,opus-copy')
+        discord.opus.load_opus(library)
+
+    print(f"{'mode':<12} {'streams':>7} {'frames':>8} {'python%':>9} {'ffmpeg%':>9} {'total%':>9}  (CPU per stream)")
+    for mode in modes:
+        result = bench(mode, args.path, args.streams, args.seconds)
+        print(f"{result['mode']:<12} {result['streams']:>7} {result['frames']:>8} "
+              f"{result['python_pct_per_stream']:>9.2f} {result['ffmpeg_pct_per_stream']:>9.2f} "
+              f"{result['total_pct_per_stream']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Biaya AutoMod.check() per pesan di jalur on_message.
+
+Tanpa koneksi Discord: pesan tiruan langsung diumpankan ke automod.check() dengan
+pengaturan guild yang diisi ke settings_cache. Skenario:
+
+    off      guild tanpa auto-mod (biaya untuk guild yang tidak memakai fitur ini)
+    normal   banyak user aktif bergantian, tidak ada pelanggaran
+    churn    tiap pesan dari user baru, state lama terus di-evict (AUTOMOD_MAX_USERS kecil)
+    spam     satu user membanjiri channel, tiap pesan melanggar dan dijadwalkan untuk dihapus
+
+Pemakaian:
+    python benchmarks/automod_bench.py --messages 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_DB_PATH', os.path.join(tempfile.gettempdir(), 'automod_bench.db'))
+
+import discord  # noqa: E402
+import main  # noqa: E402
+
+GUILD_ID = 10 ** 17
+
+
+class FakeChannel:
+    id = GUILD_ID + 1
+
+    async def send(self, **kwargs):
+        pass
+
+
+class FakeGuild:
+    id = GUILD_ID
+
+
+class FakeMember:
+    guild_permissions = discord.Permissions.none()
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+    async def timeout(self, duration, *, reason=None):
+        pass
+
+
+class FakeMessage:
+    __slots__ = ('author', 'guild', 'channel', 'content', 'mentions', 'role_mentions')
+
+    def __init__(self, author: FakeMember, content: str):
+        self.author = author
+        self.guild = FakeGuild
+        self.channel = FakeChannel
+        self.content = content
+        self.mentions = []
+        self.role_mentions = []
+
+    async def delete(self):
+        pass
+
+
+def scenario_messages(name: str, count: int, users: int) -> list[FakeMessage]:
+    if name == 'spam':
+        member = FakeMember(2)
+        return [FakeMessage(member, "BELI FOLLOWER MURAH!!!") for _ in range(count)]
+    if name == 'churn':
+        return [FakeMessage(FakeMember(2 + i), f"halo {i}") for i in range(count)]
+    members = [FakeMember(2 + i) for i in range(users)]
+    return [FakeMessage(members[i % users], f"pesan ke-{i} dari obrolan biasa") for i in range(count)]
+
+
+async def run(args):
+    config = main.AutoModConfig(*main.AutoModConfig.DEFAULTS)
+    # Waktu benchmark jauh lebih rapat dari obrolan asli; ambang flood dilonggarkan supaya skenario normal tetap bersih
+    relaxed = main.AutoModConfig('timeout', args.messages, 5.0, 3, 30.0, 5, 600)
+    print(f"{'skenario':<8} {'ns/pesan':>9} {'state':>7} {'evict':>7} {'langgar':>8}")
+    for name in args.scenarios:
+        messages = scenario_messages(name, args.messages, args.users)
+        engine = main.AutoMod(args.users // 10 if name == 'churn' else main.AUTOMOD_MAX_USERS,
+                              main.AUTOMOD_IDLE_TTL, main.AUTOMOD_COOLDOWN)
+        main.settings_cache.automod = {} if name == 'off' else {GUILD_ID: config if name == 'spam' else relaxed}
+        check = engine.check
+        started = time.perf_counter_ns()
+        for message in messages:
+            check(message)
+        per_message = (time.perf_counter_ns() - started) / len(messages)
+        violations = sum(engine.violations.values())
+        # Task penghapusan yang dijadwalkan di skenario spam dibiarkan selesai di luar pengukuran
+        await engine.close()
+        print(f"{name:<8} {per_message:>9.0f} {len(engine.states):>7} {engine.evicted:>7} {violations:>8}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Ukur biaya auto-mod per pesan")
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=10_000, help="User aktif di skenario normal")
+    parser.add_argument('--scenarios', nargs='+', default=['off', 'normal', 'churn', 'spam'])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,383 @@
+"""Replay trafik tiruan ke handler asli bot, tanpa koneksi Discord.
+
+Skenario (bisa dipilih dengan --scenarios):
+  * messages - banjir pesan ke on_message
+  * joins    - burst member join ke on_member_join (welcome aktif, diukur sampai embed terkirim)
+  * tickets  - klik tombol bersamaan ke TicketOptionsView.create_ticket lalu CloseTicketView.close_ticket
+  * play     - burst /play dengan extractor tiruan (tanpa yt-dlp/FFmpeg)
+
+Guild, member, channel, interaction, dan voice client diganti objek tiruan; database,
+cache, antrian kirim, dan semua logika bot tetap yang asli. Database memakai file
+sementara. Hasil: event per detik, latency p50/p99, dan jumlah commit database.
+
+Pemakaian:
+    python benchmarks/load_replay.py
+    python benchmarks/load_replay.py --scenarios messages joins --rate 2000 --count 20000
+    python benchmarks/load_replay.py --scenarios play --extract-ms 800 --send-ms 50
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKDIR = tempfile.mkdtemp(prefix='load_replay_')
+os.environ.setdefault('BOT_DB_PATH', os.path.join(WORKDIR, 'bot_data.db'))
+os.environ.setdefault('TRANSCRIPT_DIR', os.path.join(WORKDIR, 'transcripts'))
+os.environ.setdefault('AUDIO_CACHE_MAX_MB', '0')
+
+import discord  # noqa: E402
+import main  # noqa: E402
+
+SCENARIOS = ('messages', 'joins', 'tickets', 'play')
+_ids = itertools.count(10 ** 15)
+
+
+class FakeBotUser:
+    id = 1
+    bot = True
+
+
+class FakeAvatar:
+    url = 'https://cdn.discordapp.com/embed/avatars/0.png'
+
+
+class FakeTextChannel:
+    def __init__(self, guild, name: str, send_delay: float):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f'<#{self.id}>'
+        self.send_delay = send_delay
+        self.sent = 0
+
+    async def send(self, **kwargs):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.sent += 1
+        return kwargs
+
+    async def history(self, *, limit=None, oldest_first=False):
+        # Satu pesan per kirim, cukup untuk menjalankan export transcript saat ticket ditutup
+        for i in range(self.sent):
+            yield FakeHistoryMessage(i, self.guild.me)
+
+    async def delete(self):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeHistoryMessage:
+    def __init__(self, message_id: int, author):
+        self.id = message_id
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.author = author
+        self.content = 'isi ticket'
+        self.embeds = []
+        self.attachments = []
+
+
+class FakeBotMember:
+    id = 1
+    bot = True
+
+    def __str__(self):
+        return 'bot'
+
+
+class FakeVoiceClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self.source = None
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        # Lagu pertama terus "diputar", lagu berikutnya masuk queue
+        return self.source is not None
+
+    def play(self, source, *, after=None):
+        self.source = source
+
+    def stop(self):
+        self.source = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, send_delay: float):
+        self.id = next(_ids)
+        self.name = f'guild-{self.id}'
+        self.member_count = 0
+        self.send_delay = send_delay
+        self.channels: dict[int, object] = {}
+        self.voice_client = None
+        self.default_role = object()
+        self.me = FakeBotMember()
+        self.text = self._add(FakeTextChannel(self, 'umum', send_delay))
+        self.voice = FakeVoiceChannel(self)
+
+    def _add(self, channel):
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return None
+
+    async def create_category(self, name, *, overwrites=None):
+        # CategoryChannel asli supaya isinstance() di get_ticket_category tetap berlaku
+        data = {'id': next(_ids), 'name': name, 'position': 0, 'permission_overwrites': [], 'type': 4}
+        return self._add(discord.CategoryChannel(state=main.bot._connection, guild=self, data=data))
+
+    async def create_text_channel(self, name, *, category=None, overwrites=None):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        return self._add(FakeTextChannel(self, name, self.send_delay))
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeMember:
+    bot = False
+    display_avatar = FakeAvatar()
+
+    def __init__(self, guild: FakeGuild, user_id: int | None = None):
+        self.guild = guild
+        self.id = user_id or next(_ids)
+        self.name = f'user{self.id}'
+        self.mention = f'<@{self.id}>'
+        self.voice = FakeVoiceState(guild.voice)
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, reason=None):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, author: FakeMember):
+        self.author = author
+        self.guild = author.guild
+        self.channel = author.guild.text
+        self.content = 'halo semua'
+        self._state = main.bot._connection  # dipakai Context di process_commands
+
+
+class FakeResponse:
+    async def defer(self, **kwargs):
+        pass
+
+
+class FakeFollowup:
+    def __init__(self, send_delay: float):
+        self.send_delay = send_delay
+
+    async def send(self, **kwargs):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        return kwargs
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, channel):
+        self.id = next(_ids)
+        self.user = user
+        self.guild = user.guild
+        self.channel = channel
+        self.channel_id = channel.id
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(user.guild.send_delay)
+
+
+class FakeContext:
+    """Pengganti commands.Context untuk memanggil callback /play langsung."""
+
+    def __init__(self, author: FakeMember):
+        self.author = author
+        self.guild = author.guild
+        self.channel = author.guild.text
+        self.interaction = None
+        self.busy = False
+
+    async def send(self, content=None, **kwargs):
+        self.busy = self.busy or (content or '').startswith('⏳')
+        return await self.channel.send(content=content, **kwargs)
+
+    async def defer(self):
+        pass
+
+
+class FakeSource(discord.AudioSource):
+    def read(self) -> bytes:
+        return b''
+
+
+def stub_music(extract_seconds: float):
+    """Extractor tiruan (tetap lewat ExtractionExecutor asli) dan source audio tanpa FFmpeg."""
+    def fake_extract(url: str, download: bool, sanitize: bool) -> dict:
+        time.sleep(extract_seconds)
+        video_id = str(abs(hash(url)))
+        return {'id': video_id, 'title': f'Lagu {url}', 'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+                'duration': 180, 'url': f'https://example.invalid/{video_id}.webm'}
+
+    async def fake_audio_source(data: dict, location: str | None = None):
+        return FakeSource()
+
+    main._extract_info_worker = fake_extract
+    main.create_audio_source = fake_audio_source
+
+
+async def replay(count: int, rate: float, handler) -> tuple[list[float], float]:
+    """Jalankan handler(i) sebanyak count, dengan laju rate/detik (0 = semua sekaligus). Return (latency, durasi)."""
+    latencies: list[float] = []
+
+    async def one(i: int):
+        started = time.perf_counter()
+        await handler(i)
+        latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(count):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        print(f"  ⚠️ {len(errors)} event gagal, contoh: {errors[0]!r}")
+    return latencies, time.perf_counter() - started
+
+
+async def scenario_messages(args, guilds):
+    members = [FakeMember(guild) for guild in guilds for _ in range(args.users)]
+    messages = [FakeMessage(members[i % len(members)]) for i in range(args.count)]
+    latencies, elapsed = await replay(args.count, args.rate, lambda i: main.on_message(messages[i]))
+    await main.message_buffer.flush()
+    return args.count, latencies, elapsed
+
+
+async def scenario_joins(args, guilds):
+    for guild in guilds:
+        await main.settings_cache.set_welcome_channel_role(guild.id, guild.text.id, None)
+    joins = args.count // 10
+    members = [FakeMember(guilds[i % len(guilds)]) for i in range(joins)]
+    before = main.welcome_pipeline.processed
+
+    async def join(i: int):
+        members[i].guild.member_count += 1
+        await main.on_member_join(members[i])
+
+    started = time.perf_counter()
+    await replay(joins, args.rate, join)
+    # Latency dihitung sampai embed welcome terkirim, bukan hanya sampai handler kembali
+    while main.welcome_pipeline.processed - before < joins or main.send_scheduler.queue_depth():
+        await asyncio.sleep(0.01)
+    return joins, list(main.welcome_pipeline.latency['welcome'])[-joins:], time.perf_counter() - started
+
+
+async def scenario_tickets(args, guilds):
+    presses = args.count // 20
+    users = [FakeMember(guilds[i % len(guilds)]) for i in range(presses)]
+    view = main.TicketOptionsView()
+    latencies = []
+
+    async def create(i: int):
+        await view.create_ticket(FakeInteraction(users[i], users[i].guild.text), 'support')
+
+    create_latencies, create_elapsed = await replay(presses, args.rate, create)
+    latencies += create_latencies
+    channels = [main.ticket_index.open_channel(user.guild.id, user.id) for user in users]
+    opened = [(user, user.guild.get_channel(channel_id)) for user, channel_id in zip(users, channels) if channel_id]
+    if len(opened) != presses:
+        print(f"  ⚠️ hanya {len(opened)}/{presses} ticket terbuka")
+    close_view = main.CloseTicketView()
+
+    async def close(i: int):
+        user, channel = opened[i]
+        await close_view.close_ticket.callback(FakeInteraction(user, channel))
+
+    close_latencies, close_elapsed = await replay(len(opened), args.rate, close)
+    latencies += close_latencies
+    return presses + len(opened), latencies, create_elapsed + close_elapsed
+
+
+async def scenario_play(args, guilds):
+    stub_music(args.extract_ms / 1000)
+    plays = args.count // 20
+    users = [FakeMember(guilds[i % len(guilds)]) for i in range(plays)]
+    contexts = [FakeContext(user) for user in users]
+    latencies, elapsed = await replay(plays, args.rate, lambda i: main.play.callback(contexts[i], query=f'lagu {i}'))
+    for guild in guilds:
+        main.music_state.drop_prefetch(guild.id)
+    await main.music_state.journal.flush()
+    busy = sum(ctx.busy for ctx in contexts)
+    if busy:
+        # Admission control EXTRACT_*_QUEUE_MAX: ditolak cepat, ikut terhitung di latency
+        print(f"  ({busy}/{plays} /play dibalas 'sibuk' karena antrian extraction penuh)")
+    return plays, latencies, elapsed
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def run(args):
+    guilds = [FakeGuild(args.send_ms / 1000) for _ in range(args.guilds)]
+    print(f"Database: {main.database.path}")
+    print(f"{args.guilds} guild, rate {args.rate or 'burst'}/s, send {args.send_ms} ms, extract {args.extract_ms} ms\n")
+    print(f"{'skenario':<10} {'event':>7} {'event/s':>10} {'p50':>9} {'p99':>9} {'commit':>7}")
+    async with main.bot:
+        main.bot._connection.user = FakeBotUser()  # pengganti READY, dipakai process_commands
+        await main.bot.start_services()
+        for name in args.scenarios:
+            commits = main.database.commits
+            events, latencies, elapsed = await globals()[f'scenario_{name}'](args, guilds)
+            ordered = sorted(latencies)
+            print(f"{name:<10} {events:>7} {events / elapsed if elapsed else 0:>10.0f} "
+                  f"{percentile(ordered, 0.5) * 1000:>7.2f}ms {percentile(ordered, 0.99) * 1000:>7.2f}ms "
+                  f"{main.database.commits - commits:>7}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Replay trafik tiruan ke handler bot")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--count', type=int, default=10_000,
+                        help="Jumlah pesan; join = count/10, ticket & /play = count/20")
+    parser.add_argument('--rate', type=float, default=0, help="Event per detik (0 = burst, semua sekaligus)")
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200, help="User yang mengirim pesan per guild")
+    parser.add_argument('--send-ms', type=float, default=0, help="Latency tiruan untuk kirim pesan/buat channel")
+    parser.add_argument('--extract-ms', type=float, default=200, help="Durasi extractor tiruan per lagu")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,138 @@
+"""Benchmark RSS dan waktu sampai READY untuk tiap MEMORY_PROFILE.
+
+Tidak ada koneksi ke Discord: event gateway dari guild tiruan (GUILD_CREATE, chunk
+member, join, pesan) diumpankan langsung ke ConnectionState discord.py, dengan
+opsi cache dari profil yang diuji. Tiap profil dijalankan di proses terpisah supaya
+angka RSS tidak saling mempengaruhi.
+
+Pemakaian:
+    python benchmarks/member_cache.py --members 100000 --messages 5000
+
+Waktu READY di sini hanya biaya parsing di proses bot. Di Discord asli, profil `full`
+masih ditambah satu round trip per chunk (1000 member) sebelum guild dianggap siap.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT_ID = 1
+GUILD_ID = 10 ** 17
+CHANNEL_ID = GUILD_ID + 1
+CHUNK_SIZE = 1000  # member per GUILD_MEMBERS_CHUNK dari Discord
+VOICE_MEMBERS = 50
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def user_payload(user_id: int) -> dict:
+    return {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0',
+            'global_name': None, 'avatar': None}
+
+
+def member_payload(user_id: int) -> dict:
+    return {'user': user_payload(user_id), 'roles': [], 'nick': None, 'deaf': False, 'mute': False, 'flags': 0,
+            'joined_at': '2024-01-01T00:00:00+00:00'}
+
+
+def guild_payload(members: int) -> dict:
+    # Guild besar: GUILD_CREATE hanya membawa bot sendiri dan member yang ada di voice
+    voice_ids = [BOT_ID + 1 + i for i in range(VOICE_MEMBERS)]
+    return {
+        'id': str(GUILD_ID), 'name': 'Guild tiruan', 'owner_id': str(BOT_ID + 1), 'large': True,
+        'member_count': members, 'features': [], 'emojis': [], 'stickers': [],
+        'roles': [{'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                   'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [{'id': str(CHANNEL_ID), 'type': 0, 'name': 'umum', 'position': 0,
+                      'permission_overwrites': []}],
+        'members': [member_payload(BOT_ID)] + [member_payload(user_id) for user_id in voice_ids],
+        'voice_states': [{'user_id': str(user_id), 'channel_id': str(CHANNEL_ID + 1), 'session_id': 'x',
+                          'deaf': False, 'mute': False, 'self_deaf': False, 'self_mute': False,
+                          'self_video': False, 'suppress': False} for user_id in voice_ids],
+    }
+
+
+def message_payload(message_id: int, user_id: int) -> dict:
+    member = member_payload(user_id)
+    del member['user']
+    return {'id': str(message_id), 'channel_id': str(CHANNEL_ID), 'guild_id': str(GUILD_ID),
+            'author': user_payload(user_id), 'member': member, 'content': 'halo', 'type': 0,
+            'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None, 'tts': False,
+            'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+            'embeds': [], 'pinned': False}
+
+
+async def run_profile(args) -> dict:
+    import discord
+    from main import bot, MEMORY_PROFILE, MEMORY_PROFILES
+
+    options = MEMORY_PROFILES[MEMORY_PROFILE]
+    state = bot._connection
+    state.dispatch = lambda *a, **k: None  # handler bot tidak ikut diukur
+    state.user = discord.ClientUser(state=state, data=user_payload(BOT_ID))
+    base_rss = rss_mb()
+
+    started = time.perf_counter()
+    guild = state._add_guild_from_data(guild_payload(args.members))
+    chunk_requests = 0
+    if options['chunk_guilds_at_startup']:
+        # Setara ChunkRequest(cache=True) yang dijalankan discord.py sebelum guild dianggap siap
+        for start in range(0, args.members, CHUNK_SIZE):
+            chunk_requests += 1
+            for user_id in range(BOT_ID + 1 + start, BOT_ID + 1 + min(start + CHUNK_SIZE, args.members)):
+                guild._add_member(discord.Member(guild=guild, data=member_payload(user_id), state=state))
+    ready_seconds = time.perf_counter() - started
+
+    first_new = BOT_ID + 1 + args.members
+    for i in range(args.joins):
+        state.parse_guild_member_add({'guild_id': str(GUILD_ID), **member_payload(first_new + i)})
+    for i in range(args.messages):
+        state.parse_message_create(message_payload(10 ** 18 + i, BOT_ID + 1 + i % args.members))
+
+    return {
+        'profile': MEMORY_PROFILE,
+        'ready_seconds': ready_seconds,
+        'chunk_requests': chunk_requests,
+        'cached_members': len(guild._members),
+        'cached_messages': len(state._messages or ()),
+        'rss_mb': rss_mb() - base_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bandingkan MEMORY_PROFILE dengan guild tiruan")
+    parser.add_argument('--members', type=int, default=100_000, help="Jumlah member guild tiruan")
+    parser.add_argument('--joins', type=int, default=1000, help="Member yang join setelah READY")
+    parser.add_argument('--messages', type=int, default=5000, help="Pesan yang diterima setelah READY")
+    parser.add_argument('--profiles', nargs='+', default=['full', 'balanced', 'minimal'])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_profile(args))))
+        return
+
+    print(f"Guild tiruan: {args.members} member, {args.joins} join, {args.messages} pesan\n")
+    print(f"{'profil':<10} {'READY':>9} {'chunk':>7} {'member':>9} {'pesan':>7} {'RSS':>9}")
+    for profile in args.profiles:
+        env = {**os.environ, 'MEMORY_PROFILE': profile,
+               'BOT_DB_PATH': os.path.join(tempfile.gettempdir(), 'member_cache_bench.db')}
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--members', str(args.members),
+                                 '--joins', str(args.joins), '--messages', str(args.messages)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:<10} {result['ready_seconds']:>8.2f}s {result['chunk_requests']:>7} "
+              f"{result['cached_members']:>9} {result['cached_messages']:>7} {result['rss_mb']:>7.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Overhead instrumentasi metrics di hot path on_message.
+
+Menjalankan handler on_message asli dengan pesan tiruan (tanpa koneksi Discord), sekali
+lewat wrapper @instrumented dan sekali langsung ke fungsi aslinya, lalu membandingkan
+waktu per pesan. Juga mengukur Histogram.observe() sendirian.
+
+Pemakaian:
+    python benchmarks/metrics_overhead.py --messages 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('BOT_DB_PATH', os.path.join(tempfile.gettempdir(), 'metrics_overhead_bench.db'))
+
+import main  # noqa: E402
+
+
+async def per_call_ns(handler, messages: list, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        for message in messages:
+            await handler(message)
+        best = min(best, (time.perf_counter_ns() - started) / len(messages))
+    return best
+
+
+async def run(args):
+    gateway = main.FakeGateway(1, 0)
+    main.bot._connection.user = gateway.Member(None, 1)
+    guild = gateway.guilds[0]
+    # User sedikit supaya buffer tidak pernah flush ke database selama benchmark
+    messages = [gateway.Message(gateway.Member(guild, 2 + i % 50)) for i in range(args.messages)]
+
+    bare = await per_call_ns(main.on_message.__wrapped__, messages, args.rounds)
+    instrumented = await per_call_ns(main.on_message, messages, args.rounds)
+
+    histogram = main.Histogram()
+    started = time.perf_counter_ns()
+    for i in range(args.messages):
+        histogram.observe(i * 1e-7)
+    observe = (time.perf_counter_ns() - started) / args.messages
+
+    print(f"on_message tanpa metrics : {bare:8.0f} ns/pesan")
+    print(f"on_message dengan metrics: {instrumented:8.0f} ns/pesan")
+    print(f"overhead                 : {instrumented - bare:8.0f} ns/pesan ({(instrumented - bare) / bare * 100:.1f}%)")
+    print(f"Histogram.observe()      : {observe:8.0f} ns")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Ukur overhead metrics di on_message")
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--rounds', type=int, default=3, help="Diambil hasil terbaik dari beberapa putaran")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main_()
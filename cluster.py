@@ -0,0 +1,155 @@
+"""Jalankan bot dalam beberapa proses (cluster), masing-masing memegang rentang shard.
+
+Satu proses tambahan menjadi write service: pemilik tunggal writer SQLite. Proses cluster
+membaca database langsung (WAL) dan mengirim semua tulisan ke write service.
+
+Contoh:
+    python cluster.py --clusters 2 --shards 8
+    python cluster.py --clusters 2 --shards 4 --fake-gateway --guilds 40 --events 2000
+
+Dengan --fake-gateway tidak ada koneksi ke Discord: tiap cluster membangkitkan event tiruan
+untuk guild di shard-nya, lalu hasilnya dicocokkan dengan counter di database.
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def shard_ranges(shards: int, clusters: int) -> list[list[int]]:
+    """Bagi shard 0..shards-1 menjadi rentang berurutan, satu per cluster."""
+    per_cluster, extra = divmod(shards, clusters)
+    ranges, start = [], 0
+    for cluster_id in range(clusters):
+        size = per_cluster + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def metrics_env(cluster_id: int) -> dict:
+    """METRICS_ADDRESS per proses: write service di port dasar, cluster N di port dasar + 1 + N."""
+    address = os.getenv('METRICS_ADDRESS')
+    if not address:
+        return {}
+    host, _, port = address.rpartition(':')
+    return {'METRICS_ADDRESS': f"{host}:{int(port) + 1 + cluster_id}"}
+
+
+def wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Write service berhenti dengan kode {process.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("Write service tidak siap")
+
+
+def verify(db_path: str, results: list[dict]) -> bool:
+    """Cocokkan hasil gateway tiruan dengan guild_counters."""
+    conn = sqlite3.connect(db_path)
+    ok = True
+    for result in results:
+        for guild_id, expected in result['guilds'].items():
+            row = conn.execute('SELECT members, messages FROM guild_counters WHERE guild_id = ?', (int(guild_id),)).fetchone()
+            actual = {'members': row[0], 'messages': row[1]} if row else {'members': 0, 'messages': 0}
+            if actual != expected:
+                ok = False
+                print(f"  ❌ guild {guild_id}: diharapkan {expected}, di database {actual}")
+    clusters, guilds = conn.execute('SELECT COUNT(*), COALESCE(SUM(guilds), 0) FROM cluster_status').fetchone()
+    conn.close()
+    print(f"  cluster_status: {clusters} cluster, {guilds} guild")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jalankan bot dalam mode cluster")
+    parser.add_argument('--clusters', type=int, default=2, help="Jumlah proses bot")
+    parser.add_argument('--shards', type=int, default=None, help="Total shard (default: sama dengan jumlah cluster)")
+    parser.add_argument('--write-address', default='127.0.0.1:8765', help="host:port write service")
+    parser.add_argument('--db', default=None, help="File database (default: BOT_DB_PATH, atau file sementara untuk --fake-gateway)")
+    parser.add_argument('--fake-gateway', action='store_true', help="Pakai gateway tiruan, tanpa koneksi Discord")
+    parser.add_argument('--guilds', type=int, default=40, help="Jumlah guild tiruan (--fake-gateway)")
+    parser.add_argument('--events', type=int, default=2000, help="Event per cluster (--fake-gateway)")
+    args = parser.parse_args()
+
+    shards = args.shards or args.clusters
+    if shards < args.clusters:
+        parser.error("--shards harus >= --clusters")
+    db_path = args.db or (os.path.join(tempfile.mkdtemp(), 'cluster_test.db') if args.fake_gateway
+                          else os.getenv('BOT_DB_PATH', 'bot_data.db'))
+    host, _, port = args.write_address.rpartition(':')
+
+    base_env = {**os.environ, 'BOT_DB_PATH': db_path, 'DB_WRITE_SERVICE': args.write_address,
+                'PYTHONUNBUFFERED': '1'}
+    service = subprocess.Popen([sys.executable, MAIN], env={**base_env, 'BOT_ROLE': 'write-service',
+                                                            **metrics_env(-1)})
+    workers: list[subprocess.Popen] = []
+    try:
+        wait_for_port(host or '127.0.0.1', int(port), service)
+        audio_cache_dir = os.getenv('AUDIO_CACHE_DIR', 'audio_cache')
+        for cluster_id, shard_ids in enumerate(shard_ranges(shards, args.clusters)):
+            env = {
+                **base_env,
+                'SHARD_COUNT': str(shards),
+                'SHARD_IDS': ','.join(map(str, shard_ids)),
+                'CLUSTER_ID': str(cluster_id),
+                'CLUSTER_COUNT': str(args.clusters),
+                # Cache audio per cluster: eviction satu proses tidak menghapus file yang dipakai proses lain
+                'AUDIO_CACHE_DIR': os.path.join(audio_cache_dir, f'cluster-{cluster_id}'),
+                **metrics_env(cluster_id),
+            }
+            if args.fake_gateway:
+                env.update(FAKE_GATEWAY_GUILDS=str(args.guilds), FAKE_GATEWAY_EVENTS=str(args.events))
+            print(f"Cluster {cluster_id}: shard {shard_ids}")
+            workers.append(subprocess.Popen([sys.executable, MAIN], env=env,
+                                            stdout=subprocess.PIPE if args.fake_gateway else None, text=True))
+
+        if not args.fake_gateway:
+            # Berhenti jika salah satu cluster mati; supervisor (systemd/docker) yang me-restart
+            while all(worker.poll() is None for worker in workers):
+                time.sleep(1)
+            return 1
+
+        results = []
+        for worker in workers:
+            output, _ = worker.communicate()
+            for line in output.splitlines():
+                if line.startswith('FAKE_GATEWAY_RESULT '):
+                    results.append(json.loads(line.split(' ', 1)[1]))
+                else:
+                    print(line)
+        if len(results) != len(workers):
+            print("❌ Tidak semua cluster selesai")
+            return 1
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+        for worker in workers:
+            worker.wait()
+        service.terminate()
+        service.wait()
+
+    for result in results:
+        print(f"Cluster {result['cluster']}: {len(result['guilds'])} guild dalam {result['seconds']:.2f} detik")
+    ok = verify(db_path, results)
+    print("✅ Counter cocok dengan event yang dikirim" if ok else "❌ Counter tidak cocok")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,444 @@
+import time
+STARTUP_T0 = time.perf_counter()  # awal breakdown cold start (lihat StartupTimer)
 import discord
 from discord.ext import commands
 from discord import app_commands
+import aiohttp
 import aiosqlite
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import asyncio
-import yt_dlp
+import bisect
+import concurrent.futures
+import contextlib
+import functools
+import gzip
+import heapq
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import shutil
+import signal
+import sqlite3
+import hashlib
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+# yt_dlp di-import saat pertama dibutuhkan (load_yt_dlp), bukan saat start
 
 # =====================
 # Load environment variables
 # =====================
 load_dotenv()
 
+# =====================
+# Settings (bisa di-override lewat .env)
+# =====================
+DB_PATH = os.getenv('BOT_DB_PATH', 'bot_data.db')
+DB_READERS = int(os.getenv('DB_READERS', '4'))  # jumlah koneksi reader di pool
+MEMORY_PROFILE = os.getenv('MEMORY_PROFILE', 'full')  # 'full', 'balanced' atau 'minimal' (lihat MEMORY_PROFILES)
+# Mode cluster (lihat cluster.py): tiap proses memegang sebagian shard, tulisan database lewat satu write service
+BOT_ROLE = os.getenv('BOT_ROLE', 'bot')  # 'bot' atau 'write-service'
+AUTO_SHARD = os.getenv('AUTO_SHARD', '0') == '1' or bool(os.getenv('SHARD_COUNT'))  # pakai AutoShardedBot
+SHARD_COUNT = int(os.getenv('SHARD_COUNT')) if os.getenv('SHARD_COUNT') else None  # kosong = jumlah dari Discord
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS').split(',')] if os.getenv('SHARD_IDS') else None  # shard milik proses ini
+CLUSTER_ID = int(os.getenv('CLUSTER_ID', '0'))
+CLUSTER_COUNT = int(os.getenv('CLUSTER_COUNT', '1'))
+CLUSTER_HEARTBEAT_INTERVAL = float(os.getenv('CLUSTER_HEARTBEAT_INTERVAL', '30'))  # detik antar laporan status cluster
+METRICS_ADDRESS = os.getenv('METRICS_ADDRESS')  # host:port endpoint Prometheus (mis. 127.0.0.1:9464); kosong = mati
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))  # detik antar sampel lag event loop; 0 = mati
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'  # sync slash command walau hash tidak berubah
+DB_WRITE_SERVICE = os.getenv('DB_WRITE_SERVICE')  # host:port write service; kosong = proses ini menulis sendiri
+FAKE_GATEWAY_GUILDS = int(os.getenv('FAKE_GATEWAY_GUILDS', '0'))  # >0: jalankan gateway tiruan, tanpa koneksi Discord
+FAKE_GATEWAY_EVENTS = int(os.getenv('FAKE_GATEWAY_EVENTS', '1000'))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_FLUSH_INTERVAL', '5'))  # detik antar flush counter pesan
+MESSAGE_BUFFER_MAX = int(os.getenv('MESSAGE_BUFFER_MAX', '500'))  # jumlah user unik sebelum flush dipaksa
+SEND_CHANNEL_BURST = int(os.getenv('SEND_CHANNEL_BURST', '5'))  # pesan per channel per window (bucket Discord: 5 / 5 detik)
+SEND_CHANNEL_WINDOW = float(os.getenv('SEND_CHANNEL_WINDOW', '5'))  # detik
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '60'))  # detik maksimum angka /stats disimpan di memori
+COUNTER_RECONCILE_INTERVAL = float(os.getenv('COUNTER_RECONCILE_INTERVAL', '21600'))  # detik antar pengecekan ulang counter /stats
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))  # jumlah user di /leaderboard
+LEADERBOARD_TTL = float(os.getenv('LEADERBOARD_TTL', '60'))  # detik hasil /leaderboard & /activity disimpan di memori
+ACTIVITY_DAILY_RETENTION = int(os.getenv('ACTIVITY_DAILY_RETENTION', '90'))  # hari rollup harian disimpan
+WELCOME_BATCH_INTERVAL = float(os.getenv('WELCOME_BATCH_INTERVAL', '1'))  # detik menunggu join lain sebelum batch diproses
+WELCOME_COALESCE_THRESHOLD = int(os.getenv('WELCOME_COALESCE_THRESHOLD', '5'))  # join per batch sebelum welcome digabung
+WELCOME_MENTION_MAX = int(os.getenv('WELCOME_MENTION_MAX', '20'))  # mention maksimum di welcome gabungan
+ROLE_ASSIGN_RATE = float(os.getenv('ROLE_ASSIGN_RATE', '5'))  # pemberian role per detik
+YTDL_CACHE_SIZE = int(os.getenv('YTDL_CACHE_SIZE', '1000'))  # jumlah video di cache metadata
+YTDL_CACHE_TTL = float(os.getenv('YTDL_CACHE_TTL', '21600'))  # detik; URL stream tetap mengikuti expire dari googlevideo
+YTDL_CACHE_PERSIST = os.getenv('YTDL_CACHE_PERSIST', '0') == '1'  # simpan cache ke SQLite supaya tahan restart
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '4'))  # worker khusus yt_dlp
+EXTRACT_MODE = os.getenv('EXTRACT_MODE', 'thread')  # 'thread' atau 'process' (hindari GIL saat parsing berat)
+EXTRACT_PER_GUILD = int(os.getenv('EXTRACT_PER_GUILD', '2'))  # extract paralel maksimum per guild
+EXTRACT_GUILD_QUEUE_MAX = int(os.getenv('EXTRACT_GUILD_QUEUE_MAX', '5'))  # permintaan mengantri maksimum per guild
+EXTRACT_QUEUE_MAX = int(os.getenv('EXTRACT_QUEUE_MAX', '32'))  # permintaan mengantri maksimum total
+AUDIO_MODE = os.getenv('AUDIO_MODE', 'opus')  # 'opus' (encode/copy di FFmpeg) atau 'pcm' (fallback lama)
+MUSIC_VOLUME = float(os.getenv('MUSIC_VOLUME', '0.5'))  # 1.0 = tanpa volume filter, source Opus di-copy langsung
+OPUS_BITRATE = int(os.getenv('OPUS_BITRATE', '128'))  # kbps saat FFmpeg harus encode ke Opus
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', 'audio_cache')
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', '2048'))  # 0 = cache audio dimatikan
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', '3'))  # diputar sebanyak ini baru di-download
+TRANSCRIPT_DIR = os.getenv('TRANSCRIPT_DIR', 'transcripts')  # arsip isi ticket sebelum channel dihapus
+TRANSCRIPT_ATTACHMENTS = os.getenv('TRANSCRIPT_ATTACHMENTS', '1') == '1'  # download lampiran ke arsip (di background)
+TRANSCRIPT_DOWNLOAD_CONCURRENCY = int(os.getenv('TRANSCRIPT_DOWNLOAD_CONCURRENCY', '4'))  # download lampiran paralel
+TRANSCRIPT_ATTACHMENT_MAX_MB = int(os.getenv('TRANSCRIPT_ATTACHMENT_MAX_MB', '25'))  # lampiran lebih besar hanya dicatat URL-nya
+AUTOMOD_MAX_USERS = int(os.getenv('AUTOMOD_MAX_USERS', '50000'))  # state anti-spam (guild, user) maksimum di memori
+AUTOMOD_IDLE_TTL = float(os.getenv('AUTOMOD_IDLE_TTL', '300'))  # detik tanpa pesan sebelum state user dibuang
+AUTOMOD_COOLDOWN = float(os.getenv('AUTOMOD_COOLDOWN', '60'))  # detik; user yang sama tidak ditindak dua kali dalam rentang ini
+BULK_MODERATION_CONCURRENCY = int(os.getenv('BULK_MODERATION_CONCURRENCY', '4'))  # request ban/kick paralel saat mass action
+BULK_MODERATION_MAX = int(os.getenv('BULK_MODERATION_MAX', '1000'))  # target maksimum per mass ban/kick/purge
+MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', '500'))  # lagu maksimum di queue per guild
+PLAYLIST_PAGE_SIZE = int(os.getenv('PLAYLIST_PAGE_SIZE', '50'))  # entry playlist per halaman extraction
+PREFETCH_LEAD = float(os.getenv('PREFETCH_LEAD', '20'))  # detik sebelum lagu selesai untuk menyiapkan lagu berikutnya
+
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+# Profil memori: cache member, chunking saat startup, dan cache pesan.
+# Di guild 100k+ member, cache member penuh + chunking mendominasi RSS dan waktu sampai READY.
+# Bot tidak butuh daftar member lengkap: event join membawa objek member-nya sendiri,
+# member di slash command dikirim Discord bersama interaction, dan converter prefix
+# command melakukan query ke Discord jika member tidak ada di cache.
+MEMORY_PROFILES = {
+    # Semua member di-chunk dan di-cache (perilaku lama)
+    'full': {'member_cache_flags': discord.MemberCacheFlags.from_intents(intents),
+             'chunk_guilds_at_startup': True, 'max_messages': 1000},
+    # Tanpa chunking: hanya member yang join atau ada di voice selama bot online
+    'balanced': {'member_cache_flags': discord.MemberCacheFlags.from_intents(intents),
+                 'chunk_guilds_at_startup': False, 'max_messages': 200},
+    # Hanya member di voice channel (dipakai music player), tanpa cache pesan
+    'minimal': {'member_cache_flags': discord.MemberCacheFlags(voice=True, joined=False),
+                'chunk_guilds_at_startup': False, 'max_messages': None},
+}
+if MEMORY_PROFILE not in MEMORY_PROFILES:
+    raise ValueError(f"MEMORY_PROFILE tidak dikenal: {MEMORY_PROFILE} (pilih {', '.join(MEMORY_PROFILES)})")
+if SHARD_IDS is not None:
+    # owns_guild menghitung shard sebuah guild dari SHARD_COUNT; tanpa itu pembagian guild antar cluster tidak bisa dihitung
+    if SHARD_COUNT is None:
+        raise ValueError("SHARD_IDS diisi tanpa SHARD_COUNT. Isi SHARD_COUNT dengan jumlah shard total semua cluster")
+    if any(not 0 <= shard_id < SHARD_COUNT for shard_id in SHARD_IDS):
+        raise ValueError(f"SHARD_IDS {SHARD_IDS} harus di antara 0 dan SHARD_COUNT - 1 ({SHARD_COUNT - 1})")
+
+class StartupTimer:
+    """Durasi tiap tahap cold start, dicetak sekali saat READY pertama."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.stages: list[tuple[str, float]] = []
+        self._last = started
+        self.reported = False
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        total = time.perf_counter() - self.started
+        breakdown = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.stages)
+        print(f"Startup {total:.2f}s: {breakdown}")
+
+startup = StartupTimer(STARTUP_T0)
+
+# =====================
+# Metrics: histogram latency, counter error, lag event loop (endpoint Prometheus + /perf)
+# =====================
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Histogram bucket tetap (detik). observe() hanya bisect + dua penjumlahan, aman untuk hot path."""
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # slot terakhir = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Perkiraan quantile: batas atas bucket tempat quantile jatuh (max untuk bucket +Inf)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    """Registry metrics proses ini. Label cukup satu (command/event/query) supaya murah dan mudah dibaca."""
+
+    def __init__(self):
+        self.histograms: dict[str, dict[str, Histogram]] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        self.last_errors: dict[str, str] = {}
+        self.collectors: dict = {}  # nama komponen -> fungsi stats()
+        self.started = time.time()
+
+    def histogram(self, family: str, label: str) -> Histogram:
+        histograms = self.histograms.setdefault(family, {})
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = Histogram()
+        return histogram
+
+    def observe(self, family: str, label: str, seconds: float):
+        self.histogram(family, label).observe(seconds)
+
+    def inc(self, family: str, label: str, amount: int = 1):
+        counters = self.counters.setdefault(family, {})
+        counters[label] = counters.get(label, 0) + amount
+
+    def error(self, where: str, error: BaseException):
+        """Hitung error yang ditangkap (dan tidak di-raise ulang) supaya tetap terlihat di /perf."""
+        self.inc('errors_total', where)
+        self.last_errors[where] = f"{type(error).__name__}: {error}"[:200]
+
+    def add_collector(self, name: str, collect):
+        """collect() -> dict angka; diekspor sebagai gauge bot_<name>_<key>."""
+        self.collectors[name] = collect
+
+    def render(self) -> str:
+        """Format teks Prometheus (exposition format 0.0.4)."""
+        lines = [f'bot_uptime_seconds {time.time() - self.started:.0f}']
+        for family, histograms in sorted(self.histograms.items()):
+            name = f'bot_{family}'
+            lines.append(f'# TYPE {name} histogram')
+            for label, histogram in sorted(histograms.items()):
+                label_value = _prom_label(label)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{name="{label_value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{name="{label_value}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{name="{label_value}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{name="{label_value}"}} {histogram.count}')
+        for family, counters in sorted(self.counters.items()):
+            name = f'bot_{family}'
+            lines.append(f'# TYPE {name} counter')
+            for label, value in sorted(counters.items()):
+                lines.append(f'{name}{{name="{_prom_label(label)}"}} {value}')
+        for component, collect in self.collectors.items():
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Error collector metrics {component}: {e}")
+                continue
+            for key, value in _flatten(values):
+                lines.append(f'bot_{component}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _flatten(values: dict, prefix: str = ''):
+    """(key, angka) dari dict stats, dict bersarang digabung dengan '_'."""
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}_')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+def _prom_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+metrics = Metrics()
+
+def instrumented(family: str, label: str | None = None):
+    """Decorator coroutine: catat durasi ke histogram `family` dan hitung exception yang lolos."""
+    def decorator(func):
+        name = label or func.__name__
+        histogram = metrics.histogram(family, name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                metrics.inc(f'{family.removesuffix("_seconds")}_errors_total', name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+class LoopLagMonitor:
+    """Ukur keterlambatan event loop: sleep(interval) yang bangun terlambat = loop sedang diblokir."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            metrics.observe('loop_lag_seconds', 'main', lag)
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {'last_ms': self.last * 1000, 'max_ms': self.max * 1000}
+
+loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL)
+metrics.add_collector('loop_lag', loop_lag.stats)
+
+class MetricsServer:
+    """Endpoint HTTP minimal: GET /metrics -> teks Prometheus. Sengaja tanpa dependensi tambahan."""
+
+    def __init__(self, address: str | None):
+        self.address = address
+        self._server: asyncio.AbstractServer | None = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass  # abaikan header
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in ('/', '/metrics'):
+                status, body = '200 OK', metrics.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        if not self.address or self._server is not None:
+            return
+        host, port = _split_address(self.address)
+        self._server = await asyncio.start_server(self._handle, host, port)
+        print(f"Metrics Prometheus di http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+metrics_server = MetricsServer(METRICS_ADDRESS)
+
+def owns_guild(guild_id: int | None) -> bool:
+    """True jika guild ini dilayani proses ini (selalu True di luar mode cluster)."""
+    if SHARD_IDS is None or guild_id is None:
+        return True
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+class MultiFunctionBot(commands.AutoShardedBot if AUTO_SHARD else commands.Bot):
+    guild_backfill_done = False
+
+    async def setup_hook(self):
+        startup.mark('login')
+        await self.start_services()
+        # Persistent view cukup didaftarkan sekali, bukan di setiap READY/reconnect
+        self.add_view(TicketOptionsView())
+        self.add_view(CloseTicketView())
+        if CLUSTER_ID == 0:
+            # Command global: cukup satu cluster yang sync
+            await sync_commands_if_changed()
+        startup.mark('command_sync')
+
+    async def close(self):
+        await self.stop_services()
+        await super().close()
+
+    async def start_services(self):
+        loop_lag.start()
+        await metrics_server.start()
+        await database.open()
+        startup.mark('database')
+        await settings_cache.load_all()
+        await ticket_index.load()
+        startup.mark('settings_tickets')
+        await metadata_cache.load()
+        await music_state.load()
+        audio_cache.scan()
+        startup.mark('music_state')
+        music_state.journal.start()
+        message_buffer.start()
+        welcome_pipeline.start()
+        transcripts.start()
+        cluster_heartbeat.start()
+        if CLUSTER_ID == 0:
+            # Job yang mencakup semua guild cukup jalan di satu cluster
+            counter_reconciler.start()
+            activity_rollups.start()
+
+    async def stop_services(self):
+        music_state.shutting_down = True
+        await music_state.journal.close()
+        await welcome_pipeline.close()
+        await automod.close()
+        await transcripts.close()
+        await send_scheduler.close()
+        await counter_reconciler.close()
+        await activity_rollups.close()
+        await cluster_heartbeat.close()
+        # Jangan sampai increment yang belum ditulis hilang saat shutdown
+        await message_buffer.close()
+        await database.close()
+        extraction.shutdown()
+        audio_cache.shutdown()
+        await metrics_server.close()
+        await loop_lag.close()
+
+    async def on_command_error(self, context: commands.Context, exception: commands.CommandError):
+        metrics.inc('command_errors_total', context.command.qualified_name if context.command else 'unknown')
+        await super().on_command_error(context, exception)
+
+bot_options = {'command_prefix': '!', 'intents': intents, 'help_command': None, **MEMORY_PROFILES[MEMORY_PROFILE]}
+if AUTO_SHARD:
+    bot_options.update(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+bot = MultiFunctionBot(**bot_options)
+
+@bot.before_invoke
+async def _start_command_timer(ctx: commands.Context):
+    ctx.perf_started = time.perf_counter()
+
+@bot.after_invoke
+async def _record_command_latency(ctx: commands.Context):
+    # Prefix maupun slash (hybrid) lewat sini; dicatat sekali per pemanggilan
+    started = getattr(ctx, 'perf_started', None)
+    if started is not None and ctx.command is not None:
+        metrics.observe('command_seconds', ctx.command.qualified_name, time.perf_counter() - started)
+        ctx.perf_started = None
 
 # =====================
 # Helpers (ephemeral for hybrid)
@@ -37,65 +457,1770 @@ async def send_ephemeral(ctx: commands.Context, content: str = None, *, embed: d
         await ctx.send(content=content, embed=embed)
 
 # =====================
-# Database setup - DIPERBAIKI
+# Outbound message scheduler (antrian per channel)
 # =====================
-async def init_db():
-    async with aiosqlite.connect('bot_data.db') as db:
-        # Members table
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS members (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                joined_at TEXT,
-                messages_sent INTEGER DEFAULT 0
-            )
-        ''')
+PRIORITY_FOLLOWUP = 0  # follow-up interaction: user sedang menunggu
+PRIORITY_NORMAL = 1    # pesan ticket, welcome
+PRIORITY_ANNOUNCE = 2  # Now Playing dan pengumuman lain yang boleh telat/dibuang
+ANNOUNCE_MAX_AGE = 30.0  # detik; pengumuman yang lebih tua dari ini tidak dikirim lagi
 
-        # Tickets table
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS tickets (
-                ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                channel_id INTEGER,
-                created_at TEXT,
-                status TEXT DEFAULT 'open',
-                category TEXT
-            )
-        ''')
+class OutboundMessage:
+    __slots__ = ('target', 'channel_id', 'priority', 'key', 'merge', 'max_age', 'kwargs', 'created', 'future', 'superseded')
 
-        # Welcome settings table
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS welcome_settings (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER,
-                message TEXT,
-                role_id INTEGER
-            )
-        ''')
+    def __init__(self, target, channel_id: int, priority: int, key: str | None, merge: bool, max_age: float | None, kwargs: dict):
+        self.target = target
+        self.channel_id = channel_id
+        self.priority = priority
+        self.key = key
+        self.merge = merge
+        self.max_age = max_age
+        self.kwargs = kwargs
+        self.created = time.monotonic()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Exception tetap diambil walau pemanggil tidak meng-await (fire-and-forget)
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.superseded = False
+
+class SendScheduler:
+    """Semua kirim pesan non-interaktif lewat sini: antrian per channel, prioritas, dan pesan usang dibuang.
+
+    Pemanggil tidak ikut tertahan di balik retry 429 discord.py; cukup ``submit`` lalu
+    (opsional) ``await`` future-nya untuk mendapat ``discord.Message`` atau exception.
+    """
+
+    EMBEDS_PER_MESSAGE = 10  # batas Discord
+
+    def __init__(self, burst: int, window: float):
+        self.burst = burst
+        self.window = window
+        self.queues: dict[int, list] = {}                # channel_id -> heap (priority, seq, OutboundMessage)
+        self.workers: dict[int, asyncio.Task] = {}
+        self.latest: dict[tuple[int, str], OutboundMessage] = {}  # (channel_id, key) -> pesan terbaru
+        self.recent: dict[int, deque] = {}                # channel_id -> waktu kirim terakhir
+        self._seq = itertools.count()
+        self.sent = 0
+        self.dropped = 0
+        self.merged = 0
+        self.failed = 0
+
+    def submit(self, target, *, channel_id: int, priority: int = PRIORITY_NORMAL, key: str | None = None,
+               merge: bool = False, max_age: float | None = None, **kwargs) -> asyncio.Future:
+        """``key``: pesan baru dengan key sama menggantikan yang masih mengantri. ``merge``: embed boleh digabung."""
+        item = OutboundMessage(target, channel_id, priority, key, merge, max_age, kwargs)
+        if key is not None:
+            previous = self.latest.get((channel_id, key))
+            if previous is not None and not previous.future.done():
+                previous.superseded = True
+                previous.future.set_result(None)
+                self.dropped += 1
+            self.latest[(channel_id, key)] = item
+        heapq.heappush(self.queues.setdefault(channel_id, []), (priority, next(self._seq), item))
+        worker = self.workers.get(channel_id)
+        if worker is None or worker.done():
+            self.workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+        return item.future
+
+    def _take_mergeable(self, queue: list, first: OutboundMessage) -> list[OutboundMessage]:
+        embeds = len(first.kwargs['embeds'])
+        taken, kept = [], []
+        for entry in sorted(queue):
+            item = entry[2]
+            if (item.merge and not item.superseded and item.target is first.target and item.priority == first.priority
+                    and embeds + len(item.kwargs['embeds']) <= self.EMBEDS_PER_MESSAGE):
+                embeds += len(item.kwargs['embeds'])
+                taken.append(item)
+            else:
+                kept.append(entry)
+        if taken:
+            queue[:] = kept
+            heapq.heapify(queue)
+        return taken
+
+    async def _pace(self, channel_id: int):
+        recent = self.recent.setdefault(channel_id, deque(maxlen=self.burst))
+        if len(recent) == self.burst:
+            wait = recent[0] + self.window - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        recent.append(time.monotonic())
+
+    async def _drain(self, channel_id: int):
+        queue = self.queues[channel_id]
+        while queue:
+            _, _, item = heapq.heappop(queue)
+            if item.superseded:
+                continue
+            if item.max_age is not None and time.monotonic() - item.created > item.max_age:
+                self.dropped += 1
+                item.future.set_result(None)
+                continue
+            group = [item]
+            if item.merge:
+                group += self._take_mergeable(queue, item)
+            kwargs = item.kwargs
+            if len(group) > 1:
+                kwargs = {**kwargs, 'embeds': [embed for member in group for embed in member.kwargs['embeds']]}
+                self.merged += len(group) - 1
+            await self._pace(channel_id)
+            try:
+                message = await item.target.send(**kwargs)
+            except Exception as e:
+                self.failed += 1
+                for member in group:
+                    if not member.future.done():
+                        member.future.set_exception(e)
+                continue
+            self.sent += 1
+            for member in group:
+                if not member.future.done():
+                    member.future.set_result(message)
+            if item.key is not None and self.latest.get((channel_id, item.key)) is item:
+                del self.latest[(channel_id, item.key)]
+        self.queues.pop(channel_id, None)
+        self.workers.pop(channel_id, None)
+        # Riwayat kirim hanya relevan selama satu window; tanpa ini tiap key (termasuk id interaction
+        # untuk follow-up dan channel ticket yang sudah dihapus) tertinggal selamanya di self.recent
+        asyncio.get_running_loop().call_later(self.window, self._forget, channel_id)
+
+    def _forget(self, channel_id: int):
+        recent = self.recent.get(channel_id)
+        if channel_id in self.workers or recent is None:
+            return
+        if not recent or time.monotonic() - recent[-1] >= self.window:
+            del self.recent[channel_id]
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def close(self, timeout: float = 5.0):
+        """Beri waktu antrian terkirim sebelum koneksi ditutup, sisanya dibatalkan."""
+        workers = [task for task in self.workers.values() if not task.done()]
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"{self.queue_depth()} pesan keluar dibatalkan karena shutdown")
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth(),
+            'channels': len(self.queues),
+            'paced_channels': len(self.recent),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'failed': self.failed,
+        }
+
+send_scheduler = SendScheduler(SEND_CHANNEL_BURST, SEND_CHANNEL_WINDOW)
+metrics.add_collector('send_scheduler', send_scheduler.stats)
+
+# =====================
+# Database setup: migrasi schema berversi (PRAGMA user_version)
+# =====================
+async def _migration_baseline(db: aiosqlite.Connection):
+    """Schema sebelum ada versi. Semua IF NOT EXISTS supaya database lama ikut lewat."""
+    # Members table
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS members (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            joined_at TEXT,
+            messages_sent INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Tickets table
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            channel_id INTEGER,
+            created_at TEXT,
+            status TEXT DEFAULT 'open',
+            category TEXT
+        )
+    ''')
+
+    # Welcome settings table
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS welcome_settings (
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            message TEXT,
+            role_id INTEGER
+        )
+    ''')
+
+    # Ticket settings table - DIPERBAIKI dengan ALTER TABLE
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ticket_settings (
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            category_id INTEGER
+        )
+    ''')
+
+    # Cache metadata yt_dlp (dipakai jika YTDL_CACHE_PERSIST=1)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ytdl_queries (
+            query TEXT PRIMARY KEY,
+            video_id TEXT,
+            expires_at REAL
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ytdl_metadata (
+            video_id TEXT PRIMARY KEY,
+            info TEXT,
+            expires_at REAL,
+            stream_expires_at REAL
+        )
+    ''')
+
+    # Queue musik yang tahan restart
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS music_queue (
+            entry_id INTEGER PRIMARY KEY,
+            guild_id INTEGER,
+            position REAL,
+            query TEXT,
+            title TEXT,
+            webpage_url TEXT,
+            duration INTEGER,
+            requester INTEGER
+        )
+    ''')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_music_queue_guild ON music_queue (guild_id, position)')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS music_sessions (
+            guild_id INTEGER PRIMARY KEY,
+            voice_channel_id INTEGER,
+            text_channel_id INTEGER,
+            current TEXT
+        )
+    ''')
+
+    # Cek jika kolom category_id belum ada di tabel lama
+    try:
+        await db.execute('SELECT category_id FROM ticket_settings LIMIT 1')
+    except aiosqlite.OperationalError:
+        # Jika kolom tidak ada, alter table
+        await db.execute('ALTER TABLE ticket_settings ADD COLUMN category_id INTEGER')
+        print("Added category_id column to ticket_settings table")
+
+async def _migration_guild_scope(db: aiosqlite.Connection):
+    """members & tickets per guild. Row lama diberi guild_id 0 / NULL, diisi backfill_guild_ids setelah ready."""
+    async with db.execute('PRAGMA table_info(tickets)') as cursor:
+        ticket_columns = {row[1] for row in await cursor.fetchall()}
+    if 'guild_id' not in ticket_columns:
+        await db.execute('ALTER TABLE tickets ADD COLUMN guild_id INTEGER')
+    # SQLite tidak bisa mengganti primary key: bangun ulang tabel members
+    await db.execute('''
+        CREATE TABLE members_new (
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL DEFAULT 0,
+            username TEXT,
+            joined_at TEXT,
+            messages_sent INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id)
+        )
+    ''')
+    await db.execute('''
+        INSERT INTO members_new (user_id, guild_id, username, joined_at, messages_sent)
+        SELECT user_id, 0, username, joined_at, messages_sent FROM members
+    ''')
+    await db.execute('DROP TABLE members')
+    await db.execute('ALTER TABLE members_new RENAME TO members')
+
+async def _migration_indexes(db: aiosqlite.Connection):
+    """Index untuk semua pola query yang ada (lihat HOT_QUERIES)."""
+    # Covering untuk COUNT(*) / SUM(messages_sent) per guild
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_members_guild ON members (guild_id, messages_sent)')
+    # status dulu: dipakai warm-up index (status saja) dan /stats (status + guild_id)
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_tickets_status_guild ON tickets (status, guild_id)')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_tickets_channel ON tickets (channel_id)')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_ytdl_metadata_expires ON ytdl_metadata (expires_at)')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_ytdl_queries_expires ON ytdl_queries (expires_at)')
+
+def _counter_upsert(guild_id: str, members: str = '0', open_tickets: str = '0', closed_tickets: str = '0', messages: str = '0') -> str:
+    return (
+        'INSERT INTO guild_counters (guild_id, members, open_tickets, closed_tickets, messages) '
+        f'VALUES (COALESCE({guild_id}, 0), {members}, {open_tickets}, {closed_tickets}, {messages}) '
+        'ON CONFLICT(guild_id) DO UPDATE SET members = members + excluded.members, '
+        'open_tickets = open_tickets + excluded.open_tickets, closed_tickets = closed_tickets + excluded.closed_tickets, '
+        'messages = messages + excluded.messages;'
+    )
+
+# Nilai counter sebenarnya dari tabel dasar; dipakai saat migrasi dan rekonsiliasi
+COUNTER_ACTUALS_SQL = '''
+    SELECT guild_id, SUM(members) AS members, SUM(open_tickets) AS open_tickets,
+           SUM(closed_tickets) AS closed_tickets, SUM(messages) AS messages FROM (
+        SELECT guild_id, COUNT(*) AS members, 0 AS open_tickets, 0 AS closed_tickets,
+               COALESCE(SUM(messages_sent), 0) AS messages
+        FROM members GROUP BY guild_id
+        UNION ALL
+        SELECT COALESCE(guild_id, 0), 0, SUM(status = 'open'), SUM(status = 'closed'), 0
+        FROM tickets GROUP BY COALESCE(guild_id, 0)
+    ) GROUP BY guild_id
+'''
+
+async def _migration_guild_counters(db: aiosqlite.Connection):
+    """Counter /stats per guild, dijaga trigger di transaksi yang sama dengan perubahan tabel dasar."""
+    await db.execute('''
+        CREATE TABLE guild_counters (
+            guild_id INTEGER PRIMARY KEY,
+            members INTEGER NOT NULL DEFAULT 0,
+            open_tickets INTEGER NOT NULL DEFAULT 0,
+            closed_tickets INTEGER NOT NULL DEFAULT 0,
+            messages INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    triggers = {
+        'trg_members_insert': ('AFTER INSERT ON members', [
+            _counter_upsert('NEW.guild_id', members='1', messages='COALESCE(NEW.messages_sent, 0)')]),
+        'trg_members_delete': ('AFTER DELETE ON members', [
+            _counter_upsert('OLD.guild_id', members='-1', messages='-COALESCE(OLD.messages_sent, 0)')]),
+        'trg_members_messages': ('AFTER UPDATE OF messages_sent ON members', [
+            _counter_upsert('NEW.guild_id', messages='COALESCE(NEW.messages_sent, 0) - COALESCE(OLD.messages_sent, 0)')]),
+        'trg_tickets_insert': ('AFTER INSERT ON tickets', [
+            _counter_upsert('NEW.guild_id', open_tickets="NEW.status = 'open'", closed_tickets="NEW.status = 'closed'")]),
+        'trg_tickets_delete': ('AFTER DELETE ON tickets', [
+            _counter_upsert('OLD.guild_id', open_tickets="-(OLD.status = 'open')", closed_tickets="-(OLD.status = 'closed')")]),
+        # Tutup ticket dan backfill guild_id: keluarkan dari nilai lama, masukkan ke nilai baru
+        'trg_tickets_update': ('AFTER UPDATE OF status, guild_id ON tickets', [
+            _counter_upsert('OLD.guild_id', open_tickets="-(OLD.status = 'open')", closed_tickets="-(OLD.status = 'closed')"),
+            _counter_upsert('NEW.guild_id', open_tickets="NEW.status = 'open'", closed_tickets="NEW.status = 'closed'")]),
+    }
+    for name, (event, statements) in triggers.items():
+        await db.execute(f"CREATE TRIGGER {name} {event} BEGIN {' '.join(statements)} END")
+    await db.execute(f'INSERT INTO guild_counters (guild_id, members, open_tickets, closed_tickets, messages) {COUNTER_ACTUALS_SQL}')
+
+async def _migration_activity_rollups(db: aiosqlite.Connection):
+    """Jumlah pesan per (guild, jam, user) dan per (guild, hari, user). Jam/hari = epoch UTC // 3600 / 86400."""
+    await db.execute('''
+        CREATE TABLE activity_hourly (
+            guild_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, hour, user_id)
+        ) WITHOUT ROWID
+    ''')
+    await db.execute('''
+        CREATE TABLE activity_daily (
+            guild_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+async def _migration_cluster_status(db: aiosqlite.Connection):
+    """Laporan berkala tiap proses bot, dijumlahkan untuk /stats."""
+    await db.execute('''
+        CREATE TABLE cluster_status (
+            cluster_id INTEGER PRIMARY KEY,
+            shard_ids TEXT,
+            guilds INTEGER NOT NULL DEFAULT 0,
+            members INTEGER NOT NULL DEFAULT 0,
+            latency_ms REAL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+async def _migration_bot_meta(db: aiosqlite.Connection):
+    await db.execute('CREATE TABLE bot_meta (key TEXT PRIMARY KEY, value TEXT)')
+
+async def _migration_ticket_transcripts(db: aiosqlite.Connection):
+    await db.execute('ALTER TABLE tickets ADD COLUMN transcript_path TEXT')
+
+async def _migration_automod_settings(db: aiosqlite.Connection):
+    await db.execute('''
+        CREATE TABLE automod_settings (
+            guild_id INTEGER PRIMARY KEY,
+            action TEXT NOT NULL DEFAULT 'timeout',
+            flood_messages INTEGER NOT NULL DEFAULT 6,
+            flood_seconds REAL NOT NULL DEFAULT 5,
+            duplicate_count INTEGER NOT NULL DEFAULT 3,
+            duplicate_seconds REAL NOT NULL DEFAULT 30,
+            mention_max INTEGER NOT NULL DEFAULT 5,
+            timeout_seconds INTEGER NOT NULL DEFAULT 600
+        )
+    ''')
+
+async def _migration_members_joined_index(db: aiosqlite.Connection):
+    # Filter mass ban/kick: join dalam N menit terakhir (+ umur akun lewat user_id), tanpa baca row tabel
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_members_joined ON members (guild_id, joined_at, user_id)')
+
+# (versi, deskripsi, fungsi). Tambah migrasi baru di akhir, jangan ubah yang sudah rilis.
+MIGRATIONS = [
+    (1, "baseline schema", _migration_baseline),
+    (2, "guild_id untuk members & tickets", _migration_guild_scope),
+    (3, "index untuk query utama", _migration_indexes),
+    (4, "counter /stats per guild", _migration_guild_counters),
+    (5, "rollup aktivitas per jam & per hari", _migration_activity_rollups),
+    (6, "status cluster", _migration_cluster_status),
+    (7, "metadata bot (hash command tree)", _migration_bot_meta),
+    (8, "path transcript ticket", _migration_ticket_transcripts),
+    (9, "pengaturan auto-mod per guild", _migration_automod_settings),
+    (10, "index member per waktu join", _migration_members_joined_index),
+]
+
+async def init_db(db: aiosqlite.Connection):
+    """Jalankan migrasi yang belum diterapkan, masing-masing dalam satu transaksi. db harus autocommit."""
+    async with db.execute('PRAGMA user_version') as cursor:
+        version = (await cursor.fetchone())[0]
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        await db.execute('BEGIN IMMEDIATE')
+        try:
+            await migrate(db)
+            await db.execute(f'PRAGMA user_version = {target}')
+            await db.execute('COMMIT')
+        except Exception:
+            await db.execute('ROLLBACK')
+            raise
+        print(f"Database dimigrasi ke v{target}: {description}")
+
+# Query yang jalan di hot path. check_query_plans memastikan tidak ada yang full scan.
+HOT_QUERIES = [
+    ('UPDATE members SET messages_sent = messages_sent + ? WHERE user_id = ? AND guild_id = ?', (1, 0, 0)),
+    ('SELECT COUNT(*) FROM members WHERE guild_id = ? AND user_id IN (?, ?)', (0, 0, 0)),
+    ('SELECT members, open_tickets, closed_tickets, messages FROM guild_counters WHERE guild_id = ?', (0,)),
+    ('SELECT user_id, messages_sent FROM members WHERE guild_id = ? ORDER BY messages_sent DESC LIMIT ?', (0, 10)),
+    ('SELECT user_id, SUM(messages) FROM activity_hourly WHERE guild_id = ? AND hour >= ? GROUP BY user_id', (0, 0)),
+    ('SELECT user_id, SUM(messages) FROM activity_daily WHERE guild_id = ? AND day >= ? GROUP BY user_id', (0, 0)),
+    ('SELECT hour, SUM(messages) FROM activity_hourly WHERE guild_id = ? AND hour >= ? GROUP BY hour', (0, 0)),
+    ('SELECT day, SUM(messages) FROM activity_daily WHERE guild_id = ? AND day >= ? GROUP BY day', (0, 0)),
+    ("SELECT guild_id, user_id, channel_id, category, created_at FROM tickets WHERE status = 'open'", ()),
+    ("UPDATE tickets SET status = 'closed' WHERE channel_id = ?", (0,)),
+    ('SELECT user_id FROM members WHERE guild_id = ? AND joined_at >= ? AND user_id >= ?', (0, '', 0)),
+    ('SELECT channel_id, message, role_id FROM welcome_settings WHERE guild_id = ?', (0,)),
+    ('SELECT channel_id, category_id FROM ticket_settings WHERE guild_id = ?', (0,)),
+    ('DELETE FROM ytdl_metadata WHERE expires_at <= ?', (0,)),
+    ('DELETE FROM ytdl_queries WHERE expires_at <= ?', (0,)),
+    ('DELETE FROM music_queue WHERE entry_id = ?', (0,)),
+    ('DELETE FROM music_queue WHERE guild_id = ?', (0,)),
+    ('UPDATE music_queue SET position = ? WHERE entry_id = ?', (0, 0)),
+]
+
+# =====================
+# Database layer (koneksi bersama milik bot)
+# =====================
+_QUERY_LABEL_RE = re.compile(r'^\s*(\w+)\b.*?\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)',
+                             re.IGNORECASE | re.DOTALL)
+
+@functools.lru_cache(maxsize=512)
+def query_label(sql: str) -> str:
+    """Label metrics untuk satu SQL: operasi + tabel pertama, mis. 'SELECT members'."""
+    match = _QUERY_LABEL_RE.match(sql)
+    if match:
+        return f"{match.group(1).upper()} {match.group(2)}"
+    words = sql.split()
+    return f"{words[0].upper()} {words[1]}" if len(words) > 1 else 'unknown'
+
+class Database:
+    """Koneksi SQLite yang hidup selama bot berjalan.
+
+    Semua tulisan lewat satu antrian writer (satu koneksi, transaksi eksplisit),
+    pembacaan memakai pool beberapa koneksi reader. Mode WAL membuat reader
+    tidak terblokir oleh writer.
+    """
+
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA busy_timeout=5000',
+    )
+    MAX_JOBS_PER_COMMIT = 64
+
+    def __init__(self, path: str, readers: int = 4, write_service: str | None = None):
+        self.path = path
+        self.reader_count = max(1, readers)
+        self.write_service = write_service
+        self.commits = 0
+        self._remote: WriteServiceClient | None = None
+        self._writer: aiosqlite.Connection | None = None
+        self._readers: asyncio.Queue | None = None
+        self._reader_conns: list[aiosqlite.Connection] = []
+        self._write_queue: asyncio.Queue | None = None
+        self._writer_task: asyncio.Task | None = None
+
+    async def _connect(self, **kwargs) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path, cached_statements=256, **kwargs)
+        for pragma in self.PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def open(self):
+        if self._writer is not None or self._remote is not None:
+            return
+        if self.write_service:
+            # Mode cluster: migrasi & semua tulisan milik write service, proses ini hanya membaca
+            self._remote = WriteServiceClient(self.write_service)
+            await self._remote.connect()
+        else:
+            # Writer memakai autocommit supaya BEGIN/COMMIT dikontrol sendiri
+            self._writer = await self._connect(isolation_level=None)
+            await init_db(self._writer)
+        self._readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect()
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
+        if self._writer is not None:
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
+        for sql in await self.check_query_plans():
+            print(f"⚠️ Query tanpa index (full scan): {sql}")
+
+    async def close(self):
+        if self._writer is None and self._remote is None:
+            return
+        if self._remote is not None:
+            await self._remote.close()
+            self._remote = None
+        else:
+            self._write_queue.put_nowait(None)
+            await self._writer_task
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns.clear()
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+
+    # ---------- Reads ----------
+    @asynccontextmanager
+    async def reader(self):
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> tuple | None:
+        async with self.reader() as conn:
+            started = time.perf_counter()
+            async with conn.execute(sql, params) as cursor:
+                row = await cursor.fetchone()
+            metrics.observe('db_query_seconds', query_label(sql), time.perf_counter() - started)
+            return row
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list[tuple]:
+        async with self.reader() as conn:
+            started = time.perf_counter()
+            async with conn.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+            metrics.observe('db_query_seconds', query_label(sql), time.perf_counter() - started)
+            return rows
+
+    # ---------- Writes ----------
+    async def write(self, statements: list[tuple]) -> list[tuple[int, int]]:
+        """Jalankan statement dalam satu transaksi. Item: (sql, params) atau (sql, rows, True) untuk executemany.
+
+        Return list (rowcount, lastrowid) per statement.
+        """
+        if self._remote is not None:
+            started = time.perf_counter()
+            try:
+                return await self._remote.write(statements)
+            finally:
+                metrics.observe('db_write_seconds', 'remote', time.perf_counter() - started)
+        if self._write_queue is None:
+            raise RuntimeError("Database belum dibuka")
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((statements, future))
+        started = time.perf_counter()
+        try:
+            return await future
+        finally:
+            # Termasuk antri di writer dan menunggu commit grup
+            metrics.observe('db_write_seconds', 'local', time.perf_counter() - started)
+
+    async def execute(self, sql: str, params: tuple = ()) -> tuple[int, int]:
+        return (await self.write([(sql, params)]))[0]
+
+    async def executemany(self, sql: str, rows: list[tuple]) -> tuple[int, int]:
+        return (await self.write([(sql, rows, True)]))[0]
+
+    async def _run_statements(self, statements: list[tuple]) -> list[tuple[int, int]]:
+        results = []
+        for statement in statements:
+            sql, params = statement[0], statement[1]
+            started = time.perf_counter()
+            if len(statement) > 2 and statement[2]:
+                cursor = await self._writer.executemany(sql, params)
+            else:
+                cursor = await self._writer.execute(sql, params)
+            results.append((cursor.rowcount, cursor.lastrowid))
+            await cursor.close()
+            metrics.observe('db_query_seconds', query_label(sql), time.perf_counter() - started)
+        return results
+
+    async def _write_loop(self):
+        stopping = False
+        while not stopping:
+            job = await self._write_queue.get()
+            if job is None:
+                break
+            jobs = [job]
+            # Group commit: gabungkan job yang sudah mengantri ke satu transaksi
+            while len(jobs) < self.MAX_JOBS_PER_COMMIT and not self._write_queue.empty():
+                job = self._write_queue.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                jobs.append(job)
+
+            done = []
+            started = time.perf_counter()
+            try:
+                await self._writer.execute('BEGIN IMMEDIATE')
+                for index, (statements, future) in enumerate(jobs):
+                    # Savepoint per job supaya satu job gagal tidak menggagalkan job lain
+                    await self._writer.execute(f'SAVEPOINT job{index}')
+                    try:
+                        result = await self._run_statements(statements)
+                    except Exception as e:
+                        await self._writer.execute(f'ROLLBACK TO job{index}')
+                        await self._writer.execute(f'RELEASE job{index}')
+                        done.append((future, None, e))
+                        continue
+                    await self._writer.execute(f'RELEASE job{index}')
+                    done.append((future, result, None))
+                await self._writer.execute('COMMIT')
+                self.commits += 1
+                metrics.observe('db_commit_seconds', 'writer', time.perf_counter() - started)
+            except Exception as e:
+                try:
+                    await self._writer.execute('ROLLBACK')
+                except Exception:
+                    pass
+                done = [(future, None, e) for _, future in jobs]
+
+            for future, result, error in done:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
 
-        # Ticket settings table - DIPERBAIKI dengan ALTER TABLE
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_settings (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER,
-                category_id INTEGER
+    async def check_query_plans(self) -> list[str]:
+        """Return query di HOT_QUERIES yang plan-nya masih SCAN tabel (tanpa index)."""
+        full_scans = []
+        async with self.reader() as conn:
+            for sql, params in HOT_QUERIES:
+                async with conn.execute(f'EXPLAIN QUERY PLAN {sql}', params) as cursor:
+                    details = [row[3] for row in await cursor.fetchall()]
+                if any(detail.startswith('SCAN') for detail in details):
+                    full_scans.append(sql)
+        return full_scans
+
+    # ---------- Query helpers ----------
+    async def add_members(self, rows: list[tuple[int, int, str, str]]) -> int:
+        """rows: (user_id, guild_id, username, joined_at). Satu transaksi untuk satu batch join.
+
+        joined_at hanya ditulis dari sini (event join); member yang join ulang ikut diperbarui.
+        """
+        if not rows:
+            return 0
+        [(rowcount, _), _] = await self.write([
+            ('INSERT OR IGNORE INTO members (user_id, guild_id, username, joined_at) VALUES (?, ?, ?, ?)', rows, True),
+            ('UPDATE members SET joined_at = ? WHERE user_id = ? AND guild_id = ?',
+             [(joined_at, user_id, guild_id) for user_id, guild_id, _, joined_at in rows], True),
+        ])
+        return rowcount
+
+    async def apply_message_counts(self, counts: dict[tuple[int, int], list]):
+        """counts: (guild_id, user_id) -> [username, jumlah pesan baru, {jam: jumlah}]."""
+        await self.write([
+            # joined_at dibiarkan NULL: waktu pesan pertama bukan waktu join (dipakai filter /massban)
+            ('INSERT OR IGNORE INTO members (user_id, guild_id, username) VALUES (?, ?, ?)',
+             [(user_id, guild_id, username) for (guild_id, user_id), (username, *_) in counts.items()], True),
+            ('UPDATE members SET messages_sent = messages_sent + ? WHERE user_id = ? AND guild_id = ?',
+             [(count, user_id, guild_id) for (guild_id, user_id), (_, count, _) in counts.items()], True),
+            ('INSERT INTO activity_hourly (guild_id, hour, user_id, messages) VALUES (?, ?, ?, ?) '
+             'ON CONFLICT(guild_id, hour, user_id) DO UPDATE SET messages = messages + excluded.messages',
+             [(guild_id, hour, user_id, n) for (guild_id, user_id), (_, _, hours) in counts.items() for hour, n in hours.items()],
+             True),
+        ])
+
+    async def top_members(self, guild_id: int, limit: int) -> list[tuple[int, int]]:
+        """Return list (user_id, messages_sent) all-time, langsung dari index (guild_id, messages_sent)."""
+        return await self.fetchall(
+            'SELECT user_id, messages_sent FROM members WHERE guild_id = ? ORDER BY messages_sent DESC LIMIT ?', (guild_id, limit)
+        )
+
+    async def activity_by_user(self, guild_id: int, since_hour: int, since_day: int | None = None) -> dict[int, int]:
+        """Jumlah pesan per user sejak since_hour (rollup jam), ditambah rollup harian sejak since_day."""
+        totals: dict[int, int] = {}
+        rows = await self.fetchall(
+            'SELECT user_id, SUM(messages) FROM activity_hourly WHERE guild_id = ? AND hour >= ? GROUP BY user_id', (guild_id, since_hour)
+        )
+        if since_day is not None:
+            rows += await self.fetchall(
+                'SELECT user_id, SUM(messages) FROM activity_daily WHERE guild_id = ? AND day >= ? GROUP BY user_id', (guild_id, since_day)
             )
+        for user_id, messages in rows:
+            totals[user_id] = totals.get(user_id, 0) + messages
+        return totals
+
+    async def activity_by_bucket(self, guild_id: int, since_hour: int, since_day: int) -> tuple[dict[int, int], dict[int, int]]:
+        """Return (jam -> jumlah pesan, hari -> jumlah pesan) untuk satu guild."""
+        hourly = await self.fetchall(
+            'SELECT hour, SUM(messages) FROM activity_hourly WHERE guild_id = ? AND hour >= ? GROUP BY hour', (guild_id, since_hour)
+        )
+        daily = await self.fetchall(
+            'SELECT day, SUM(messages) FROM activity_daily WHERE guild_id = ? AND day >= ? GROUP BY day', (guild_id, since_day)
+        )
+        return dict(hourly), dict(daily)
+
+    async def compact_activity(self, before_hour: int, prune_before_day: int) -> int:
+        """Pindahkan rollup jam sebelum before_hour ke rollup harian, lalu hapus rollup harian yang terlalu lama."""
+        moved, _, _ = await self.write([
+            ('INSERT INTO activity_daily (guild_id, day, user_id, messages) '
+             'SELECT guild_id, hour / 24, user_id, SUM(messages) FROM activity_hourly WHERE hour < ? '
+             'GROUP BY guild_id, hour / 24, user_id '
+             'ON CONFLICT(guild_id, day, user_id) DO UPDATE SET messages = messages + excluded.messages', (before_hour,)),
+            ('DELETE FROM activity_hourly WHERE hour < ?', (before_hour,)),
+            ('DELETE FROM activity_daily WHERE day < ?', (prune_before_day,)),
+        ])
+        return moved[0]
+
+    async def count_known_members(self, guild_id: int, user_ids: list[int]) -> int:
+        known = 0
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            row = await self.fetchone(f'SELECT COUNT(*) FROM members WHERE guild_id = ? AND user_id IN ({placeholders})',
+                                      (guild_id, *chunk))
+            known += row[0]
+        return known
+
+    async def members_matching(self, guild_id: int, joined_after: str | None, min_user_id: int) -> list[int]:
+        """user_id member yang join setelah joined_after (ISO) dan/atau dengan user_id >= min_user_id (akun lebih baru)."""
+        if joined_after is None:
+            rows = await self.fetchall('SELECT user_id FROM members WHERE guild_id = ? AND user_id >= ?', (guild_id, min_user_id))
+        else:
+            rows = await self.fetchall('SELECT user_id FROM members WHERE guild_id = ? AND joined_at >= ? AND user_id >= ?',
+                                       (guild_id, joined_after, min_user_id))
+        return [row[0] for row in rows]
+
+    async def get_welcome_settings(self, guild_id: int) -> tuple | None:
+        """Return (channel_id, message, role_id) atau None."""
+        return await self.fetchone('SELECT channel_id, message, role_id FROM welcome_settings WHERE guild_id = ?', (guild_id,))
+
+    async def set_welcome_channel_role(self, guild_id: int, channel_id: int, role_id: int):
+        # Upsert supaya pesan custom yang sudah ada tidak terhapus
+        await self.execute(
+            'INSERT INTO welcome_settings (guild_id, channel_id, role_id) VALUES (?, ?, ?) '
+            'ON CONFLICT(guild_id) DO UPDATE SET channel_id = excluded.channel_id, role_id = excluded.role_id',
+            (guild_id, channel_id, role_id)
+        )
+
+    async def set_welcome_message(self, guild_id: int, message: str):
+        await self.execute(
+            'INSERT INTO welcome_settings (guild_id, message) VALUES (?, ?) '
+            'ON CONFLICT(guild_id) DO UPDATE SET message = excluded.message',
+            (guild_id, message)
+        )
+
+    async def get_ticket_settings(self, guild_id: int) -> tuple | None:
+        """Return (channel_id, category_id) atau None."""
+        return await self.fetchone('SELECT channel_id, category_id FROM ticket_settings WHERE guild_id = ?', (guild_id,))
+
+    async def set_ticket_panel_channel(self, guild_id: int, channel_id: int):
+        # Upsert supaya category_id yang sudah diset tidak ikut hilang
+        await self.execute(
+            'INSERT INTO ticket_settings (guild_id, channel_id) VALUES (?, ?) '
+            'ON CONFLICT(guild_id) DO UPDATE SET channel_id = excluded.channel_id',
+            (guild_id, channel_id)
+        )
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        await self.execute(
+            'INSERT INTO ticket_settings (guild_id, category_id) VALUES (?, ?) '
+            'ON CONFLICT(guild_id) DO UPDATE SET category_id = excluded.category_id',
+            (guild_id, category_id)
+        )
+
+    async def set_automod_settings(self, guild_id: int, row: tuple):
+        """row: (action, flood_messages, flood_seconds, duplicate_count, duplicate_seconds, mention_max, timeout_seconds)."""
+        await self.execute(
+            'INSERT OR REPLACE INTO automod_settings (guild_id, action, flood_messages, flood_seconds, duplicate_count, '
+            'duplicate_seconds, mention_max, timeout_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (guild_id, *row)
+        )
+
+    async def list_all_open_tickets(self) -> list[tuple]:
+        """Return list (guild_id, user_id, channel_id, category, created_at) untuk warm-up index."""
+        return await self.fetchall("SELECT guild_id, user_id, channel_id, category, created_at FROM tickets WHERE status = 'open'")
+
+    async def insert_ticket(self, guild_id: int, user_id: int, channel_id: int, created_at: str, category: str,
+                            new_category_id: int | None = None) -> int:
+        """Insert ticket (dan kategori ticket baru milik guild, jika ada) dalam satu transaksi."""
+        statements = [(
+            'INSERT INTO tickets (guild_id, user_id, channel_id, created_at, category) VALUES (?, ?, ?, ?, ?)',
+            (guild_id, user_id, channel_id, created_at, category)
+        )]
+        if new_category_id is not None:
+            statements.append((
+                'INSERT INTO ticket_settings (guild_id, category_id) VALUES (?, ?) '
+                'ON CONFLICT(guild_id) DO UPDATE SET category_id = excluded.category_id',
+                (guild_id, new_category_id)
+            ))
+        [(_, ticket_id), *_] = await self.write(statements)
+        return ticket_id
+
+    async def close_ticket(self, channel_id: int, transcript_path: str | None = None):
+        await self.execute("UPDATE tickets SET status = 'closed', transcript_path = ? WHERE channel_id = ?",
+                           (transcript_path, channel_id))
+
+    async def get_guild_counters(self, guild_id: int) -> tuple[int, int, int, int]:
+        """Return (members, open_tickets, closed_tickets, messages) dari guild_counters."""
+        row = await self.fetchone(
+            'SELECT members, open_tickets, closed_tickets, messages FROM guild_counters WHERE guild_id = ?', (guild_id,)
+        )
+        return tuple(row) if row else (0, 0, 0, 0)
+
+    async def reconcile_counters(self) -> dict[int, tuple]:
+        """Hitung ulang counter dari tabel dasar dan perbaiki yang meleset.
+
+        Return guild_id -> (selisih members, open_tickets, closed_tickets, messages).
+        """
+        # Satu statement = satu snapshot, jadi counter dan tabel dasar dibandingkan pada titik yang sama
+        rows = await self.fetchall(f'''
+            WITH actual AS ({COUNTER_ACTUALS_SQL})
+            SELECT actual.guild_id,
+                   actual.members - COALESCE(c.members, 0), actual.open_tickets - COALESCE(c.open_tickets, 0),
+                   actual.closed_tickets - COALESCE(c.closed_tickets, 0), actual.messages - COALESCE(c.messages, 0)
+            FROM actual
+            LEFT JOIN guild_counters AS c ON c.guild_id = actual.guild_id
+            UNION ALL
+            SELECT c.guild_id, -c.members, -c.open_tickets, -c.closed_tickets, -c.messages
+            FROM guild_counters AS c WHERE c.guild_id NOT IN (SELECT guild_id FROM actual)
         ''')
+        drift = {row[0]: tuple(row[1:]) for row in rows if any(row[1:])}
+        if drift:
+            # Koreksi berupa selisih: perubahan yang masuk setelah snapshot tetap terhitung lewat trigger
+            await self.executemany(
+                'INSERT INTO guild_counters (guild_id, members, open_tickets, closed_tickets, messages) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(guild_id) DO UPDATE SET members = members + excluded.members, '
+                'open_tickets = open_tickets + excluded.open_tickets, closed_tickets = closed_tickets + excluded.closed_tickets, '
+                'messages = messages + excluded.messages',
+                [(guild_id, *delta) for guild_id, delta in drift.items()]
+            )
+        return drift
+
+    async def get_meta(self, key: str) -> str | None:
+        row = await self.fetchone('SELECT value FROM bot_meta WHERE key = ?', (key,))
+        return row[0] if row else None
+
+    async def set_meta(self, key: str, value: str):
+        await self.execute(
+            'INSERT INTO bot_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value)
+        )
+
+    async def report_cluster(self, cluster_id: int, shard_ids: list[int] | None, guilds: int, members: int, latency_ms: float | None):
+        await self.execute(
+            'INSERT INTO cluster_status (cluster_id, shard_ids, guilds, members, latency_ms, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(cluster_id) DO UPDATE SET shard_ids = excluded.shard_ids, guilds = excluded.guilds, '
+            'members = excluded.members, latency_ms = excluded.latency_ms, updated_at = excluded.updated_at',
+            (cluster_id, json.dumps(shard_ids), guilds, members, latency_ms, time.time())
+        )
+
+    async def cluster_totals(self, max_age: float) -> tuple[int, int, int]:
+        """Return (cluster aktif, total guild, total member) dari laporan yang lebih baru dari max_age detik."""
+        row = await self.fetchone(
+            'SELECT COUNT(*), COALESCE(SUM(guilds), 0), COALESCE(SUM(members), 0) FROM cluster_status WHERE updated_at >= ?',
+            (time.time() - max_age,)
+        )
+        return tuple(row)
+
+    # ---------- Backfill guild_id untuk row dari sebelum migrasi v2 ----------
+    async def legacy_members(self) -> list[tuple]:
+        """Return list (user_id, username, joined_at, messages_sent) yang guild-nya belum diketahui."""
+        return await self.fetchall('SELECT user_id, username, joined_at, messages_sent FROM members WHERE guild_id = 0')
+
+    async def legacy_tickets(self) -> list[tuple]:
+        """Return list (ticket_id, channel_id) tanpa guild_id."""
+        return await self.fetchall('SELECT ticket_id, channel_id FROM tickets WHERE guild_id IS NULL')
+
+    async def assign_guilds(self, members: list[tuple], member_guilds: dict[int, list[int]], tickets: dict[int, int]):
+        """members: row dari legacy_members; member_guilds: user_id -> guild_ids; tickets: ticket_id -> guild_id.
+
+        Jumlah pesan lama masuk ke guild pertama (tidak diduplikasi), guild lain mendapat row kosong.
+        """
+        primary, others, resolved = [], [], []
+        for user_id, *_ in members:
+            guild_ids = member_guilds.get(user_id)
+            if not guild_ids:
+                continue
+            primary.append((guild_ids[0], user_id))
+            others.extend((guild_id, user_id) for guild_id in guild_ids[1:])
+            resolved.append((user_id,))
+        # Data diambil dari row guild 0 di dalam transaksi: aman jika beberapa cluster backfill bersamaan
+        await self.write([
+            ('INSERT INTO members (user_id, guild_id, username, joined_at, messages_sent) '
+             'SELECT user_id, ?, username, joined_at, messages_sent FROM members WHERE user_id = ? AND guild_id = 0 '
+             'ON CONFLICT(user_id, guild_id) DO UPDATE SET messages_sent = messages_sent + excluded.messages_sent',
+             primary, True),
+            ('INSERT OR IGNORE INTO members (user_id, guild_id, username, joined_at) '
+             'SELECT user_id, ?, username, joined_at FROM members WHERE user_id = ? AND guild_id = 0', others, True),
+            ('DELETE FROM members WHERE user_id = ? AND guild_id = 0', resolved, True),
+            ('UPDATE tickets SET guild_id = ? WHERE ticket_id = ? AND guild_id IS NULL',
+             [(guild_id, ticket_id) for ticket_id, guild_id in tickets.items()], True),
+        ])
+
+database = Database(DB_PATH, DB_READERS, None if BOT_ROLE == 'write-service' else DB_WRITE_SERVICE)
+
+# =====================
+# Write service: satu proses pemilik writer SQLite untuk semua cluster
+# =====================
+def _split_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+class WriteServiceClient:
+    """Kirim batch statement ke write service (JSON per baris) dan tunggu hasilnya, dengan API yang sama seperti Database.write."""
+
+    def __init__(self, address: str, connect_timeout: float = 30.0):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._task: asyncio.Task | None = None
+
+    async def connect(self):
+        host, port = _split_address(self.address)
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_connection(host, port, limit=2 ** 24)
+                break
+            except OSError:
+                # Write service mungkin masih menjalankan migrasi
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+        self._task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response['id'], None)
+                if future is None or future.done():
+                    continue
+                if 'error' in response:
+                    # IntegrityError/OperationalError tetap bisa ditangkap seperti di mode satu proses
+                    error_type = getattr(sqlite3, response.get('type', ''), None)
+                    if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+                        error_type = RuntimeError
+                    future.set_exception(error_type(response['error']))
+                else:
+                    future.set_result([tuple(result) for result in response['result']])
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Koneksi ke write service terputus"))
+            self._pending.clear()
+
+    async def write(self, statements: list[tuple]) -> list[tuple[int, int]]:
+        if self._writer is None or self._task.done():
+            raise ConnectionError("Write service tidak terhubung")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps({'id': request_id, 'statements': statements}).encode() + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+            self._writer = None
+        if self._task is not None:
+            await self._task
+
+async def serve_writes(address: str):
+    """Entry point BOT_ROLE=write-service: jalankan migrasi, lalu terima batch tulisan dari semua cluster.
+
+    Semua request masuk ke antrian writer yang sama, jadi group commit juga menggabungkan tulisan antar cluster.
+    """
+    loop_lag.start()
+    await metrics_server.start()
+    await database.open()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def respond(request: dict):
+            try:
+                response = {'id': request['id'], 'result': await database.write(request['statements'])}
+            except Exception as e:
+                response = {'id': request['id'], 'error': str(e), 'type': type(e).__name__}
+            if not writer.is_closing():
+                writer.write(json.dumps(response).encode() + b'\n')
 
-        # Cek jika kolom category_id belum ada di tabel lama
+        tasks = set()
         try:
-            await db.execute('SELECT category_id FROM ticket_settings LIMIT 1')
-        except aiosqlite.OperationalError:
-            # Jika kolom tidak ada, alter table
-            await db.execute('ALTER TABLE ticket_settings ADD COLUMN category_id INTEGER')
-            print("Added category_id column to ticket_settings table")
+            while line := await reader.readline():
+                task = asyncio.create_task(respond(json.loads(line)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    host, port = _split_address(address)
+    server = await asyncio.start_server(handle, host, port, limit=2 ** 24)
+    print(f"Write service siap di {host}:{port} ({database.path})")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await database.close()
+        await metrics_server.close()
+        await loop_lag.close()
+        print(f"Write service berhenti ({database.commits} commit)")
+
+# =====================
+# Settings cache per guild (welcome_settings, ticket_settings & automod_settings)
+# =====================
+class AutoModConfig:
+    """Ambang anti-spam satu guild (satu row automod_settings)."""
+
+    __slots__ = ('action', 'flood_messages', 'flood_seconds', 'duplicate_count', 'duplicate_seconds',
+                 'mention_max', 'timeout_seconds', 'refill_rate')
+    DEFAULTS = ('timeout', 6, 5.0, 3, 30.0, 5, 600)
+
+    def __init__(self, action: str, flood_messages: int, flood_seconds: float, duplicate_count: int,
+                 duplicate_seconds: float, mention_max: int, timeout_seconds: int):
+        self.action = action                    # 'off', 'delete', 'timeout', 'kick' atau 'ban'
+        self.flood_messages = flood_messages    # pesan maksimum ...
+        self.flood_seconds = flood_seconds      # ... dalam rentang ini (kapasitas & isi ulang token bucket)
+        self.duplicate_count = duplicate_count  # pesan identik beruntun ...
+        self.duplicate_seconds = duplicate_seconds  # ... dalam rentang ini
+        self.mention_max = mention_max          # mention user/role maksimum per pesan
+        self.timeout_seconds = timeout_seconds
+        self.refill_rate = flood_messages / flood_seconds  # token per detik
+
+    def to_row(self) -> tuple:
+        return (self.action, self.flood_messages, self.flood_seconds, self.duplicate_count,
+                self.duplicate_seconds, self.mention_max, self.timeout_seconds)
+
+class SettingsCache:
+    """Cache pengaturan per guild_id. Semua write path lewat sini supaya cache selalu sinkron."""
+
+    def __init__(self):
+        self.welcome: dict[int, tuple | None] = {}  # guild_id -> (channel_id, message, role_id)
+        self.ticket: dict[int, tuple | None] = {}   # guild_id -> (channel_id, category_id)
+        # Dibaca sinkron di on_message; hanya terisi lewat load_all & set_automod (tidak ada lazy load)
+        self.automod: dict[int, AutoModConfig] = {}
+        self.preloaded = False
+        self.hits = 0
+        self.misses = 0
+
+    async def load_all(self):
+        # Mode cluster: hanya guild milik shard proses ini
+        rows = await database.fetchall('SELECT guild_id, channel_id, message, role_id FROM welcome_settings')
+        self.welcome = {row[0]: tuple(row[1:]) for row in rows if owns_guild(row[0])}
+        rows = await database.fetchall('SELECT guild_id, channel_id, category_id FROM ticket_settings')
+        self.ticket = {row[0]: tuple(row[1:]) for row in rows if owns_guild(row[0])}
+        rows = await database.fetchall('SELECT guild_id, action, flood_messages, flood_seconds, duplicate_count, '
+                                       'duplicate_seconds, mention_max, timeout_seconds FROM automod_settings')
+        self.automod = {row[0]: AutoModConfig(*row[1:]) for row in rows if owns_guild(row[0])}
+        # Setelah preload, guild yang tidak ada di dict memang belum punya pengaturan
+        self.preloaded = True
+
+    def _known(self, cache: dict, guild_id: int) -> bool:
+        return self.preloaded or guild_id in cache
 
-        await db.commit()
+    async def get_welcome(self, guild_id: int) -> tuple | None:
+        """Return (channel_id, message, role_id) atau None."""
+        if self._known(self.welcome, guild_id):
+            self.hits += 1
+            return self.welcome.get(guild_id)
+        self.misses += 1
+        row = await database.get_welcome_settings(guild_id)
+        self.welcome[guild_id] = row
+        return row
+
+    async def get_ticket(self, guild_id: int) -> tuple | None:
+        """Return (channel_id, category_id) atau None."""
+        if self._known(self.ticket, guild_id):
+            self.hits += 1
+            return self.ticket.get(guild_id)
+        self.misses += 1
+        row = await database.get_ticket_settings(guild_id)
+        self.ticket[guild_id] = row
+        return row
+
+    def _update(self, cache: dict, guild_id: int, width: int, changes: dict[int, object]):
+        if not self._known(cache, guild_id):
+            # Kolom lain belum diketahui; biar dibaca ulang saat dibutuhkan
+            cache.pop(guild_id, None)
+            return
+        row = list(cache.get(guild_id) or (None,) * width)
+        for index, value in changes.items():
+            row[index] = value
+        cache[guild_id] = tuple(row)
+
+    async def set_welcome_channel_role(self, guild_id: int, channel_id: int, role_id: int):
+        await database.set_welcome_channel_role(guild_id, channel_id, role_id)
+        self._update(self.welcome, guild_id, 3, {0: channel_id, 2: role_id})
+
+    async def set_welcome_message(self, guild_id: int, message: str):
+        await database.set_welcome_message(guild_id, message)
+        self._update(self.welcome, guild_id, 3, {1: message})
+
+    async def set_ticket_panel_channel(self, guild_id: int, channel_id: int):
+        await database.set_ticket_panel_channel(guild_id, channel_id)
+        self._update(self.ticket, guild_id, 2, {0: channel_id})
+
+    async def set_ticket_category(self, guild_id: int, category_id: int):
+        await database.set_ticket_category(guild_id, category_id)
+        self._update(self.ticket, guild_id, 2, {1: category_id})
+
+    async def set_automod(self, guild_id: int, config: AutoModConfig):
+        await database.set_automod_settings(guild_id, config.to_row())
+        self.automod[guild_id] = config
+
+    def remember_ticket_category(self, guild_id: int, category_id: int):
+        """Update cache saja; row-nya ditulis bersama insert ticket (database.insert_ticket)."""
+        self._update(self.ticket, guild_id, 2, {1: category_id})
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'guilds': len(self.welcome.keys() | self.ticket.keys() | self.automod.keys()),
+        }
+
+settings_cache = SettingsCache()
+metrics.add_collector('settings_cache', settings_cache.stats)
+
+# =====================
+# Index ticket terbuka (in-memory) + lock per user / per guild
+# =====================
+class TicketIndex:
+    """Ticket open per (guild, user) dan per channel_id, di-warm dari tabel tickets saat startup."""
+
+    def __init__(self):
+        self.by_user: dict[tuple[int | None, int], int] = {}  # (guild_id, user_id) -> channel_id
+        self.by_channel: dict[int, tuple] = {}                 # channel_id -> (guild_id, user_id, category, created_at)
+        # Weak: lock hilang sendiri begitu tidak ada yang memegang/menunggu, jadi tidak menumpuk
+        # satu lock untuk tiap user yang pernah klik tombol ticket
+        self.user_locks: weakref.WeakValueDictionary[tuple[int, int], asyncio.Lock] = weakref.WeakValueDictionary()
+        self.category_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+        self.closing: set[int] = set()  # channel yang sedang ditutup (export sampai channel terhapus)
+
+    async def load(self):
+        self.by_user.clear()
+        self.by_channel.clear()
+        for guild_id, user_id, channel_id, category, created_at in await database.list_all_open_tickets():
+            if not owns_guild(guild_id):
+                continue
+            self.add(guild_id, user_id, channel_id, category, created_at)
+
+    def add(self, guild_id: int | None, user_id: int, channel_id: int, category: str, created_at: str):
+        self.by_user[(guild_id, user_id)] = channel_id
+        self.by_channel[channel_id] = (guild_id, user_id, category, created_at)
+
+    def open_channel(self, guild_id: int, user_id: int) -> int | None:
+        channel_id = self.by_user.get((guild_id, user_id))
+        if channel_id is None:
+            # Ticket lama tanpa guild_id
+            channel_id = self.by_user.get((None, user_id))
+        return channel_id
+
+    def list_for_user(self, user_id: int) -> list[tuple]:
+        """Return list (channel_id, category, created_at)."""
+        return [(channel_id, category, created_at)
+                for channel_id, (_, owner, category, created_at) in self.by_channel.items() if owner == user_id]
+
+    def assign_guild(self, channel_id: int, guild_id: int):
+        """Pindahkan ticket lama (tanpa guild_id) ke key guild-nya setelah backfill."""
+        entry = self.by_channel.get(channel_id)
+        if entry is None or entry[0] is not None:
+            return
+        _, user_id, category, created_at = entry
+        if self.by_user.get((None, user_id)) == channel_id:
+            del self.by_user[(None, user_id)]
+        self.add(guild_id, user_id, channel_id, category, created_at)
+
+    def remove(self, channel_id: int) -> bool:
+        entry = self.by_channel.pop(channel_id, None)
+        if entry is None:
+            return False
+        guild_id, user_id = entry[:2]
+        if self.by_user.get((guild_id, user_id)) == channel_id:
+            del self.by_user[(guild_id, user_id)]
+        return True
+
+    def user_lock(self, guild_id: int, user_id: int) -> asyncio.Lock:
+        # Double click tombol ticket: klik kedua menunggu klik pertama selesai lalu melihat ticket-nya
+        return self.user_locks.setdefault((guild_id, user_id), asyncio.Lock())
+
+    def category_lock(self, guild_id: int) -> asyncio.Lock:
+        return self.category_locks.setdefault(guild_id, asyncio.Lock())
+
+ticket_index = TicketIndex()
+
+# =====================
+# Message counter buffer (write-behind)
+# =====================
+class MessageCounterBuffer:
+    """Kumpulkan increment messages_sent di memori, lalu tulis dalam satu transaksi per flush."""
+
+    def __init__(self, flush_interval: float, max_size: int):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.pending: dict[tuple[int, int], list] = {}   # (guild_id, user_id) -> [username, count, {jam: count}]
+        self.flushing: dict[tuple[int, int], list] = {}  # batch yang sedang ditulis (masih dihitung saat dibaca)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def add(self, guild_id: int, user_id: int, username: str):
+        key = (guild_id, user_id)
+        hour = int(time.time() // 3600)
+        entry = self.pending.get(key)
+        if entry:
+            entry[0] = username
+            entry[1] += 1
+            entry[2][hour] = entry[2].get(hour, 0) + 1
+            return
+        self.pending[key] = [username, 1, {hour: 1}]
+        if len(self.pending) >= self.max_size and self._wakeup:
+            self._wakeup.set()
+
+    def pending_for(self, guild_id: int, user_id: int) -> int:
+        """Jumlah pesan user ini yang belum masuk database."""
+        count = 0
+        for batch in (self.pending, self.flushing):
+            entry = batch.get((guild_id, user_id))
+            if entry:
+                count += entry[1]
+        return count
+
+    def pending_total(self, guild_id: int) -> int:
+        return sum(entry[1] for batch in (self.pending, self.flushing)
+                   for (entry_guild, _), entry in batch.items() if entry_guild == guild_id)
+
+    def pending_user_ids(self, guild_id: int) -> list[int]:
+        return list({user_id for batch in (self.pending, self.flushing) for entry_guild, user_id in batch if entry_guild == guild_id})
+
+    async def count_new_members(self, guild_id: int) -> int:
+        """Jumlah user di buffer yang belum punya row di tabel members guild ini."""
+        user_ids = self.pending_user_ids(guild_id)
+        if not user_ids:
+            return 0
+        return len(user_ids) - await database.count_known_members(guild_id, user_ids)
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+            self.flushing, self.pending = self.pending, {}
+            try:
+                await database.apply_message_counts(self.flushing)
+                # Pesan yang pindah dari buffer ke database: angka /stats guild ini dibaca ulang
+                for guild_id, _ in self.flushing:
+                    stats_cache.invalidate(guild_id)
+            except Exception as e:
+                # Kembalikan ke buffer supaya dicoba lagi di flush berikutnya
+                for key, (username, count, hours) in self.flushing.items():
+                    entry = self.pending.setdefault(key, [username, 0, {}])
+                    entry[1] += count
+                    for hour, n in hours.items():
+                        entry[2][hour] = entry[2].get(hour, 0) + n
+                print(f"Error flushing message counters: {e}")
+                return 0
+            finally:
+                flushed = len(self.flushing)
+                self.flushing = {}
+            return flushed
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        if self._task and not self._task.done():
+            self._wakeup.set()
+            await self._task
+        await self.flush()
+
+message_buffer = MessageCounterBuffer(MESSAGE_FLUSH_INTERVAL, MESSAGE_BUFFER_MAX)
+
+class CounterReconciler:
+    """Job berkala yang mencocokkan guild_counters dengan tabel dasar dan melaporkan selisihnya."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.runs = 0
+        self.drifted_guilds = 0
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> dict[int, tuple]:
+        drift = await database.reconcile_counters()
+        if drift:
+            stats_cache.clear()
+        self.runs += 1
+        self.drifted_guilds += len(drift)
+        for guild_id, (members, open_tickets, closed_tickets, messages) in drift.items():
+            print(f"Counter guild {guild_id} meleset dan diperbaiki: members {members:+}, open {open_tickets:+}, "
+                  f"closed {closed_tickets:+}, messages {messages:+}")
+        return drift
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error reconciling counters: {e}")
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+counter_reconciler = CounterReconciler(COUNTER_RECONCILE_INTERVAL)
+
+class GuildStatsCache:
+    """Angka /stats per guild di memori, supaya /stats tidak ke database sama sekali di kondisi normal.
+
+    Counter dijaga trigger SQLite (bisa di proses write service), jadi di sini hanya disimpan hasil
+    bacaannya. Write path di proses ini (flush pesan, join, buka/tutup ticket) membuang entry guild
+    yang berubah; ttl menutup perubahan dari proses lain (rekonsiliasi di cluster 0).
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.results: dict[int, tuple[float, tuple]] = {}  # guild_id -> (expires_at, (members, open, closed, messages))
+        self.cluster: tuple[float, tuple] | None = None     # (expires_at, (cluster, guild, member))
+        self.hits = 0
+        self.misses = 0
+
+    async def counters(self, guild_id: int) -> tuple[int, int, int, int]:
+        """Return (members, open_tickets, closed_tickets, messages), termasuk member baru yang masih di buffer."""
+        now = time.monotonic()
+        cached = self.results.get(guild_id)
+        if cached and cached[0] > now:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        members, open_tickets, closed_tickets, messages = await database.get_guild_counters(guild_id)
+        members += await message_buffer.count_new_members(guild_id)
+        result = (members, open_tickets, closed_tickets, messages)
+        self.results[guild_id] = (now + self.ttl, result)
+        return result
+
+    async def cluster_totals(self) -> tuple[int, int, int]:
+        # Laporan cluster hanya berubah tiap heartbeat
+        now = time.monotonic()
+        if self.cluster is None or self.cluster[0] <= now:
+            self.cluster = (now + CLUSTER_HEARTBEAT_INTERVAL, await database.cluster_totals(CLUSTER_HEARTBEAT_INTERVAL * 3))
+        return self.cluster[1]
+
+    def invalidate(self, guild_id: int | None):
+        self.results.pop(guild_id, None)
+
+    def clear(self):
+        self.results.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'guilds': len(self.results)}
+
+stats_cache = GuildStatsCache(STATS_CACHE_TTL)
+metrics.add_collector('stats_cache', stats_cache.stats)
+
+class ClusterHeartbeat:
+    """Laporkan jumlah guild/member proses ini ke cluster_status supaya /stats bisa menjumlahkan semua cluster."""
+
+    def __init__(self, cluster_id: int, interval: float):
+        self.cluster_id = cluster_id
+        self.interval = interval
+        self.guilds = lambda: bot.guilds  # diganti FakeGateway saat uji lokal
+        self._task: asyncio.Task | None = None
+
+    async def report(self):
+        guilds = self.guilds()
+        latency_ms = None
+        if bot.is_ready() and bot.latency == bot.latency:  # NaN sebelum heartbeat gateway pertama
+            latency_ms = bot.latency * 1000
+        await database.report_cluster(
+            self.cluster_id, SHARD_IDS, len(guilds), sum(guild.member_count or 0 for guild in guilds), latency_ms
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await self.report()
+            except Exception as e:
+                print(f"Error reporting cluster status: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.report()
+        except Exception:
+            pass
+
+cluster_heartbeat = ClusterHeartbeat(CLUSTER_ID, CLUSTER_HEARTBEAT_INTERVAL)
+
+# =====================
+# Rollup aktivitas: /leaderboard & /activity
+# =====================
+LEADERBOARD_PERIODS = {'day': "24 jam terakhir", 'week': "7 hari terakhir", 'all': "Sepanjang waktu"}
+
+class ActivityRollups:
+    """Top-K dan ringkasan aktivitas per guild, dihitung dari rollup lalu disimpan di memori selama ttl detik.
+
+    Rollup jam dari hari yang sudah lewat (lebih dari kemarin) dipadatkan ke rollup harian tiap jam.
+    """
+
+    COMPACT_INTERVAL = 3600
+
+    def __init__(self, top_k: int, ttl: float, daily_retention: int):
+        self.top_k = top_k
+        self.ttl = ttl
+        self.daily_retention = daily_retention
+        self.results: dict[tuple, tuple[float, object]] = {}  # (jenis, guild_id, periode) -> (expires_at, hasil)
+        self.hits = 0
+        self.misses = 0
+        self.compacted_rows = 0
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def current_hour() -> int:
+        return int(time.time() // 3600)
+
+    async def _cached(self, key: tuple, compute):
+        now = time.monotonic()
+        cached = self.results.get(key)
+        if cached and cached[0] > now:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        result = await compute()
+        self.results[key] = (now + self.ttl, result)
+        return result
+
+    async def leaderboard(self, guild_id: int, period: str) -> list[tuple[int, int]]:
+        """Return list (user_id, jumlah pesan) terurut, maksimal top_k."""
+        async def compute():
+            if period == 'all':
+                return [tuple(row) for row in await database.top_members(guild_id, self.top_k)]
+            hour = self.current_hour()
+            if period == 'day':
+                totals = await database.activity_by_user(guild_id, hour - 23)
+            else:
+                # 7 hari kalender (UTC) termasuk hari ini: jam yang belum dipadatkan + rollup harian
+                since_day = hour // 24 - 6
+                totals = await database.activity_by_user(guild_id, since_day * 24, since_day)
+            return heapq.nlargest(self.top_k, totals.items(), key=lambda item: item[1])
+        return await self._cached(('leaderboard', guild_id, period), compute)
+
+    async def summary(self, guild_id: int) -> dict:
+        """Return dict: total 24 jam & 7 hari, jam tersibuk, dan jumlah pesan per hari (7 hari)."""
+        async def compute():
+            hour = self.current_hour()
+            today = hour // 24
+            hourly, daily = await database.activity_by_bucket(guild_id, (today - 6) * 24, today - 6)
+            per_day = {day: 0 for day in range(today - 6, today + 1)}
+            for day, messages in daily.items():
+                per_day[day] += messages
+            for bucket, messages in hourly.items():
+                per_day[bucket // 24] += messages
+            last_day = {bucket: messages for bucket, messages in hourly.items() if bucket > hour - 24}
+            busiest = max(last_day.items(), key=lambda item: item[1]) if last_day else None
+            return {
+                'last_24h': sum(last_day.values()),
+                'last_7d': sum(per_day.values()),
+                'busiest_hour': busiest,
+                'per_day': per_day,
+            }
+        return await self._cached(('summary', guild_id, None), compute)
+
+    async def compact(self) -> int:
+        # Rollup jam untuk hari ini dan kemarin tetap utuh (dipakai leaderboard 24 jam)
+        today = self.current_hour() // 24
+        moved = await database.compact_activity((today - 1) * 24, today - self.daily_retention)
+        self.compacted_rows += moved
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"Error compacting activity rollups: {e}")
+            await asyncio.sleep(self.COMPACT_INTERVAL)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'cached_results': len(self.results),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'compacted_rows': self.compacted_rows,
+        }
+
+activity_rollups = ActivityRollups(LEADERBOARD_SIZE, LEADERBOARD_TTL, ACTIVITY_DAILY_RETENTION)
+metrics.add_collector('activity_rollups', activity_rollups.stats)
+
+# =====================
+# Welcome pipeline (batch insert, welcome digabung saat raid)
+# =====================
+def render_welcome_message(template: str | None, member: discord.Member) -> str:
+    message = (template or "🎉 Selamat datang {user} di {guild}!")
+    # Template placeholders
+    return (message
+            .replace('{user}', member.mention)
+            .replace('{username}', member.name)
+            .replace('{guild}', member.guild.name)
+            .replace('{member_count}', str(member.guild.member_count)))
+
+class WelcomePipeline:
+    """Antrian join member: insert per batch, welcome digabung saat join beruntun, role lewat worker ber-rate."""
+
+    EMBEDS_PER_MESSAGE = SendScheduler.EMBEDS_PER_MESSAGE
+
+    def __init__(self, batch_interval: float, coalesce_threshold: int, mention_max: int, role_rate: float):
+        self.batch_interval = batch_interval
+        self.coalesce_threshold = coalesce_threshold
+        self.mention_max = mention_max
+        self.role_interval = 1 / role_rate if role_rate > 0 else 0.0
+        self.joins: deque[tuple[discord.Member, float]] = deque()       # (member, waktu join)
+        self.roles: deque[tuple[discord.Member, int, float]] = deque()  # (member, role_id, waktu join)
+        self.latency: dict[str, deque] = {'welcome': deque(maxlen=500), 'role': deque(maxlen=500)}
+        self.processed = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.role_failures = 0
+        self._wakeup: asyncio.Event | None = None
+        self._role_wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._role_task: asyncio.Task | None = None
+        self._closing = False
+
+    def add(self, member: discord.Member):
+        self.joins.append((member, time.monotonic()))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def process(self, batch: list[tuple[discord.Member, float]]):
+        now = datetime.now().isoformat()
+        try:
+            await database.add_members([(member.id, member.guild.id, str(member), now) for member, _ in batch])
+            for guild_id in {member.guild.id for member, _ in batch}:
+                stats_cache.invalidate(guild_id)
+        except Exception as e:
+            metrics.error('welcome_insert', e)
+            print(f"Error inserting joined members: {e}")
+        by_guild: dict[int, list[tuple[discord.Member, float]]] = {}
+        for member, joined in batch:
+            by_guild.setdefault(member.guild.id, []).append((member, joined))
+        await asyncio.gather(*(self._welcome_guild(items) for items in by_guild.values()))
+        self.processed += len(batch)
+        self.batches += 1
+
+    async def _welcome_guild(self, items: list[tuple[discord.Member, float]]):
+        guild = items[0][0].guild
+        welcome_settings = await settings_cache.get_welcome(guild.id)
+        if not welcome_settings:
+            return
+        channel_id, welcome_message, role_id = welcome_settings
+        if role_id:
+            self.roles.extend((member, role_id, joined) for member, joined in items)
+            self._role_wakeup.set()
+        channel = guild.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            return
+
+        if len(items) >= self.coalesce_threshold:
+            print(f"Welcome digabung untuk {len(items)} member baru di {guild.name}")
+            embeds = [self._coalesced_embed(guild, [member for member, _ in items])]
+            self.coalesced += 1
+        else:
+            embeds = [self._member_embed(welcome_message, member) for member, _ in items]
+        joined_at = [joined for _, joined in items]
+        for i in range(0, len(embeds), self.EMBEDS_PER_MESSAGE):
+            sent = send_scheduler.submit(channel, channel_id=channel.id, merge=True, embeds=embeds[i:i + self.EMBEDS_PER_MESSAGE])
+            sent.add_done_callback(lambda f: self._record_welcome(f, joined_at))
+
+    def _record_welcome(self, future: asyncio.Future, joined_at: list[float]):
+        if not future.cancelled() and future.exception() is None:
+            done = time.monotonic()
+            self.latency['welcome'].extend(done - joined for joined in joined_at)
+
+    @staticmethod
+    def _member_embed(template: str | None, member: discord.Member) -> discord.Embed:
+        embed = discord.Embed(title="Selamat Datang!", description=render_welcome_message(template, member), color=discord.Color.green())
+        embed.set_thumbnail(url=member.display_avatar.url)
+        embed.add_field(name="Member #", value=member.guild.member_count)
+        return embed
+
+    def _coalesced_embed(self, guild: discord.Guild, members: list[discord.Member]) -> discord.Embed:
+        shown = members[-self.mention_max:]
+        mentions = ", ".join(member.mention for member in shown)
+        if len(members) > len(shown):
+            mentions += f" dan {len(members) - len(shown)} lainnya"
+        embed = discord.Embed(title="Selamat Datang!", description=f"🎉 Selamat datang {mentions} di {guild.name}!", color=discord.Color.green())
+        embed.add_field(name="Member Baru", value=len(members))
+        embed.add_field(name="Member #", value=guild.member_count)
+        return embed
+
+    async def _run(self):
+        while not self._closing or self.joins:
+            if not self.joins:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            # Tunggu sebentar supaya join yang datang beruntun masuk satu batch
+            if not self._closing:
+                await asyncio.sleep(self.batch_interval)
+            batch = list(self.joins)
+            self.joins.clear()
+            try:
+                await self.process(batch)
+            except Exception as e:
+                metrics.error('welcome_batch', e)
+                print(f"Error processing welcome batch: {e}")
+
+    async def _run_roles(self):
+        while not self._closing:
+            if not self.roles:
+                await self._role_wakeup.wait()
+                self._role_wakeup.clear()
+                continue
+            member, role_id, joined = self.roles.popleft()
+            role = member.guild.get_role(role_id)
+            if role:
+                try:
+                    await member.add_roles(role, reason="Auto welcome role")
+                    self.latency['role'].append(time.monotonic() - joined)
+                except Exception as e:
+                    self.role_failures += 1
+                    metrics.error('welcome_role', e)
+            # Jaga jarak antar request supaya tidak menabrak rate limit saat raid
+            if self.role_interval:
+                await asyncio.sleep(self.role_interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._role_wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            self._role_task = asyncio.create_task(self._run_roles())
+
+    async def close(self):
+        self._closing = True
+        if self._task and not self._task.done():
+            self._wakeup.set()
+            await self._task
+        if self._role_task and not self._role_task.done():
+            self._role_wakeup.set()
+            await self._role_task
+        if self.roles:
+            print(f"Welcome role dibatalkan untuk {len(self.roles)} member karena shutdown")
+
+    def stats(self) -> dict:
+        result = {
+            'queue_depth': len(self.joins),
+            'role_queue_depth': len(self.roles),
+            'processed': self.processed,
+            'batches': self.batches,
+            'coalesced': self.coalesced,
+            'role_failures': self.role_failures,
+        }
+        for stage, samples in self.latency.items():
+            ordered = sorted(samples)
+            result[f'{stage}_p50_ms'] = ordered[len(ordered) // 2] * 1000 if ordered else 0.0
+            result[f'{stage}_max_ms'] = ordered[-1] * 1000 if ordered else 0.0
+        return result
+
+welcome_pipeline = WelcomePipeline(WELCOME_BATCH_INTERVAL, WELCOME_COALESCE_THRESHOLD, WELCOME_MENTION_MAX, ROLE_ASSIGN_RATE)
+metrics.add_collector('welcome', welcome_pipeline.stats)
 
 # =====================
 # Music player setup (yt_dlp + FFmpeg)
 # =====================
-yt_dlp.utils.bug_reports_message = lambda: ''
 ytdl_format_options = {
     'format': 'bestaudio/best',
     'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
@@ -115,41 +2240,893 @@ ffmpeg_options = {
     'options': '-vn'
 }
 
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+_ytdl = None
+
+def load_yt_dlp():
+    """Import yt_dlp saat pertama dibutuhkan; import + YoutubeDL() memakan ratusan ms yang tidak perlu kalau musik tidak dipakai."""
+    import yt_dlp
+    yt_dlp.utils.bug_reports_message = lambda: ''
+    return yt_dlp
+
+def get_ytdl():
+    """Instance YoutubeDL bersama (per proses), dibuat saat extraction pertama."""
+    global _ytdl
+    if _ytdl is None:
+        # Dua thread bisa sama-sama membuat instance di awal; yang satu dibuang, tidak masalah
+        _ytdl = load_yt_dlp().YoutubeDL(ytdl_format_options)
+    return _ytdl
+
+# Playlist: extraction "flat" (id/judul saja), tiap lagu baru di-resolve saat sampai di depan queue
+ytdl_playlist_options = {**ytdl_format_options, 'noplaylist': False, 'extract_flat': 'in_playlist'}
+
+PLAYLIST_URL = re.compile(r'(?:/playlist\?|[?&]list=)')
+VIDEO_URL_PARAM = re.compile(r'[?&]v=')
+
+def is_playlist_url(query: str) -> bool:
+    # Link video di dalam playlist (watch?v=...&list=...) tetap diputar sebagai satu lagu (noplaylist)
+    return query.startswith(('http://', 'https://')) and bool(PLAYLIST_URL.search(query)) and not VIDEO_URL_PARAM.search(query)
+
+# =====================
+# Cache metadata yt_dlp (query -> video id -> info)
+# =====================
+class MetadataCache:
+    """LRU + TTL untuk hasil extract_info supaya /play yang berulang tidak perlu extract lagi."""
+
+    # Hanya field yang dipakai bot; info lengkap yt_dlp (daftar format dll) terlalu besar untuk di-cache
+    KEEP_FIELDS = ('id', 'title', 'webpage_url', 'original_url', 'duration', 'url', 'acodec', 'ext', 'http_headers', 'extractor')
+    STREAM_MARGIN = 60  # detik sebelum expire URL stream dianggap basi
+    YOUTUBE_ID = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/)|youtu\.be/)([\w-]{11})')
+    STREAM_EXPIRE = re.compile(r'[?&/]expire[=/](\d+)')
+
+    def __init__(self, max_entries: int, ttl: float, persist: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.queries: OrderedDict[str, tuple[str, float]] = OrderedDict()          # key -> (video_id, expires_at)
+        self.entries: OrderedDict[str, tuple[dict, float, float]] = OrderedDict()  # video_id -> (info, expires_at, stream_expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.stale_streams = 0
+
+    @classmethod
+    def normalize(cls, query: str) -> str:
+        query = query.strip()
+        match = cls.YOUTUBE_ID.search(query)
+        if match:
+            return f'id:{match.group(1)}'
+        if query.startswith(('http://', 'https://')):
+            return f'url:{query}'
+        return 'q:' + ' '.join(query.lower().split())
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+    def _stream_expiry(self, info: dict, now: float) -> float:
+        match = self.STREAM_EXPIRE.search(info.get('url') or '')
+        if match:
+            return int(match.group(1)) - self.STREAM_MARGIN
+        return now + self.ttl
+
+    def _lookup_id(self, key: str, now: float) -> str | None:
+        if key.startswith('id:'):
+            return key[3:]
+        entry = self.queries.get(key)
+        if not entry:
+            return None
+        if entry[1] <= now:
+            del self.queries[key]
+            return None
+        self.queries.move_to_end(key)
+        return entry[0]
+
+    def get(self, query: str, *, need_stream: bool = True) -> dict | None:
+        now = time.time()
+        video_id = self._lookup_id(self.normalize(query), now)
+        entry = self.entries.get(video_id) if video_id else None
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                del self.entries[video_id]
+            self.misses += 1
+            return None
+        if need_stream and entry[2] <= now:
+            # Metadata masih valid tapi URL stream sudah kedaluwarsa
+            self.stale_streams += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(video_id)
+        self.hits += 1
+        return dict(entry[0])
+
+    def put(self, query: str, info: dict):
+        video_id = info.get('id')
+        if not video_id:
+            return
+        now = time.time()
+        info = {field: info[field] for field in self.KEEP_FIELDS if field in info}
+        expires_at = now + self.ttl
+        stream_expires_at = self._stream_expiry(info, now)
+        # Query asli dan webpage_url sama-sama jadi key, supaya resolve ulang dari Track juga kena cache
+        keys = {self.normalize(query)}
+        if info.get('webpage_url'):
+            keys.add(self.normalize(info['webpage_url']))
+        keys = [key for key in keys if not key.startswith('id:')]
+        for key in keys:
+            self.queries[key] = (video_id, expires_at)
+            self.queries.move_to_end(key)
+        while len(self.queries) > self.max_entries * 2:
+            self.queries.popitem(last=False)
+        self.entries[video_id] = (info, expires_at, stream_expires_at)
+        self.entries.move_to_end(video_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if self.persist:
+            asyncio.create_task(self._save(keys, video_id, info, expires_at, stream_expires_at))
+
+    async def _save(self, keys: list[str], video_id: str, info: dict, expires_at: float, stream_expires_at: float):
+        statements = [(
+            'INSERT OR REPLACE INTO ytdl_metadata (video_id, info, expires_at, stream_expires_at) VALUES (?, ?, ?, ?)',
+            (video_id, json.dumps(info), expires_at, stream_expires_at)
+        )]
+        for key in keys:
+            statements.append(('INSERT OR REPLACE INTO ytdl_queries (query, video_id, expires_at) VALUES (?, ?, ?)', (key, video_id, expires_at)))
+        try:
+            await database.write(statements)
+        except Exception as e:
+            print(f"Error saving ytdl cache: {e}")
+
+    async def load(self):
+        """Muat cache yang masih valid dari SQLite (hanya jika persist aktif)."""
+        if not self.persist:
+            return
+        now = time.time()
+        await database.write([
+            ('DELETE FROM ytdl_metadata WHERE expires_at <= ?', (now,)),
+            ('DELETE FROM ytdl_queries WHERE expires_at <= ?', (now,)),
+        ])
+        rows = await database.fetchall(
+            'SELECT video_id, info, expires_at, stream_expires_at FROM ytdl_metadata ORDER BY expires_at DESC LIMIT ?',
+            (self.max_entries,)
+        )
+        for video_id, info, expires_at, stream_expires_at in reversed(rows):
+            self.entries[video_id] = (json.loads(info), expires_at, stream_expires_at)
+        rows = await database.fetchall(
+            'SELECT query, video_id, expires_at FROM ytdl_queries ORDER BY expires_at DESC LIMIT ?',
+            (self.max_entries * 2,)
+        )
+        for query, video_id, expires_at in reversed(rows):
+            self.queries[query] = (video_id, expires_at)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_streams': self.stale_streams,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.entries),
+        }
+
+metadata_cache = MetadataCache(YTDL_CACHE_SIZE, YTDL_CACHE_TTL, YTDL_CACHE_PERSIST)
+metrics.add_collector('metadata_cache', metadata_cache.stats)
+
+# =====================
+# Executor khusus extraction yt_dlp
+# =====================
+class ExtractorBusy(Exception):
+    """Antrian extraction penuh; permintaan ditolak tanpa menunggu."""
+
+class ExtractionCancelled(Exception):
+    """Extraction dibatalkan karena /stop atau bot keluar dari voice."""
+
+def _extract_info_worker(url: str, download: bool, sanitize: bool) -> dict:
+    # Fungsi top-level supaya bisa di-pickle untuk mode process; tiap proses punya instance ytdl sendiri
+    ytdl = get_ytdl()
+    data = ytdl.extract_info(url, download=download)
+    if 'entries' in data:
+        data = data['entries'][0]
+    return ytdl.sanitize_info(data) if sanitize else data
+
+def _extract_playlist_page(url: str, start: int, count: int) -> tuple[str | None, list[dict]]:
+    """Ambil satu halaman entry playlist (flat). Return (judul playlist, entries)."""
+    # Instance baru per halaman: params dipakai bersama antar thread kalau instance-nya dibagi
+    with load_yt_dlp().YoutubeDL({**ytdl_playlist_options, 'playlist_items': f'{start}-{start + count - 1}'}) as ydl:
+        data = ydl.extract_info(url, download=False)
+    entries = []
+    for entry in data.get('entries') or []:
+        if not entry:
+            continue
+        entries.append({
+            'id': entry.get('id'),
+            'title': entry.get('title'),
+            'url': entry.get('url'),
+            'webpage_url': entry.get('webpage_url'),
+            'duration': entry.get('duration'),
+        })
+    return data.get('title'), entries
+
+class ExtractionExecutor:
+    """Pool terpisah dari default executor, dengan batas per guild, batas antrian, dan pembatalan."""
+
+    def __init__(self, workers: int, mode: str, per_guild: int, guild_queue_max: int, queue_max: int):
+        self.workers = workers
+        self.mode = mode
+        self.per_guild = per_guild
+        self.guild_queue_max = guild_queue_max
+        self.queue_max = queue_max
+        self._executor: concurrent.futures.Executor | None = None
+        self.pending = 0
+        self.guild_pending: dict[int, int] = {}
+        self.semaphores: dict[int, asyncio.Semaphore] = {}
+        self.futures: dict[int, set[asyncio.Future]] = {}
+        self.generations: dict[int, int] = {}
+        self.rejected = 0
+        self.cancelled = 0
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.mode == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ytdl')
+        return self._executor
+
+    def is_busy(self, guild_id: int) -> bool:
+        return self.pending >= self.queue_max or self.guild_pending.get(guild_id, 0) >= self.guild_queue_max
+
+    async def run(self, guild_id: int, url: str, *, download: bool = False) -> dict:
+        return await self.call(guild_id, _extract_info_worker, url, download, self.mode == 'process')
+
+    async def call(self, guild_id: int, func, *args):
+        """Jalankan fungsi extraction di pool dengan admission control & pembatalan per guild."""
+        if self.is_busy(guild_id):
+            self.rejected += 1
+            raise ExtractorBusy()
+        generation = self.generations.get(guild_id, 0)
+        self.pending += 1
+        self.guild_pending[guild_id] = self.guild_pending.get(guild_id, 0) + 1
+        try:
+            async with self.semaphores.setdefault(guild_id, asyncio.Semaphore(self.per_guild)):
+                if self.generations.get(guild_id, 0) != generation:
+                    raise ExtractionCancelled()
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self.executor, func, *args)
+                futures = self.futures.setdefault(guild_id, set())
+                futures.add(future)
+                started = time.perf_counter()
+                try:
+                    return await future
+                except asyncio.CancelledError:
+                    if future.cancelled() and self.generations.get(guild_id, 0) != generation:
+                        raise ExtractionCancelled()
+                    raise
+                finally:
+                    futures.discard(future)
+                    metrics.observe('extract_seconds', func.__name__.strip('_'), time.perf_counter() - started)
+        finally:
+            self.pending -= 1
+            self.guild_pending[guild_id] -= 1
+            if not self.guild_pending[guild_id]:
+                # Tidak ada lagi yang memegang/menunggu semaphore atau menyimpan generation lama:
+                # state per guild dibuang supaya tidak menumpuk satu entry untuk tiap guild yang pernah /play
+                del self.guild_pending[guild_id]
+                self.semaphores.pop(guild_id, None)
+                self.futures.pop(guild_id, None)
+                self.generations.pop(guild_id, None)
+
+    def cancel_guild(self, guild_id: int):
+        """Batalkan semua extraction milik guild ini (yang mengantri maupun yang sedang ditunggu)."""
+        if guild_id not in self.guild_pending:
+            return  # tidak ada yang perlu dibatalkan
+        self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+        for future in list(self.futures.get(guild_id, ())):
+            # Thread yang sudah jalan tidak bisa dihentikan, tapi hasilnya dibuang dan pemanggil langsung lepas
+            if future.cancel():
+                self.cancelled += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'pending': self.pending,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+        }
+
+extraction = ExtractionExecutor(EXTRACT_WORKERS, EXTRACT_MODE, EXTRACT_PER_GUILD, EXTRACT_GUILD_QUEUE_MAX, EXTRACT_QUEUE_MAX)
+metrics.add_collector('extraction', extraction.stats)
+
+# =====================
+# Cache audio di disk untuk lagu yang sering diputar
+# =====================
+def _download_audio(url: str, directory: str) -> str:
+    """Download audio ke direktori sementara, return path file hasil download."""
+    options = {**ytdl_format_options, 'outtmpl': os.path.join(directory, '%(id)s.%(ext)s')}
+    with load_yt_dlp().YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=True)
+        if 'entries' in info:
+            info = info['entries'][0]
+        return ydl.prepare_filename(info)
+
+class AudioCache:
+    """File audio per video ID dengan batas byte dan eviksi LRU.
+
+    Lagu di-download di background setelah diputar AUDIO_CACHE_MIN_PLAYS kali. File ditulis
+    ke direktori sementara lalu di-rename (atomic), jadi playback tidak pernah membaca file setengah jadi.
+    """
+
+    MAX_TRACKED_PLAYS = 10000
+
+    def __init__(self, directory: str, max_bytes: int, min_plays: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.files: OrderedDict[str, tuple[str, int]] = OrderedDict()  # video_id -> (path, size), urutan LRU
+        self.total_bytes = 0
+        self.play_counts: dict[str, int] = {}
+        self.downloading: set[str] = set()
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.downloads = 0
+        self.download_failures = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def video_id_for(url: str | None) -> str | None:
+        key = MetadataCache.normalize(url or '')
+        return key[3:] if key.startswith('id:') else None
+
+    def scan(self):
+        """Bangun index dari isi direktori (file lama = paling jarang dipakai)."""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.rmtree(os.path.join(self.directory, '.tmp'), ignore_errors=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, os.path.splitext(entry.name)[0], entry.path, stat.st_size))
+        for _, video_id, path, size in sorted(found):
+            self.files[video_id] = (path, size)
+            self.total_bytes += size
+        self._evict()
+
+    def lookup(self, video_id: str | None) -> str | None:
+        if not self.enabled or not video_id:
+            return None
+        entry = self.files.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        path, size = entry
+        self.files.move_to_end(video_id)
+        try:
+            # mtime dipakai sebagai urutan LRU saat scan ulang setelah restart
+            os.utime(path)
+        except OSError:
+            # File hilang dari luar; buang dari index
+            del self.files[video_id]
+            self.total_bytes -= size
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_served += size
+        return path
+
+    def record_play(self, data: dict):
+        video_id = data.get('id')
+        url = data.get('webpage_url')
+        if not self.enabled or not video_id or not url or video_id in self.files:
+            return
+        count = self.play_counts.get(video_id, 0) + 1
+        self.play_counts[video_id] = count
+        if len(self.play_counts) > self.MAX_TRACKED_PLAYS:
+            # Buang separuh counter terkecil supaya memori tetap terbatas
+            for key, _ in sorted(self.play_counts.items(), key=lambda item: item[1])[:self.MAX_TRACKED_PLAYS // 2]:
+                del self.play_counts[key]
+        if count >= self.min_plays and video_id not in self.downloading:
+            self.downloading.add(video_id)
+            asyncio.create_task(self._populate(video_id, url))
+
+    async def _populate(self, video_id: str, url: str):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-cache')
+        tmp_dir = os.path.join(self.directory, '.tmp', uuid.uuid4().hex)
+        try:
+            os.makedirs(tmp_dir)
+            loop = asyncio.get_running_loop()
+            downloaded = await loop.run_in_executor(self._executor, _download_audio, url, tmp_dir)
+            size = os.path.getsize(downloaded)
+            final = os.path.join(self.directory, video_id + os.path.splitext(downloaded)[1])
+            os.replace(downloaded, final)
+        except Exception as e:
+            self.download_failures += 1
+            print(f"Error caching audio {video_id}: {e}")
+            return
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self.downloading.discard(video_id)
+        self.files[video_id] = (final, size)
+        self.total_bytes += size
+        self.play_counts.pop(video_id, None)
+        self.downloads += 1
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.files:
+            video_id, (path, size) = self.files.popitem(last=False)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'files': len(self.files),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'bytes_served': self.bytes_served,
+            'downloads': self.downloads,
+            'download_failures': self.download_failures,
+            'evictions': self.evictions,
+        }
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB * 1024 * 1024, AUDIO_CACHE_MIN_PLAYS)
+metrics.add_collector('audio_cache', audio_cache.stats)
+
+class Track:
+    """Data ringan satu lagu di queue. Source FFmpeg baru dibuat saat lagu akan diputar."""
+    __slots__ = ('query', 'title', 'webpage_url', 'duration', 'requester', 'entry_id', 'position')
+
+    def __init__(self, query: str, title: str, webpage_url: str, duration: int | None, requester: int | None):
+        self.query = query
+        self.title = title
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.requester = requester  # user id
+        self.entry_id: int | None = None  # row di music_queue
+        self.position = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'query': self.query,
+            'title': self.title,
+            'webpage_url': self.webpage_url,
+            'duration': self.duration,
+            'requester': self.requester,
+        }
+
+    @classmethod
+    def from_playlist_entry(cls, entry: dict, *, requester: int | None = None):
+        url = entry.get('webpage_url') or entry.get('url')
+        if not url or not url.startswith(('http://', 'https://')):
+            url = f"https://www.youtube.com/watch?v={entry.get('id') or url}"
+        return cls(query=url, title=entry.get('title') or url, webpage_url=url, duration=entry.get('duration'), requester=requester)
+
+    @classmethod
+    def from_data(cls, data: dict, *, query: str, requester: int | None = None):
+        return cls(
+            query=query,
+            title=data.get('title') or query,
+            webpage_url=data.get('webpage_url') or data.get('original_url') or query,
+            duration=data.get('duration'),
+            requester=requester,
+        )
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000  # player meminta satu frame tiap 20 ms
+
+class PlaybackStats:
+    """Time-to-first-audio per jalur (prefetch vs on_demand) dan jumlah underrun."""
+
+    def __init__(self, samples: int = 200):
+        self.ttfa: dict[str, deque] = {'prefetch': deque(maxlen=samples), 'on_demand': deque(maxlen=samples)}
+        self.prefetch_failures = 0
+        self.underruns = 0
+        self.frames = 0
+
+    def record_ttfa(self, path: str, seconds: float):
+        self.ttfa[path].append(seconds)
+
+    def summary(self) -> dict:
+        result = {}
+        for path, samples in self.ttfa.items():
+            ordered = sorted(samples)
+            result[path] = {
+                'count': len(ordered),
+                'avg_ms': sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+                'p50_ms': ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+            }
+        result['prefetch_failures'] = self.prefetch_failures
+        result['underruns'] = self.underruns
+        result['frames'] = self.frames
+        return result
+
+playback_stats = PlaybackStats()
+metrics.add_collector('playback', playback_stats.summary)
+
+class _PlaybackProbe:
+    """Mixin source audio: catat time-to-first-audio dan underrun (frame yang datang lebih lambat dari 20 ms)."""
+    ttfa_start: float | None = None
+    ttfa_path = 'on_demand'
+
+    def read(self) -> bytes:
+        # Dipanggil dari thread player, sekali per frame
+        started = time.perf_counter()
+        frame = super().read()
+        if self.ttfa_start is not None:
+            # Frame pertama = audio pertama yang terkirim; termasuk start FFmpeg, jadi bukan underrun
+            playback_stats.record_ttfa(self.ttfa_path, time.perf_counter() - self.ttfa_start)
+            self.ttfa_start = None
+        elif frame and time.perf_counter() - started > FRAME_SECONDS:
+            playback_stats.underruns += 1
+        playback_stats.frames += 1
+        return frame
+
+class YTDLSource(_PlaybackProbe, discord.PCMVolumeTransformer):
+    """Jalur PCM (fallback): decode ke PCM, volume di Python, encode Opus oleh library."""
+
+    def __init__(self, source, *, data, volume=MUSIC_VOLUME):
         super().__init__(source, volume)
         self.data = data
         self.title = data.get('title')
         self.url = data.get('url')
 
+    @staticmethod
+    async def extract(url, *, guild_id=0, download=False, need_stream=True) -> dict:
+        if not download:
+            cached = metadata_cache.get(url, need_stream=need_stream)
+            if cached:
+                return cached
+        data = await extraction.run(guild_id, url, download=download)
+        if not download:
+            metadata_cache.put(url, data)
+        return data
+
+    @classmethod
+    async def from_track(cls, track: Track, *, guild_id=0) -> discord.AudioSource:
+        video_id = audio_cache.video_id_for(track.webpage_url)
+        if video_id and video_id in audio_cache.files:
+            # Ada di cache disk: tidak perlu extraction sama sekali
+            data = {'id': video_id, 'title': track.title, 'webpage_url': track.webpage_url, 'duration': track.duration}
+            return await create_audio_source(data)
+        # Resolve ulang tepat sebelum diputar supaya URL stream tidak kedaluwarsa
+        data = await cls.extract(track.webpage_url, guild_id=guild_id)
+        return await create_audio_source(data)
+
+    @classmethod
+    async def from_url(cls, url, *, guild_id=0, stream=False) -> discord.AudioSource:
+        data = await cls.extract(url, guild_id=guild_id, download=not stream)
+        filename = data['url'] if stream else get_ytdl().prepare_filename(data)
+        return await create_audio_source(data, filename)
+
+class YTDLOpusSource(_PlaybackProbe, discord.FFmpegOpusAudio):
+    """Jalur Opus: FFmpeg langsung mengeluarkan paket Opus, Python hanya meneruskan frame."""
+
+    def __init__(self, location: str, *, data: dict, passthrough: bool, volume: float = MUSIC_VOLUME):
+        options = ffmpeg_options['options']
+        if not passthrough:
+            options += f' -filter:a volume={volume}'
+        # discord.py memetakan codec 'opus' maupun 'libopus' ke "-c:a copy"; None = encode libopus
+        super().__init__(location, codec='opus' if passthrough else None, bitrate=OPUS_BITRATE, options=options)
+        self.data = data
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.passthrough = passthrough
+
+    @staticmethod
+    async def probe_codec(data: dict, location: str) -> str | None:
+        acodec = data.get('acodec')
+        if acodec and acodec != 'none':
+            return acodec
+        ext = data.get('ext') or os.path.splitext(location)[1].lstrip('.')
+        if ext == 'opus':
+            return 'opus'
+        try:
+            codec, _ = await discord.FFmpegOpusAudio.probe(location)
+        except Exception:
+            return None
+        return codec
+
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-        if 'entries' in data:
-            data = data['entries'][0]
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        source = discord.FFmpegPCMAudio(filename, **ffmpeg_options)
-        return cls(source, data=data)
+    async def create(cls, data: dict, location: str):
+        codec = await cls.probe_codec(data, location)
+        # Copy hanya bisa tanpa filter, jadi butuh volume 1.0
+        passthrough = codec == 'opus' and MUSIC_VOLUME == 1.0
+        return cls(location, data=data, passthrough=passthrough)
+
+async def create_audio_source(data: dict, location: str | None = None) -> discord.AudioSource:
+    """Buat source playback dari hasil extract_info: file cache disk jika ada, selain itu URL stream."""
+    if location is None:
+        audio_cache.record_play(data)
+        location = audio_cache.lookup(data.get('id')) or data['url']
+    if AUDIO_MODE == 'pcm':
+        return YTDLSource(discord.FFmpegPCMAudio(location, **ffmpeg_options), data=data)
+    return await YTDLOpusSource.create(data, location)
 
 # =====================
 # Music queue system (per-guild)
 # =====================
+class QueueJournal:
+    """Perubahan queue dicatat sebagai statement kecil (insert/delete/update) lalu ditulis batch ke SQLite."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.pending: list[tuple] = []
+        self.enabled = True
+        self._entry_ids = itertools.count(1)
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def new_entry_id(self) -> int:
+        return next(self._entry_ids)
+
+    def reset_entry_ids(self, last_id: int):
+        # Mode cluster: tiap cluster memakai deret id sendiri (id % CLUSTER_COUNT == CLUSTER_ID) supaya tidak bentrok
+        step = max(1, CLUSTER_COUNT)
+        self._entry_ids = itertools.count((last_id // step + 1) * step + CLUSTER_ID, step)
+
+    def record(self, sql: str, params, many: bool = False):
+        if not self.enabled:
+            return
+        self.pending.append((sql, params, True) if many else (sql, params))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await database.write(batch)
+        except Exception as e:
+            # Persistensi queue bersifat best-effort; state di memori tetap benar
+            print(f"Error writing music queue journal: {e}")
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+            # Beri jeda supaya burst (mis. halaman playlist) tergabung dalam satu transaksi
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        self.enabled = False
+
+class GuildQueue:
+    """Queue lagu satu guild di atas deque: push/pop O(1), perubahan diteruskan ke journal."""
+    MIN_GAP = 1e-6  # jarak posisi minimum sebelum dinomori ulang
+
+    def __init__(self, guild_id: int, journal: QueueJournal):
+        self.guild_id = guild_id
+        self.journal = journal
+        self.tracks: deque[Track] = deque()
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def __getitem__(self, index: int) -> Track:
+        return self.tracks[index]
+
+    def _insert_row(self, track: Track):
+        track.entry_id = self.journal.new_entry_id()
+        self.journal.record(
+            'INSERT INTO music_queue (entry_id, guild_id, position, query, title, webpage_url, duration, requester) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (track.entry_id, self.guild_id, track.position, track.query, track.title, track.webpage_url, track.duration, track.requester)
+        )
+
+    def append(self, track: Track):
+        track.position = self.tracks[-1].position + 1 if self.tracks else 0.0
+        self.tracks.append(track)
+        self._insert_row(track)
+
+    def appendleft(self, track: Track):
+        track.position = self.tracks[0].position - 1 if self.tracks else 0.0
+        self.tracks.appendleft(track)
+        self._insert_row(track)
+
+    def load(self, track: Track):
+        """Tambah track dari database tanpa mencatat ulang ke journal."""
+        self.tracks.append(track)
+
+    def popleft(self) -> Track:
+        track = self.tracks.popleft()
+        self.journal.record('DELETE FROM music_queue WHERE entry_id = ?', (track.entry_id,))
+        return track
+
+    def remove(self, index: int) -> Track:
+        track = self.tracks[index]
+        del self.tracks[index]
+        self.journal.record('DELETE FROM music_queue WHERE entry_id = ?', (track.entry_id,))
+        return track
+
+    def move(self, source: int, destination: int) -> Track:
+        track = self.tracks[source]
+        del self.tracks[source]
+        self.tracks.insert(destination, track)
+        before = self.tracks[destination - 1].position if destination > 0 else None
+        after = self.tracks[destination + 1].position if destination + 1 < len(self.tracks) else None
+        if before is None and after is None:
+            track.position = 0.0
+        elif before is None:
+            track.position = after - 1
+        elif after is None:
+            track.position = before + 1
+        elif after - before < self.MIN_GAP:
+            self._renumber()
+            return track
+        else:
+            # Posisi pecahan di antara tetangga: cukup update satu row
+            track.position = (before + after) / 2
+        self.journal.record('UPDATE music_queue SET position = ? WHERE entry_id = ?', (track.position, track.entry_id))
+        return track
+
+    def shuffle(self):
+        tracks = list(self.tracks)
+        random.shuffle(tracks)
+        self.tracks = deque(tracks)
+        self._renumber()
+
+    def _renumber(self):
+        for index, track in enumerate(self.tracks):
+            track.position = float(index)
+        self.journal.record(
+            'UPDATE music_queue SET position = ? WHERE entry_id = ?',
+            [(track.position, track.entry_id) for track in self.tracks], many=True
+        )
+
+    def clear(self):
+        self.tracks.clear()
+        self.journal.record('DELETE FROM music_queue WHERE guild_id = ?', (self.guild_id,))
+
 class QueueState:
     def __init__(self):
-        self.queues: dict[int, list[YTDLSource]] = {}
+        self.journal = QueueJournal()
+        self.queues: dict[int, GuildQueue] = {}
         self.text_channels: dict[int, int] = {}  # guild_id -> last text channel id where /play used
+        self.voice_channels: dict[int, int] = {}
+        self.sessions_to_resume: dict[int, dict | None] = {}  # guild_id -> track yang sedang diputar sebelum restart
+        self.shutting_down = False
+        self.locks: dict[int, asyncio.Lock] = {}
+        # Prefetch lagu berikutnya (lihat schedule_prefetch)
+        self.prefetch_tasks: dict[int, asyncio.Task] = {}
+        self.prefetch_due: dict[int, float] = {}               # guild_id -> loop.time() saat prefetch boleh mulai
+        self.prefetch_target: dict[int, Track] = {}            # track yang sedang di-resolve
+        self.prefetched: dict[int, tuple[Track, discord.AudioSource]] = {}
 
-    def get_queue(self, guild_id: int) -> list:
-        return self.queues.setdefault(guild_id, [])
+    async def load(self):
+        """Muat queue & session yang tersimpan (dipanggil sekali saat startup)."""
+        row = await database.fetchone('SELECT COALESCE(MAX(entry_id), 0) FROM music_queue')
+        self.journal.reset_entry_ids(row[0])
+        rows = await database.fetchall(
+            'SELECT entry_id, guild_id, position, query, title, webpage_url, duration, requester '
+            'FROM music_queue ORDER BY guild_id, position'
+        )
+        for entry_id, guild_id, position, query, title, webpage_url, duration, requester in rows:
+            if not owns_guild(guild_id):
+                continue
+            track = Track(query, title, webpage_url, duration, requester)
+            track.entry_id = entry_id
+            track.position = position
+            self.get_queue(guild_id).load(track)
+        rows = await database.fetchall('SELECT guild_id, voice_channel_id, text_channel_id, current FROM music_sessions')
+        for guild_id, voice_channel_id, text_channel_id, current in rows:
+            if not owns_guild(guild_id):
+                continue
+            if voice_channel_id:
+                self.voice_channels[guild_id] = voice_channel_id
+            if text_channel_id:
+                self.text_channels[guild_id] = text_channel_id
+            self.sessions_to_resume[guild_id] = json.loads(current) if current else None
+
+    def lock(self, guild_id: int) -> asyncio.Lock:
+        # Serialisasi start playback per guild (skip + after callback bisa jalan bersamaan)
+        return self.locks.setdefault(guild_id, asyncio.Lock())
+
+    def get_queue(self, guild_id: int) -> GuildQueue:
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = GuildQueue(guild_id, self.journal)
+        return queue
 
     def clear_queue(self, guild_id: int):
-        self.queues[guild_id] = []
+        # Kosongkan in-place: play_next yang sedang berjalan memegang referensi queue yang sama
+        self.get_queue(guild_id).clear()
+        self.drop_prefetch(guild_id)
+
+    def end_session(self, guild_id: int):
+        """Musik dihentikan: hapus queue dan session tersimpan."""
+        self.clear_queue(guild_id)
+        self.voice_channels.pop(guild_id, None)
+        self.sessions_to_resume.pop(guild_id, None)
+        self.journal.record('DELETE FROM music_sessions WHERE guild_id = ?', (guild_id,))
+
+    def _save_session(self, guild_id: int, column: str, value):
+        self.journal.record(
+            f'INSERT INTO music_sessions (guild_id, {column}) VALUES (?, ?) '
+            f'ON CONFLICT(guild_id) DO UPDATE SET {column} = excluded.{column}',
+            (guild_id, value)
+        )
+
+    def set_voice_channel(self, guild_id: int, channel_id: int):
+        if self.voice_channels.get(guild_id) != channel_id:
+            self.voice_channels[guild_id] = channel_id
+            self._save_session(guild_id, 'voice_channel_id', channel_id)
+
+    def set_now_playing(self, guild_id: int, track: Track | None):
+        self._save_session(guild_id, 'current', json.dumps(track.to_dict()) if track else None)
+
+    def drop_prefetch(self, guild_id: int):
+        task = self.prefetch_tasks.pop(guild_id, None)
+        if task and not task.done():
+            task.cancel()
+        self.prefetch_target.pop(guild_id, None)
+        self.prefetch_due.pop(guild_id, None)
+        entry = self.prefetched.pop(guild_id, None)
+        if entry:
+            entry[1].cleanup()
+
+    async def take_prefetched(self, guild_id: int, track: Track) -> discord.AudioSource | None:
+        """Ambil source hasil prefetch untuk track ini, atau None jika harus resolve on-demand."""
+        task = self.prefetch_tasks.get(guild_id)
+        if task and not task.done() and self.prefetch_target.get(guild_id) is track:
+            # Prefetch lagu ini sedang berjalan; tunggu daripada extract ulang
+            try:
+                await asyncio.shield(task)
+            except Exception:
+                pass
+        entry = self.prefetched.pop(guild_id, None)
+        self.drop_prefetch(guild_id)
+        if entry and entry[0] is track:
+            return entry[1]
+        if entry:
+            entry[1].cleanup()
+        return None
 
     def set_text_channel(self, guild_id: int, channel_id: int):
-        self.text_channels[guild_id] = channel_id
+        if self.text_channels.get(guild_id) != channel_id:
+            self.text_channels[guild_id] = channel_id
+            self._save_session(guild_id, 'text_channel_id', channel_id)
 
     def get_text_channel(self, guild: discord.Guild) -> discord.TextChannel | None:
         cid = self.text_channels.get(guild.id)
@@ -165,60 +3142,262 @@ music_state = QueueState()
 # =====================
 @bot.event
 async def on_ready():
+    # Terpanggil lagi setiap reconnect: inisialisasi sekali ada di setup_hook
     print(f'{bot.user} telah online!')
-    await init_db()
+    if not startup.reported:
+        startup.mark('gateway_ready')
+        startup.report()
+    await resume_music_sessions()
+    if not bot.guild_backfill_done:
+        bot.guild_backfill_done = True
+        try:
+            await backfill_guild_ids()
+        except Exception as e:
+            print(f"Error backfill guild_id: {e}")
+
+def command_tree_hash() -> str:
+    """Hash payload slash command; berubah jika nama/deskripsi/opsi command berubah."""
+    payload = sorted((command.to_dict() for command in bot.tree.get_commands()), key=lambda command: command['name'])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_commands_if_changed():
+    """tree.sync() hanya jika command tree berbeda dari sync terakhir (hash disimpan di bot_meta)."""
+    key = f'command_tree_hash:{bot.application_id}'
+    current = command_tree_hash()
+    if not FORCE_COMMAND_SYNC and await database.get_meta(key) == current:
+        print("Slash commands tidak berubah, sync dilewati")
+        return
     try:
-        bot.add_view(TicketOptionsView())
-        bot.add_view(CloseTicketView())
         await bot.tree.sync()
-        print("Slash commands synced successfully!")
     except Exception as e:
         print(f"Error syncing slash commands: {e}")
+        return
+    await database.set_meta(key, current)
+    print("Slash commands synced successfully!")
+
+async def backfill_guild_ids():
+    """Isi guild_id untuk members/tickets dari database sebelum migrasi v2, memakai cache guild yang sudah ready."""
+    members = await database.legacy_members()
+    tickets = await database.legacy_tickets()
+    if not members and not tickets:
+        return
+    member_guilds: dict[int, list[int]] = {}
+    user_ids = [user_id for user_id, *_ in members]
+    for guild in bot.guilds:
+        for user_id in await present_member_ids(guild, user_ids):
+            member_guilds.setdefault(user_id, []).append(guild.id)
+    ticket_guilds: dict[int, int] = {}
+    for ticket_id, channel_id in tickets:
+        channel = bot.get_channel(channel_id)
+        if channel is not None and getattr(channel, 'guild', None):
+            ticket_guilds[ticket_id] = channel.guild.id
+            ticket_index.assign_guild(channel_id, channel.guild.id)
+    await database.assign_guilds(members, member_guilds, ticket_guilds)
+    stats_cache.clear()
+    print(f"Backfill guild_id: {len(member_guilds)}/{len(members)} member, {len(ticket_guilds)}/{len(tickets)} ticket")
+
+async def fetch_members(guild: discord.Guild, user_ids: list[int]) -> dict[int, discord.Member]:
+    """Member guild untuk user_ids (yang sudah keluar tidak ada di hasil); yang tidak di cache ditanya ke Discord."""
+    found = {user_id: member for user_id in user_ids if (member := guild.get_member(user_id)) is not None}
+    if guild.chunked:
+        return found
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    for i in range(0, len(missing), 100):
+        # Batas Discord: 100 user_id per request chunk
+        members = await guild.query_members(user_ids=missing[i:i + 100], limit=100, cache=False)
+        found.update((member.id, member) for member in members)
+    return found
+
+async def present_member_ids(guild: discord.Guild, user_ids: list[int]) -> set[int]:
+    """User mana yang menjadi member guild; guild yang tidak di-chunk (MEMORY_PROFILE) ditanya ke Discord."""
+    return set(await fetch_members(guild, user_ids))
+
+@bot.event
+@instrumented('event_seconds')
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    # Channel ticket dihapus manual: tutup ticket-nya supaya user bisa membuka ticket baru
+    if ticket_index.remove(channel.id):
+        await database.close_ticket(channel.id)
+        stats_cache.invalidate(channel.guild.id)
 
-# Welcome system dengan database
+# Welcome system dengan database (diproses per batch lewat welcome_pipeline)
 @bot.event
+@instrumented('event_seconds')
 async def on_member_join(member: discord.Member):
-    async with aiosqlite.connect('bot_data.db') as db:
-        await db.execute(
-            'INSERT OR IGNORE INTO members (user_id, username, joined_at) VALUES (?, ?, ?)',
-            (member.id, str(member), datetime.now().isoformat())
-        )
-        cursor = await db.execute(
-            'SELECT channel_id, message, role_id FROM welcome_settings WHERE guild_id = ?',
-            (member.guild.id,)
-        )
-        welcome_settings = await cursor.fetchone()
-        await db.commit()
+    welcome_pipeline.add(member)
 
-    if welcome_settings:
-        channel_id, welcome_message, role_id = welcome_settings
-        # Send welcome
-        if channel_id:
-            channel = member.guild.get_channel(channel_id)
-            if channel:
-                message = (welcome_message or "🎉 Selamat datang {user} di {guild}!")
-                # Template placeholders
-                message = (message
-                           .replace('{user}', member.mention)
-                           .replace('{username}', member.name)
-                           .replace('{guild}', member.guild.name)
-                           .replace('{member_count}', str(member.guild.member_count)))
-
-                embed = discord.Embed(title="Selamat Datang!", description=message, color=discord.Color.green())
-                embed.set_thumbnail(url=member.display_avatar.url)
-                embed.add_field(name="Member #", value=member.guild.member_count)
-                try:
-                    await channel.send(embed=embed)
-                except Exception:
-                    pass
-        # Give role
-        if role_id:
-            role = member.guild.get_role(role_id)
-            if role:
-                try:
-                    await member.add_roles(role, reason="Auto welcome role")
-                except Exception:
-                    pass
+# =====================
+# Arsip transcript ticket (sebelum channel dihapus)
+# =====================
+class TranscriptArchiver:
+    """Simpan isi channel ticket ke <dir>/<guild>/<channel>-<waktu>.jsonl.gz sebelum channel dihapus.
+
+    History dibaca dan ditulis per halaman (100 pesan), jadi memori tetap kecil berapa pun
+    panjang ticket-nya. Lampiran hanya dicatat di manifest saat export, lalu di-download di
+    background setelah channel dihapus; manifest yang belum selesai dilanjutkan saat start.
+    """
+
+    PAGE_SIZE = 100  # sama dengan ukuran halaman channel.history
+    MANIFEST_SUFFIX = '.attachments.jsonl'
+
+    def __init__(self, directory: str, download_attachments: bool, concurrency: int, attachment_max_bytes: int):
+        self.directory = directory
+        self.download_attachments = download_attachments
+        self.concurrency = max(1, concurrency)
+        self.attachment_max_bytes = attachment_max_bytes
+        self.active: set[int] = set()  # channel yang sedang di-export
+        self._session: aiohttp.ClientSession | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.exported = 0
+        self.messages = 0
+        self.attachments_downloaded = 0
+        self.attachment_failures = 0
+
+    @staticmethod
+    def _record(message: discord.Message) -> dict:
+        return {
+            'id': message.id,
+            'created_at': message.created_at.isoformat(),
+            'author_id': message.author.id,
+            'author': str(message.author),
+            'bot': message.author.bot,
+            'content': message.content,
+            'embeds': [embed.to_dict() for embed in message.embeds],
+            'attachments': [{'id': a.id, 'filename': a.filename, 'size': a.size, 'url': a.url} for a in message.attachments],
+        }
+
+    @staticmethod
+    def _write_page(archive, manifest, lines: list[str], refs: list[str]):
+        if lines:
+            archive.write('\n'.join(lines) + '\n')
+        if refs:
+            manifest.write('\n'.join(refs) + '\n')
+
+    async def export(self, channel: discord.TextChannel) -> tuple[str, str | None]:
+        """Tulis seluruh history channel (lama ke baru). Return (path arsip, path manifest lampiran atau None)."""
+        base = os.path.join(self.directory, str(channel.guild.id), f"{channel.id}-{int(time.time())}")
+        path, manifest_path = base + '.jsonl.gz', base + self.MANIFEST_SUFFIX
+        attachment_dir = base + '-attachments'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.active.add(channel.id)
+        archive = manifest = None
+        count = attachments = 0
+        try:
+            # Dibuka di dalam try: kalau salah satu gagal dibuka, yang sudah terbuka tetap ditutup
+            archive = await asyncio.to_thread(gzip.open, path + '.tmp', 'wt', encoding='utf-8')
+            manifest = await asyncio.to_thread(open, manifest_path, 'w', encoding='utf-8')
+            lines, refs = [], []
+            async for message in channel.history(limit=None, oldest_first=True):
+                record = self._record(message)
+                lines.append(json.dumps(record, ensure_ascii=False))
+                if self.download_attachments:
+                    for attachment in record['attachments']:
+                        if attachment['size'] <= self.attachment_max_bytes:
+                            target = os.path.join(attachment_dir, f"{attachment['id']}-{attachment['filename']}")
+                            refs.append(json.dumps({'url': attachment['url'], 'path': target}))
+                count += 1
+                if len(lines) >= self.PAGE_SIZE:
+                    attachments += len(refs)
+                    await asyncio.to_thread(self._write_page, archive, manifest, lines, refs)
+                    lines, refs = [], []
+            attachments += len(refs)
+            await asyncio.to_thread(self._write_page, archive, manifest, lines, refs)
+        except BaseException:
+            for handle in (archive, manifest):
+                if handle is not None:
+                    await asyncio.to_thread(handle.close)
+            for leftover in (path + '.tmp', manifest_path):
+                with contextlib.suppress(OSError):
+                    os.remove(leftover)
+            raise
+        finally:
+            self.active.discard(channel.id)
+        await asyncio.to_thread(archive.close)
+        await asyncio.to_thread(manifest.close)
+        os.replace(path + '.tmp', path)
+        if not attachments:
+            os.remove(manifest_path)
+            manifest_path = None
+        self.exported += 1
+        self.messages += count
+        return path, manifest_path
+
+    def download_later(self, manifest_path: str | None):
+        """Download lampiran di background; pemanggil (close ticket) tidak ikut menunggu."""
+        if manifest_path is None:
+            return
+        task = asyncio.create_task(self._download_manifest(manifest_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _download_manifest(self, manifest_path: str):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: set[asyncio.Task] = set()
+        with open(manifest_path, encoding='utf-8') as manifest:
+            for line in manifest:
+                # Acquire sebelum membuat task: jumlah download (dan memori) dibatasi concurrency
+                await semaphore.acquire()
+                task = asyncio.create_task(self._download(json.loads(line), semaphore))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        os.remove(manifest_path)
+
+    async def _download(self, ref: dict, semaphore: asyncio.Semaphore):
+        try:
+            if os.path.exists(ref['path']):
+                return
+            os.makedirs(os.path.dirname(ref['path']), exist_ok=True)
+            if self._session is None:
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300))
+            async with self._session.get(ref['url']) as response:
+                response.raise_for_status()
+                with open(ref['path'] + '.part', 'wb') as f:
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        await asyncio.to_thread(f.write, chunk)
+            os.replace(ref['path'] + '.part', ref['path'])
+            self.attachments_downloaded += 1
+        except Exception as e:
+            self.attachment_failures += 1
+            metrics.error('transcript_attachment', e)
+        finally:
+            semaphore.release()
+
+    def start(self):
+        """Lanjutkan manifest lampiran yang terputus (restart) untuk guild milik proses ini."""
+        if not os.path.isdir(self.directory):
+            return
+        for guild_dir in os.scandir(self.directory):
+            if not guild_dir.is_dir() or not guild_dir.name.isdigit() or not owns_guild(int(guild_dir.name)):
+                continue
+            for entry in os.scandir(guild_dir.path):
+                if entry.name.endswith(self.MANIFEST_SUFFIX):
+                    self.download_later(entry.path)
+
+    async def close(self, timeout: float = 10.0):
+        if self._tasks:
+            _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                print(f"{len(pending)} download lampiran transcript dilanjutkan saat start berikutnya")
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> dict:
+        return {
+            'exported': self.exported,
+            'messages': self.messages,
+            'background_jobs': len(self._tasks),
+            'attachments_downloaded': self.attachments_downloaded,
+            'attachment_failures': self.attachment_failures,
+        }
+
+transcripts = TranscriptArchiver(TRANSCRIPT_DIR, TRANSCRIPT_ATTACHMENTS, TRANSCRIPT_DOWNLOAD_CONCURRENCY,
+                                 TRANSCRIPT_ATTACHMENT_MAX_MB * 1024 * 1024)
+metrics.add_collector('transcripts', transcripts.stats)
 
 # =====================
 # Ticket system dengan kategori khusus - DIPERBAIKI
@@ -237,54 +3416,27 @@ class TicketOptionsView(discord.ui.View):
 
     async def create_ticket(self, interaction: discord.Interaction, category_type: str):
         await interaction.response.defer(ephemeral=True)
+        async with ticket_index.user_lock(interaction.guild.id, interaction.user.id):
+            await self._create_ticket(interaction, category_type)
 
+    async def _create_ticket(self, interaction: discord.Interaction, category_type: str):
         # Cek existing ticket
-        async with aiosqlite.connect('bot_data.db') as db:
-            cursor = await db.execute(
-                'SELECT channel_id FROM tickets WHERE user_id = ? AND status = "open"',
-                (interaction.user.id,)
-            )
-            open_ticket = await cursor.fetchone()
+        open_ticket = ticket_index.open_channel(interaction.guild.id, interaction.user.id)
 
         if open_ticket:
-            channel = interaction.guild.get_channel(open_ticket[0])
+            channel = interaction.guild.get_channel(open_ticket)
             if channel:
-                await interaction.followup.send(
-                    f"❌ Kamu sudah memiliki ticket yang terbuka! Silakan gunakan {channel.mention}",
-                    ephemeral=True
-                )
+                content = f"❌ Kamu sudah memiliki ticket yang terbuka! Silakan gunakan {channel.mention}"
             else:
-                await interaction.followup.send("❌ Kamu sudah memiliki ticket yang terbuka!", ephemeral=True)
+                content = "❌ Kamu sudah memiliki ticket yang terbuka!"
+            await self.followup(interaction, content)
             return
 
-        # Dapatkan kategori dari database - DIPERBAIKI query
-        async with aiosqlite.connect('bot_data.db') as db:
-            cursor = await db.execute(
-                'SELECT category_id FROM ticket_settings WHERE guild_id = ?',
-                (interaction.guild.id,)
-            )
-            category_setting = await cursor.fetchone()
-
-        category_id = category_setting[0] if category_setting else None
-
-        if category_id:
-            category = interaction.guild.get_channel(category_id)
-            if not category or not isinstance(category, discord.CategoryChannel):
-                category = await self.create_ticket_category(interaction.guild)
-                async with aiosqlite.connect('bot_data.db') as db:
-                    await db.execute(
-                        'UPDATE ticket_settings SET category_id = ? WHERE guild_id = ?',
-                        (category.id, interaction.guild.id)
-                    )
-                    await db.commit()
-        else:
-            category = await self.create_ticket_category(interaction.guild)
-            async with aiosqlite.connect('bot_data.db') as db:
-                await db.execute(
-                    'INSERT OR REPLACE INTO ticket_settings (guild_id, category_id) VALUES (?, ?)',
-                    (interaction.guild.id, category.id)
-                )
-                await db.commit()
+        try:
+            category, new_category_id = await self.get_ticket_category(interaction.guild)
+        except discord.Forbidden:
+            await self.followup(interaction, "❌ Saya tidak memiliki izin untuk membuat channel!")
+            return
 
         # Setup permissions untuk ticket channel
         overwrites = {
@@ -300,19 +3452,30 @@ class TicketOptionsView(discord.ui.View):
                 overwrites=overwrites
             )
         except discord.Forbidden:
-            await interaction.followup.send("❌ Saya tidak memiliki izin untuk membuat channel!", ephemeral=True)
+            await self.persist_category(interaction.guild.id, new_category_id)
+            await self.followup(interaction, "❌ Saya tidak memiliki izin untuk membuat channel!")
             return
         except Exception as e:
-            await interaction.followup.send(f"❌ Error membuat channel: {str(e)}", ephemeral=True)
+            await self.persist_category(interaction.guild.id, new_category_id)
+            metrics.error('create_ticket', e)
+            await self.followup(interaction, f"❌ Error membuat channel: {str(e)}")
             return
 
-        # Simpan ke database
-        async with aiosqlite.connect('bot_data.db') as db:
-            await db.execute(
-                'INSERT INTO tickets (user_id, channel_id, created_at, category) VALUES (?, ?, ?, ?)',
-                (interaction.user.id, ticket_channel.id, datetime.now().isoformat(), category_type)
-            )
-            await db.commit()
+        # Simpan ke database: ticket + kategori baru (jika ada) dalam satu transaksi
+        created_at = datetime.now().isoformat()
+        ticket_index.add(interaction.guild.id, interaction.user.id, ticket_channel.id, category_type, created_at)
+        try:
+            await database.insert_ticket(interaction.guild.id, interaction.user.id, ticket_channel.id, created_at,
+                                         category_type, new_category_id)
+            stats_cache.invalidate(interaction.guild.id)
+        except Exception as e:
+            # Tanpa row di database ticket ini tidak bisa ditutup dengan benar: jangan tinggalkan channel yatim
+            ticket_index.remove(ticket_channel.id)
+            with contextlib.suppress(discord.HTTPException):
+                await ticket_channel.delete()
+            metrics.error('create_ticket', e)
+            await self.followup(interaction, f"❌ Error membuat channel: {str(e)}")
+            return
 
         # Kirim embed
         if category_type == "beli":
@@ -331,13 +3494,39 @@ class TicketOptionsView(discord.ui.View):
 
         view = CloseTicketView()
         try:
-            await ticket_channel.send(embed=embed, view=view)
-            await interaction.followup.send(f"✅ Ticket berhasil dibuat! {ticket_channel.mention}", ephemeral=True)
+            await send_scheduler.submit(ticket_channel, channel_id=ticket_channel.id, embed=embed, view=view)
+            await self.followup(interaction, f"✅ Ticket berhasil dibuat! {ticket_channel.mention}")
         except Exception as e:
-            await interaction.followup.send(
-                f"✅ Ticket dibuat di {ticket_channel.mention}, tapi ada error mengirim embed: {str(e)}",
-                ephemeral=True
-            )
+            metrics.error('create_ticket_embed', e)
+            await self.followup(interaction, f"✅ Ticket dibuat di {ticket_channel.mention}, tapi ada error mengirim embed: {str(e)}")
+
+    @staticmethod
+    async def followup(interaction: discord.Interaction, content: str):
+        try:
+            # Follow-up lewat webhook interaction, bukan bucket channel: antrian per interaction,
+            # supaya klik bersamaan di satu panel tidak saling menunggu 5 pesan / 5 detik
+            await send_scheduler.submit(interaction.followup, channel_id=interaction.id,
+                                        priority=PRIORITY_FOLLOWUP, content=content, ephemeral=True)
+        except Exception:
+            pass
+
+    async def get_ticket_category(self, guild: discord.Guild) -> tuple[discord.CategoryChannel, int | None]:
+        """Return (kategori, id kategori baru yang belum tersimpan di database atau None)."""
+        # Satu lock per guild supaya klik bersamaan tidak membuat beberapa kategori "🎫 Tickets"
+        async with ticket_index.category_lock(guild.id):
+            ticket_setting = await settings_cache.get_ticket(guild.id)
+            category_id = ticket_setting[1] if ticket_setting else None
+            category = guild.get_channel(category_id) if category_id else None
+            if isinstance(category, discord.CategoryChannel):
+                return category, None
+            category = await self.create_ticket_category(guild)
+            settings_cache.remember_ticket_category(guild.id, category.id)
+            return category, category.id
+
+    @staticmethod
+    async def persist_category(guild_id: int, category_id: int | None):
+        if category_id is not None:
+            await database.set_ticket_category(guild_id, category_id)
 
     async def create_ticket_category(self, guild: discord.Guild):
         overwrites = {
@@ -354,15 +3543,33 @@ class CloseTicketView(discord.ui.View):
     @discord.ui.button(label="🔒 Tutup Ticket", style=discord.ButtonStyle.danger, custom_id="persistent_close_ticket")
     async def close_ticket(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
-        async with aiosqlite.connect('bot_data.db') as db:
-            await db.execute('UPDATE tickets SET status = "closed" WHERE channel_id = ?', (interaction.channel.id,))
-            await db.commit()
+        channel_id = interaction.channel.id
+        if channel_id in ticket_index.closing:
+            return  # klik lain sedang menutup ticket ini
+        # Ditahan sampai channel terhapus, bukan hanya selama export: klik kedua yang datang
+        # setelah export selesai tidak boleh meng-export dan menghapus ulang
+        ticket_index.closing.add(channel_id)
         try:
-            await interaction.channel.delete()
-        except discord.Forbidden:
-            await interaction.followup.send("❌ Saya tidak memiliki izin untuk menghapus channel ini!", ephemeral=True)
-        except Exception as e:
-            await interaction.followup.send(f"❌ Error menghapus channel: {str(e)}", ephemeral=True)
+            # Arsip dulu; channel tidak dihapus kalau transcript gagal disimpan
+            try:
+                transcript_path, manifest_path = await transcripts.export(interaction.channel)
+            except Exception as e:
+                metrics.error('transcript', e)
+                await TicketOptionsView.followup(interaction, f"❌ Gagal menyimpan transcript, channel tidak dihapus: {str(e)}")
+                return
+            if ticket_index.remove(channel_id):
+                await database.close_ticket(channel_id, transcript_path)
+                stats_cache.invalidate(interaction.guild.id)
+            try:
+                await interaction.channel.delete()
+            except discord.Forbidden:
+                await TicketOptionsView.followup(interaction, "❌ Saya tidak memiliki izin untuk menghapus channel ini!")
+            except Exception as e:
+                await TicketOptionsView.followup(interaction, f"❌ Error menghapus channel: {str(e)}")
+        finally:
+            ticket_index.closing.discard(channel_id)
+        # Lampiran menyusul di background, close tidak menunggu download
+        transcripts.download_later(manifest_path)
 
 # =====================
 # Dashboard & Setup Commands
@@ -401,9 +3608,7 @@ class DashboardView(discord.ui.View):
                 panel = discord.Embed(title="🎫 Ticket System", description="Klik tombol di bawah untuk membuka ticket:", color=discord.Color.blue())
                 view_panel = TicketOptionsView()
                 await channel.send(embed=panel, view=view_panel)
-                async with aiosqlite.connect('bot_data.db') as db:
-                    await db.execute('INSERT OR REPLACE INTO ticket_settings (guild_id, channel_id) VALUES (?, ?)', (inner_interaction.guild.id, channel_id))
-                    await db.commit()
+                await settings_cache.set_ticket_panel_channel(inner_interaction.guild.id, channel_id)
                 await inner_interaction.response.edit_message(content=f"✅ Panel ticket berhasil dipasang di {channel.mention}!", embed=None, view=None)
 
         select.callback = select_callback
@@ -443,9 +3648,7 @@ class DashboardView(discord.ui.View):
                     role_id = int(role_select.values[0])
                     role = role_interaction.guild.get_role(role_id)
                     if role:
-                        async with aiosqlite.connect('bot_data.db') as db:
-                            await db.execute('INSERT OR REPLACE INTO welcome_settings (guild_id, channel_id, role_id) VALUES (?, ?, ?)', (role_interaction.guild.id, channel_id, role_id))
-                            await db.commit()
+                        await settings_cache.set_welcome_channel_role(role_interaction.guild.id, channel_id, role_id)
                         embed_done = discord.Embed(title="✅ Welcome System Setup Complete", description="Pengaturan welcome berhasil disimpan!", color=discord.Color.green())
                         embed_done.add_field(name="Channel", value=channel.mention, inline=True)
                         embed_done.add_field(name="Role", value=role.mention, inline=True)
@@ -466,14 +3669,8 @@ class DashboardView(discord.ui.View):
 @commands.has_permissions(administrator=True)
 @app_commands.describe(message="Teks welcome. Contoh: Selamat datang {user} di {guild}! Kamu member ke-{member_count}.")
 async def set_welcome_message(ctx: commands.Context, *, message: str):
-    async with aiosqlite.connect('bot_data.db') as db:
-        # Pastikan ada row; gunakan existing channel/role jika ada
-        cursor = await db.execute('SELECT channel_id, role_id FROM welcome_settings WHERE guild_id = ?', (ctx.guild.id,))
-        row = await cursor.fetchone()
-        channel_id = row[0] if row else None
-        role_id = row[1] if row else None
-        await db.execute('INSERT OR REPLACE INTO welcome_settings (guild_id, channel_id, message, role_id) VALUES (?, ?, ?, ?)', (ctx.guild.id, channel_id, message, role_id))
-        await db.commit()
+    # Upsert: channel/role yang sudah ada tetap dipakai
+    await settings_cache.set_welcome_message(ctx.guild.id, message)
 
     await send_ephemeral(ctx, "✅ Pesan welcome berhasil diatur!")
 
@@ -500,14 +3697,7 @@ async def set_ticket_category(ctx: commands.Context, category_id: str | None = N
         }
         category = await ctx.guild.create_category("🎫 Tickets", overwrites=overwrites)
 
-    async with aiosqlite.connect('bot_data.db') as db:
-        cursor = await db.execute('SELECT guild_id FROM ticket_settings WHERE guild_id = ?', (ctx.guild.id,))
-        existing = await cursor.fetchone()
-        if existing:
-            await db.execute('UPDATE ticket_settings SET category_id = ? WHERE guild_id = ?', (category.id, ctx.guild.id))
-        else:
-            await db.execute('INSERT INTO ticket_settings (guild_id, category_id) VALUES (?, ?)', (ctx.guild.id, category.id))
-        await db.commit()
+    await settings_cache.set_ticket_category(ctx.guild.id, category.id)
 
     await ctx.send(f"✅ Kategori ticket diset ke {category.mention}!")
 
@@ -516,9 +3706,7 @@ async def set_ticket_category(ctx: commands.Context, category_id: str | None = N
 # =====================
 @bot.hybrid_command(name="mytickets", description="Lihat ticket yang masih terbuka")
 async def mytickets(ctx: commands.Context):
-    async with aiosqlite.connect('bot_data.db') as db:
-        cursor = await db.execute('SELECT channel_id, category, created_at FROM tickets WHERE user_id = ? AND status = "open"', (ctx.author.id,))
-        open_tickets = await cursor.fetchall()
+    open_tickets = ticket_index.list_for_user(ctx.author.id)
 
     if open_tickets:
         embed = discord.Embed(title="🎫 Ticket Anda yang Masih Terbuka", color=discord.Color.blue())
@@ -537,22 +3725,17 @@ async def show_ticket(ctx: commands.Context, channel: discord.TextChannel):
     embed = discord.Embed(title="🎫 Ticket System", description="Klik tombol di bawah untuk membuka ticket:", color=discord.Color.blue())
     view = TicketOptionsView()
     await channel.send(embed=embed, view=view)
-    async with aiosqlite.connect('bot_data.db') as db:
-        await db.execute('INSERT OR REPLACE INTO ticket_settings (guild_id, channel_id) VALUES (?, ?)', (ctx.guild.id, channel.id))
-        await db.commit()
+    await settings_cache.set_ticket_panel_channel(ctx.guild.id, channel.id)
     await ctx.send(f"✅ Panel ticket berhasil ditampilkan di {channel.mention}!")
 
 @bot.hybrid_command(name="server_info", description="Lihat pengaturan server")
 async def server_info(ctx: commands.Context):
     embed = discord.Embed(title="⚙️ Server Information", description="Pengaturan yang aktif di server ini:", color=discord.Color.blue())
-    async with aiosqlite.connect('bot_data.db') as db:
-        cursor = await db.execute('SELECT channel_id, role_id, message FROM welcome_settings WHERE guild_id = ?', (ctx.guild.id,))
-        welcome_settings = await cursor.fetchone()
-        cursor = await db.execute('SELECT channel_id, category_id FROM ticket_settings WHERE guild_id = ?', (ctx.guild.id,))
-        ticket_settings = await cursor.fetchone()
+    welcome_settings = await settings_cache.get_welcome(ctx.guild.id)
+    ticket_settings = await settings_cache.get_ticket(ctx.guild.id)
 
     if welcome_settings:
-        w_channel_id, w_role_id, w_message = welcome_settings
+        w_channel_id, w_message, w_role_id = welcome_settings
         if w_channel_id:
             channel = ctx.guild.get_channel(w_channel_id)
             role = ctx.guild.get_role(w_role_id) if w_role_id else None
@@ -581,13 +3764,58 @@ async def server_info(ctx: commands.Context):
 # =====================
 # Music Commands (Fixed error + autoplay queue)
 # =====================
-async def _after_playback(error: Exception | None, guild_id: int):
-    # This runs in the player thread; schedule coroutine on bot loop
+def _after_playback(guild_id: int):
+    def after_cb(error: Exception | None):
+        # This runs in the player thread; schedule coroutine on bot loop
+        asyncio.run_coroutine_threadsafe(play_next_by_guild_id(guild_id), bot.loop)
+    return after_cb
+
+def schedule_prefetch(guild_id: int, duration: int | None):
+    """Siapkan lagu berikutnya PREFETCH_LEAD detik sebelum lagu yang sedang diputar selesai."""
+    music_state.drop_prefetch(guild_id)
+    if not duration:
+        # Durasi tidak diketahui (mis. live): tidak ada prefetch, fallback ke on-demand
+        return
+    delay = max(0.0, duration - PREFETCH_LEAD)
+    music_state.prefetch_due[guild_id] = asyncio.get_running_loop().time() + delay
+    music_state.prefetch_tasks[guild_id] = asyncio.create_task(_prefetch_next(guild_id, delay))
+
+def maybe_prefetch(guild_id: int):
+    """Dipanggil saat lagu baru masuk queue, kalau jendela prefetch sudah lewat."""
+    due = music_state.prefetch_due.get(guild_id)
+    task = music_state.prefetch_tasks.get(guild_id)
+    if due is None or asyncio.get_running_loop().time() < due or guild_id in music_state.prefetched:
+        return
+    if task and not task.done():
+        return
+    music_state.prefetch_tasks[guild_id] = asyncio.create_task(_prefetch_next(guild_id, 0))
+
+async def _prefetch_next(guild_id: int, delay: float):
+    if delay:
+        await asyncio.sleep(delay)
+    queue = music_state.get_queue(guild_id)
+    if not queue:
+        return
+    track = queue[0]
+    music_state.prefetch_target[guild_id] = track
     try:
-        awaitable = play_next_by_guild_id(guild_id)
-        asyncio.run_coroutine_threadsafe(awaitable, bot.loop)
-    except Exception:
-        pass
+        data = await YTDLSource.extract(track.webpage_url, guild_id=guild_id)
+        # Spawn FFmpeg sekarang supaya input stream sudah terbuka saat lagu dimulai
+        source = await create_audio_source(data)
+    except Exception as e:
+        playback_stats.prefetch_failures += 1
+        metrics.error('prefetch', e)
+        print(f"Prefetch gagal untuk '{track.title}': {e}")
+        return
+    finally:
+        target = music_state.prefetch_target.get(guild_id)
+        if target is track:
+            music_state.prefetch_target.pop(guild_id, None)
+    if target is not track:
+        # Queue berubah (stop/clear) selama resolve
+        source.cleanup()
+        return
+    music_state.prefetched[guild_id] = (track, source)
 
 @bot.hybrid_command(name="play", description="Memutar musik dari YouTube")
 @app_commands.describe(query="URL atau nama lagu")
@@ -596,6 +3824,11 @@ async def play(ctx: commands.Context, *, query: str):
         await ctx.send("❌ Anda harus berada di voice channel terlebih dahulu!")
         return
 
+    if extraction.is_busy(ctx.guild.id):
+        # Tolak cepat sebelum connect/defer supaya guild yang spam /play tidak menahan guild lain
+        await ctx.send("⏳ Bot sedang memproses banyak lagu, coba lagi sebentar.")
+        return
+
     voice_channel = ctx.author.voice.channel
     voice_client = ctx.guild.voice_client
 
@@ -606,11 +3839,13 @@ async def play(ctx: commands.Context, *, query: str):
         try:
             voice_client = await voice_channel.connect()
         except Exception as e:
+            metrics.error('voice_connect', e)
             await ctx.send(f"❌ Error connecting to voice channel: {str(e)}")
             return
 
-    # Remember last text channel used for this guild
+    # Remember last text/voice channel used for this guild (juga untuk resume setelah restart)
     music_state.set_text_channel(ctx.guild.id, ctx.channel.id)
+    music_state.set_voice_channel(ctx.guild.id, voice_channel.id)
 
     # Defer interaction to avoid timeouts
     try:
@@ -619,58 +3854,162 @@ async def play(ctx: commands.Context, *, query: str):
     except Exception:
         pass
 
+    if len(music_state.get_queue(ctx.guild.id)) >= MAX_QUEUE_SIZE:
+        await ctx.send(f"❌ Queue sudah penuh (maksimum {MAX_QUEUE_SIZE} lagu)!")
+        return
+
+    if is_playlist_url(query):
+        await ingest_playlist(ctx, voice_client, query)
+        return
+
     try:
-        player = await YTDLSource.from_url(query, loop=bot.loop, stream=True)
+        started = time.perf_counter()
+        data = await YTDLSource.extract(query, guild_id=ctx.guild.id)
+        track = Track.from_data(data, query=query, requester=ctx.author.id)
         queue = music_state.get_queue(ctx.guild.id)
 
-        if voice_client.is_playing():
-            queue.append(player)
-            embed = discord.Embed(title="🎵 Added to Queue", description=f"**{player.title}** ditambahkan ke queue (Posisi: #{len(queue)})", color=discord.Color.green())
-            await ctx.send(embed=embed)
+        async with music_state.lock(ctx.guild.id):
+            if voice_client.is_playing() or queue:
+                queue.append(track)
+                position = len(queue)
+                now_playing = False
+                # Queue tersisa tapi player diam (mis. lagu sebelumnya gagal): mulai lagi
+                idle = not voice_client.is_playing()
+            else:
+                # Lagu langsung diputar: pakai hasil extract barusan, tidak perlu resolve ulang
+                player = await create_audio_source(data)
+                player.ttfa_start = started
+                voice_client.play(player, after=_after_playback(ctx.guild.id))
+                music_state.set_now_playing(ctx.guild.id, track)
+                schedule_prefetch(ctx.guild.id, track.duration)
+                now_playing = True
+
+        if now_playing:
+            embed = discord.Embed(title="🎵 Now Playing", description=f"**{track.title}**", color=discord.Color.blue())
         else:
-            def after_cb(error):
-                # schedule next track
-                asyncio.run_coroutine_threadsafe(play_next_by_guild_id(ctx.guild.id), bot.loop)
-            voice_client.play(player, after=after_cb)
-            embed = discord.Embed(title="🎵 Now Playing", description=f"**{player.title}**", color=discord.Color.blue())
-            await ctx.send(embed=embed)
+            embed = discord.Embed(title="🎵 Added to Queue", description=f"**{track.title}** ditambahkan ke queue (Posisi: #{position})", color=discord.Color.green())
+        await ctx.send(embed=embed)
+        if not now_playing and idle:
+            await play_next_by_guild_id(ctx.guild.id)
+        elif not now_playing:
+            maybe_prefetch(ctx.guild.id)
+    except ExtractorBusy:
+        await ctx.send("⏳ Bot sedang memproses banyak lagu, coba lagi sebentar.")
+    except ExtractionCancelled:
+        await ctx.send("⏹️ Permintaan dibatalkan karena musik dihentikan.")
     except Exception as e:
+        metrics.error('play', e)
         await ctx.send(f"❌ Error: {str(e)}")
 
+async def ingest_playlist(ctx: commands.Context, voice_client: discord.VoiceClient, url: str):
+    """Masukkan playlist ke queue per halaman; lagu pertama langsung diputar tanpa menunggu sisa playlist."""
+    guild_id = ctx.guild.id
+    queue = music_state.get_queue(guild_id)
+    embed = discord.Embed(title="📃 Memuat Playlist", description="Mengambil daftar lagu...", color=discord.Color.purple())
+    progress = await ctx.send(embed=embed)
+    added = 0
+    start = 1
+    playlist_title = None
+    status = None
+    try:
+        while True:
+            room = MAX_QUEUE_SIZE - len(queue)
+            if room <= 0:
+                status = f"Queue penuh, dibatasi {MAX_QUEUE_SIZE} lagu."
+                break
+            count = min(PLAYLIST_PAGE_SIZE, room)
+            title, entries = await extraction.call(guild_id, _extract_playlist_page, url, start, count)
+            playlist_title = playlist_title or title
+            for entry in entries:
+                queue.append(Track.from_playlist_entry(entry, requester=ctx.author.id))
+            added += len(entries)
+            if entries and not voice_client.is_playing():
+                # Jangan tunggu halaman berikutnya; lagu pertama di-resolve & diputar sekarang
+                asyncio.create_task(play_next_by_guild_id(guild_id))
+            elif entries:
+                maybe_prefetch(guild_id)
+            if len(entries) < count:
+                break
+            start += len(entries)
+            embed.description = f"**{playlist_title or url}**\n{added} lagu ditambahkan ke queue, memuat berikutnya..."
+            try:
+                await progress.edit(embed=embed)
+            except Exception:
+                pass
+    except ExtractorBusy:
+        status = "Bot sedang sibuk, sisa playlist tidak dimuat."
+    except ExtractionCancelled:
+        status = "Dibatalkan karena musik dihentikan."
+    except Exception as e:
+        status = f"Error: {str(e)}"
+
+    embed.title = "📃 Playlist Ditambahkan" if added else "❌ Playlist Gagal Dimuat"
+    embed.description = f"**{playlist_title or url}**\n{added} lagu ditambahkan ke queue."
+    if status:
+        embed.description += f"\n{status}"
+    embed.color = discord.Color.green() if added else discord.Color.red()
+    try:
+        await progress.edit(embed=embed)
+    except Exception:
+        pass
+
 async def play_next_by_guild_id(guild_id: int):
+    started = time.perf_counter()
     guild = bot.get_guild(guild_id)
     if not guild:
         return
     queue = music_state.get_queue(guild.id)
     voice_client = guild.voice_client
     if not voice_client:
-        music_state.clear_queue(guild.id)
+        music_state.end_session(guild.id)
         return
-    if queue and not voice_client.is_playing():
-        next_player = queue.pop(0)
-        def after_cb(error):
-            asyncio.run_coroutine_threadsafe(play_next_by_guild_id(guild.id), bot.loop)
-        try:
-            voice_client.play(next_player, after=after_cb)
-        except Exception:
-            # Skip problematic track and move on
-            await play_next_by_guild_id(guild.id)
-            return
+    async with music_state.lock(guild.id):
+        next_track = None
+        while queue and not voice_client.is_playing():
+            track = queue.popleft()
+            player = await music_state.take_prefetched(guild.id, track)
+            if player is not None:
+                player.ttfa_path = 'prefetch'
+            else:
+                try:
+                    # FFmpeg baru di-spawn di sini, bukan saat lagu masuk queue
+                    player = await YTDLSource.from_track(track, guild_id=guild.id)
+                except ExtractionCancelled:
+                    return
+                except Exception:
+                    # Skip problematic track and move on
+                    continue
+            player.ttfa_start = started
+            if not voice_client.is_connected():
+                player.cleanup()
+                return
+            try:
+                voice_client.play(player, after=_after_playback(guild.id))
+            except Exception:
+                player.cleanup()
+                continue
+            music_state.set_now_playing(guild.id, track)
+            schedule_prefetch(guild.id, track.duration)
+            next_track = track
+            break
+        if next_track is None and not voice_client.is_playing():
+            music_state.set_now_playing(guild.id, None)
+    if next_track:
         # Announce now playing
         text_channel = music_state.get_text_channel(guild)
         if text_channel:
-            embed = discord.Embed(title="🎵 Now Playing", description=f"**{next_player.title}**", color=discord.Color.blue())
-            try:
-                await text_channel.send(embed=embed)
-            except Exception:
-                pass
+            embed = discord.Embed(title="🎵 Now Playing", description=f"**{next_track.title}**", color=discord.Color.blue())
+            # Skip beruntun: Now Playing lama yang belum terkirim diganti yang terbaru
+            send_scheduler.submit(text_channel, channel_id=text_channel.id, priority=PRIORITY_ANNOUNCE,
+                                  key='now_playing', max_age=ANNOUNCE_MAX_AGE, embed=embed)
 
 @bot.hybrid_command(name="stop", description="Menghentikan musik")
 async def stop(ctx: commands.Context):
     voice_client = ctx.guild.voice_client
     if voice_client and (voice_client.is_playing() or voice_client.is_connected()):
         voice_client.stop()
-        music_state.clear_queue(ctx.guild.id)
+        music_state.end_session(ctx.guild.id)
+        extraction.cancel_guild(ctx.guild.id)
         try:
             await voice_client.disconnect()
         except Exception:
@@ -679,6 +4018,48 @@ async def stop(ctx: commands.Context):
     else:
         await ctx.send("❌ Tidak ada musik yang sedang diputar!")
 
+@bot.event
+@instrumented('event_seconds')
+async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+    # Bot keluar/di-disconnect dari voice: hentikan extraction & prefetch yang masih berjalan
+    if member.id != bot.user.id or music_state.shutting_down:
+        # Saat shutdown session sengaja dibiarkan supaya bisa di-resume
+        return
+    if before.channel and after.channel is None:
+        music_state.end_session(member.guild.id)
+        extraction.cancel_guild(member.guild.id)
+    elif after.channel and before.channel != after.channel:
+        music_state.set_voice_channel(member.guild.id, after.channel.id)
+
+async def resume_music_sessions():
+    """Setelah restart: join lagi ke voice channel terakhir dan lanjutkan queue yang tersimpan."""
+    for guild_id, current in list(music_state.sessions_to_resume.items()):
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        del music_state.sessions_to_resume[guild_id]
+        queue = music_state.get_queue(guild_id)
+        if current:
+            # Lagu yang terpotong restart diputar ulang dari awal
+            queue.appendleft(Track(**current))
+        voice_id = music_state.voice_channels.get(guild_id)
+        channel = guild.get_channel(voice_id) if voice_id else None
+        if channel is None or not queue:
+            music_state.end_session(guild_id)
+            continue
+        try:
+            if guild.voice_client is None:
+                await channel.connect()
+        except Exception as e:
+            print(f"Gagal resume musik di {guild.name}: {e}")
+            continue
+        text_channel = music_state.get_text_channel(guild)
+        if text_channel:
+            embed = discord.Embed(title="🔁 Queue Dilanjutkan", description=f"{len(queue)} lagu dilanjutkan setelah bot restart.", color=discord.Color.purple())
+            send_scheduler.submit(text_channel, channel_id=text_channel.id, priority=PRIORITY_ANNOUNCE,
+                                  max_age=ANNOUNCE_MAX_AGE, embed=embed)
+        await play_next_by_guild_id(guild_id)
+
 @bot.hybrid_command(name="skip", description="Skip musik saat ini")
 async def skip(ctx: commands.Context):
     voice_client = ctx.guild.voice_client
@@ -694,23 +4075,83 @@ async def queue_cmd(ctx: commands.Context):
     queue = music_state.get_queue(ctx.guild.id)
     if queue:
         embed = discord.Embed(title="🎵 Music Queue", color=discord.Color.purple())
-        for i, player in enumerate(queue[:10], 1):
-            embed.add_field(name=f"#{i}", value=player.title, inline=False)
+        for i, track in enumerate(itertools.islice(queue, 10), 1):
+            embed.add_field(name=f"#{i}", value=track.title, inline=False)
         if len(queue) > 10:
             embed.set_footer(text=f"Dan {len(queue) - 10} lagu lainnya...")
         await ctx.send(embed=embed)
     else:
         await ctx.send("❌ Queue kosong!")
 
+def _queue_index(queue: GuildQueue, position: int) -> int | None:
+    # Posisi untuk user dimulai dari 1
+    return position - 1 if 1 <= position <= len(queue) else None
+
+@bot.hybrid_command(name="remove", description="Hapus lagu dari queue")
+@app_commands.describe(position="Posisi lagu di queue")
+async def remove_cmd(ctx: commands.Context, position: int):
+    queue = music_state.get_queue(ctx.guild.id)
+    index = _queue_index(queue, position)
+    if index is None:
+        await ctx.send("❌ Posisi tidak valid!")
+        return
+    track = queue.remove(index)
+    if index == 0:
+        music_state.drop_prefetch(ctx.guild.id)
+    await ctx.send(f"🗑️ **{track.title}** dihapus dari queue")
+
+@bot.hybrid_command(name="move", description="Pindahkan posisi lagu di queue")
+@app_commands.describe(source="Posisi lagu sekarang", destination="Posisi tujuan")
+async def move_cmd(ctx: commands.Context, source: int, destination: int):
+    queue = music_state.get_queue(ctx.guild.id)
+    src = _queue_index(queue, source)
+    dst = _queue_index(queue, destination)
+    if src is None or dst is None:
+        await ctx.send("❌ Posisi tidak valid!")
+        return
+    track = queue.move(src, dst)
+    if 0 in (src, dst):
+        music_state.drop_prefetch(ctx.guild.id)
+    await ctx.send(f"↕️ **{track.title}** dipindah ke posisi #{destination}")
+
+@bot.hybrid_command(name="shuffle", description="Acak urutan queue")
+async def shuffle_cmd(ctx: commands.Context):
+    queue = music_state.get_queue(ctx.guild.id)
+    if len(queue) < 2:
+        await ctx.send("❌ Queue terlalu pendek untuk diacak!")
+        return
+    queue.shuffle()
+    music_state.drop_prefetch(ctx.guild.id)
+    await ctx.send("🔀 Queue diacak")
+
 # =====================
 # Moderation commands
 # =====================
+MODERATION_ACTIONS = ('timeout', 'kick', 'ban')
+TIMEOUT_MAX_SECONDS = 28 * 86400  # batas timeout Discord
+
+async def apply_moderation(guild: discord.Guild, user: discord.abc.Snowflake, action: str, reason: str, *,
+                           timeout_seconds: int = 600, delete_message_seconds: int = 0):
+    """Tindakan moderasi bersama untuk command, auto-mod dan mass action. Exception discord (Forbidden, dll.) diteruskan.
+
+    ``user`` boleh discord.Object (ban/kick lewat ID tanpa cache member); timeout butuh discord.Member.
+    """
+    if action == 'ban':
+        await guild.ban(user, reason=reason, delete_message_seconds=delete_message_seconds)
+    elif action == 'kick':
+        await guild.kick(user, reason=reason)
+    elif action == 'timeout':
+        await user.timeout(timedelta(seconds=min(timeout_seconds, TIMEOUT_MAX_SECONDS)), reason=reason)
+    else:
+        raise ValueError(f"Aksi moderasi tidak dikenal: {action}")
+    metrics.inc('moderation_actions_total', action)
+
 @bot.hybrid_command(name="ban", description="Ban member dari server")
 @commands.has_permissions(ban_members=True)
 @app_commands.describe(member="Member yang akan di-ban", reason="Alasan ban")
 async def ban(ctx: commands.Context, member: discord.Member, reason: str = "Tidak ada alasan"):
     try:
-        await member.ban(reason=reason)
+        await apply_moderation(ctx.guild, member, 'ban', reason)
         embed = discord.Embed(title="✅ Banned", description=f"{member.mention} telah di-ban dari server.", color=discord.Color.red())
         embed.add_field(name="Reason", value=reason, inline=False)
         embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
@@ -723,7 +4164,7 @@ async def ban(ctx: commands.Context, member: discord.Member, reason: str = "Tida
 @app_commands.describe(member="Member yang akan di-kick", reason="Alasan kick")
 async def kick(ctx: commands.Context, member: discord.Member, reason: str = "Tidak ada alasan"):
     try:
-        await member.kick(reason=reason)
+        await apply_moderation(ctx.guild, member, 'kick', reason)
         embed = discord.Embed(title="✅ Kicked", description=f"{member.mention} telah di-kick dari server.", color=discord.Color.orange())
         embed.add_field(name="Reason", value=reason, inline=False)
         embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
@@ -731,52 +4172,618 @@ async def kick(ctx: commands.Context, member: discord.Member, reason: str = "Tid
     except discord.Forbidden:
         await ctx.send("❌ Saya tidak memiliki izin untuk kick member ini!")
 
+@bot.hybrid_command(name="timeout", description="Timeout member (tidak bisa kirim pesan sementara)")
+@commands.has_permissions(moderate_members=True)
+@app_commands.describe(member="Member yang akan di-timeout", minutes="Lama timeout dalam menit", reason="Alasan timeout")
+async def timeout_cmd(ctx: commands.Context, member: discord.Member, minutes: int = 10, reason: str = "Tidak ada alasan"):
+    if minutes < 1:
+        await ctx.send("❌ Lama timeout minimal 1 menit!")
+        return
+    try:
+        await apply_moderation(ctx.guild, member, 'timeout', reason, timeout_seconds=minutes * 60)
+        embed = discord.Embed(title="✅ Timeout", description=f"{member.mention} di-timeout {minutes} menit.", color=discord.Color.orange())
+        embed.add_field(name="Reason", value=reason, inline=False)
+        embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
+        await ctx.send(embed=embed)
+    except discord.Forbidden:
+        await ctx.send("❌ Saya tidak memiliki izin untuk timeout member ini!")
+
+# =====================
+# Auto-moderation (anti-spam di jalur on_message)
+# =====================
+AUTOMOD_ACTION_LABELS = {'off': "Mati", 'delete': "Hapus pesan", 'timeout': "Hapus pesan + timeout",
+                         'kick': "Hapus pesan + kick", 'ban': "Hapus pesan + ban"}
+AUTOMOD_REASONS = {'flood': "kirim pesan terlalu cepat", 'duplicate': "pesan yang sama berulang-ulang",
+                   'mentions': "mention massal"}
+
+class SpamState:
+    """State anti-spam satu (guild, user): token bucket untuk flood + hash pesan terakhir untuk duplikat."""
+
+    __slots__ = ('tokens', 'seen', 'content_hash', 'repeats', 'repeat_since', 'cooldown_until')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.seen = now  # pesan terakhir; dipakai isi ulang token & eviction
+        self.content_hash = 0
+        self.repeats = 0
+        self.repeat_since = now
+        self.cooldown_until = 0.0
+
+class AutoMod:
+    """Deteksi spam per pesan dengan biaya O(1): satu lookup dict, aritmetika, tanpa await dan tanpa database.
+
+    State disimpan di OrderedDict urut aktivitas terakhir, jadi user yang paling lama diam selalu di depan
+    dan bisa dibuang tanpa scan. Tindakan (hapus pesan, timeout/kick/ban) dijalankan di task terpisah.
+    """
+
+    EVICT_BATCH = 8  # state idle yang dibuang maksimum per state baru
+
+    def __init__(self, max_users: int, idle_ttl: float, cooldown: float):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.cooldown = cooldown
+        self.states: OrderedDict[tuple[int, int], SpamState] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        self.checked = 0
+        self.evicted = 0
+        self.exempt = 0
+        self.violations = {reason: 0 for reason in AUTOMOD_REASONS}
+
+    def check(self, message: discord.Message) -> str | None:
+        """Return alasan pelanggaran ('flood', 'duplicate', 'mentions') atau None. Tindakan dijadwalkan di sini."""
+        config = settings_cache.automod.get(message.guild.id)
+        if config is None or config.action == 'off':
+            return None
+        self.checked += 1
+        now = time.monotonic()
+        key = (message.guild.id, message.author.id)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = SpamState(config.flood_messages, now)
+            self._evict(now)
+        else:
+            self.states.move_to_end(key)
+            state.tokens = min(config.flood_messages, state.tokens + (now - state.seen) * config.refill_rate)
+            state.seen = now
+
+        reason = None
+        if state.tokens >= 1:
+            state.tokens -= 1
+        else:
+            reason = 'flood'
+        if message.content:
+            digest = hash(message.content.strip().casefold())
+            if digest == state.content_hash and now - state.repeat_since <= config.duplicate_seconds:
+                state.repeats += 1
+            else:
+                state.content_hash, state.repeats, state.repeat_since = digest, 1, now
+            if reason is None and state.repeats >= config.duplicate_count:
+                reason = 'duplicate'
+        if reason is None and len(message.mentions) + len(message.role_mentions) > config.mention_max:
+            reason = 'mentions'
+        if reason is None:
+            return None
+
+        self.violations[reason] += 1
+        # Pesan spam selalu dihapus; timeout/kick/ban cukup sekali per cooldown
+        punish = now >= state.cooldown_until
+        if punish:
+            state.cooldown_until = now + self.cooldown
+        task = asyncio.create_task(self._enforce(message, config, reason, punish))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return reason
+
+    def _evict(self, now: float):
+        states = self.states
+        if len(states) > self.max_users:
+            states.popitem(last=False)
+            self.evicted += 1
+        # Dibatasi per panggilan supaya satu pesan tidak menanggung pembersihan besar (tetap O(1) amortized)
+        for _ in range(self.EVICT_BATCH):
+            oldest = next(iter(states.values()))
+            if now - oldest.seen < self.idle_ttl:
+                break
+            states.popitem(last=False)
+            self.evicted += 1
+
+    async def _enforce(self, message: discord.Message, config: AutoModConfig, reason: str, punish: bool):
+        member = message.author
+        permissions = getattr(member, 'guild_permissions', None)
+        if permissions is None or permissions.manage_messages:
+            self.exempt += 1  # moderator (atau user yang sudah keluar) tidak ditindak
+            return
+        try:
+            with contextlib.suppress(discord.NotFound):
+                await message.delete()
+            if punish and config.action in MODERATION_ACTIONS:
+                await apply_moderation(message.guild, member, config.action, f"Auto-mod: {AUTOMOD_REASONS[reason]}",
+                                       timeout_seconds=config.timeout_seconds)
+                send_scheduler.submit(message.channel, channel_id=message.channel.id, priority=PRIORITY_ANNOUNCE,
+                                      key='automod', max_age=ANNOUNCE_MAX_AGE,
+                                      content=f"🛡️ {member.mention} terkena {config.action} otomatis: {AUTOMOD_REASONS[reason]}.")
+            metrics.inc('automod_actions_total', config.action if punish else 'delete')
+        except discord.HTTPException as e:
+            metrics.error('automod', e)
+
+    async def close(self, timeout: float = 5.0):
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            'tracked_users': len(self.states),
+            'checked': self.checked,
+            'evicted': self.evicted,
+            'exempt': self.exempt,
+            'pending_actions': len(self._tasks),
+            'violations': dict(self.violations),
+        }
+
+automod = AutoMod(AUTOMOD_MAX_USERS, AUTOMOD_IDLE_TTL, AUTOMOD_COOLDOWN)
+metrics.add_collector('automod', automod.stats)
+
+@bot.hybrid_command(name="automod", description="Lihat atau atur anti-spam otomatis (Admin)")
+@commands.has_permissions(administrator=True)
+@app_commands.describe(action="Tindakan saat spam terdeteksi", flood_messages="Pesan maksimum per rentang flood",
+                       flood_seconds="Rentang flood (detik)", duplicates="Pesan identik beruntun maksimum",
+                       mentions="Mention maksimum per pesan", timeout_minutes="Lama timeout (menit)")
+@app_commands.choices(action=[app_commands.Choice(name=label, value=value) for value, label in AUTOMOD_ACTION_LABELS.items()])
+async def automod_cmd(ctx: commands.Context, action: str | None = None, flood_messages: int | None = None,
+                      flood_seconds: float | None = None, duplicates: int | None = None, mentions: int | None = None,
+                      timeout_minutes: int | None = None):
+    current = settings_cache.automod.get(ctx.guild.id) or AutoModConfig('off', *AutoModConfig.DEFAULTS[1:])
+    changes = (action, flood_messages, flood_seconds, duplicates, mentions, timeout_minutes)
+    if any(value is not None for value in changes):
+        if action is not None and action not in AUTOMOD_ACTION_LABELS:
+            await send_ephemeral(ctx, f"❌ Aksi harus salah satu dari: {', '.join(AUTOMOD_ACTION_LABELS)}")
+            return
+        if any(value is not None and value < 1 for value in changes[1:]):
+            await send_ephemeral(ctx, "❌ Semua angka harus minimal 1!")
+            return
+        current = AutoModConfig(
+            action if action is not None else current.action,
+            flood_messages or current.flood_messages,
+            flood_seconds or current.flood_seconds,
+            duplicates or current.duplicate_count,
+            current.duplicate_seconds,
+            mentions or current.mention_max,
+            timeout_minutes * 60 if timeout_minutes else current.timeout_seconds,
+        )
+        await settings_cache.set_automod(ctx.guild.id, current)
+    embed = discord.Embed(title="🛡️ Auto-mod", description=AUTOMOD_ACTION_LABELS[current.action], color=discord.Color.dark_red())
+    embed.add_field(name="🌊 Flood", value=f"> {current.flood_messages} pesan / {current.flood_seconds:g} detik", inline=True)
+    embed.add_field(name="🔁 Duplikat", value=f"{current.duplicate_count}× pesan sama / {current.duplicate_seconds:g} detik", inline=True)
+    embed.add_field(name="📣 Mention", value=f"> {current.mention_max} per pesan", inline=True)
+    embed.add_field(name="⏳ Timeout", value=f"{current.timeout_seconds // 60} menit", inline=True)
+    await send_ephemeral(ctx, embed=embed)
+
+# =====================
+# Mass moderation (raid): ban/kick/purge banyak user sekaligus
+# =====================
+BULK_PROGRESS_INTERVAL = 3.0  # detik antar update progress; edit pesan ikut rate limit channel
+BULK_DELETE_MAX_AGE = timedelta(days=14)  # pesan lebih tua tidak bisa di-bulk delete Discord
+BULK_DELETE_CHUNK = 100  # pesan maksimum per request bulk delete
+
+async def resolve_bulk_targets(ctx: commands.Context, targets: str | None, joined_minutes: int | None,
+                               account_days: int | None) -> tuple[list[int], int]:
+    """Return (user_id target, jumlah yang dilewati). Jika daftar ID dan filter diisi, hasilnya irisan keduanya."""
+    guild = ctx.guild
+    user_ids = {int(match) for match in re.findall(r'\d{15,20}', targets or '')}
+    members: dict[int, discord.Member] | None = None
+    if joined_minutes or account_days:
+        joined_after = (datetime.now() - timedelta(minutes=joined_minutes)).isoformat() if joined_minutes else None
+        # ID Discord naik seiring waktu pembuatan akun: "akun < N hari" = user_id >= snowflake N hari lalu
+        min_user_id = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=account_days)) if account_days else 0
+        matched = set(await database.members_matching(guild.id, joined_after, min_user_id))
+        # Join beberapa detik terakhir yang belum ditulis WelcomePipeline ikut dihitung
+        matched.update(member.id for member, _ in welcome_pipeline.joins
+                       if member.guild.id == guild.id and member.id >= min_user_id)
+        user_ids = user_ids & matched if user_ids else matched
+        if joined_minutes and len(user_ids) <= BULK_MODERATION_MAX:
+            # Database hanya kandidat (row lama bisa punya joined_at yang tidak akurat);
+            # keputusan akhir memakai waktu join dari Discord, user yang sudah keluar tidak ikut
+            joined_cutoff = discord.utils.utcnow() - timedelta(minutes=joined_minutes)
+            members = await fetch_members(guild, sorted(user_ids))
+            user_ids = {user_id for user_id, member in members.items()
+                        if member.joined_at is not None and member.joined_at >= joined_cutoff}
+    if len(user_ids) > BULK_MODERATION_MAX:
+        return sorted(user_ids), 0  # ditolak pemanggil, tidak perlu cek member satu per satu
+    if members is None:
+        # Profil balanced/minimal: moderator biasanya tidak ada di cache, jadi selalu ditanya ke Discord.
+        # ID yang tidak ketemu bukan member (sudah keluar): boleh di-ban, tapi jelas bukan staff.
+        members = await fetch_members(guild, sorted(user_ids))
+    protected = {ctx.author.id, bot.user.id, guild.owner_id}
+    author_is_owner = ctx.author.id == guild.owner_id
+    selected, skipped = [], 0
+    for user_id in sorted(user_ids):
+        member = members.get(user_id)
+        if user_id in protected or (member is not None and _is_staff(member, ctx.author, author_is_owner)):
+            skipped += 1
+        else:
+            selected.append(user_id)
+    return selected, skipped
+
+def _is_staff(member: discord.Member, moderator: discord.Member, moderator_is_owner: bool) -> bool:
+    permissions = member.guild_permissions
+    if permissions.manage_messages or permissions.ban_members or permissions.kick_members:
+        return True
+    # Role setara/lebih tinggi dari moderator juga tidak boleh ditindak lewat mass action
+    return not moderator_is_owner and member.top_role >= moderator.top_role
+
+async def run_bulk_moderation(guild: discord.Guild, action: str, user_ids: list[int], reason: str, *,
+                              delete_message_seconds: int = 0, progress=None) -> dict[str, int]:
+    """Ban/kick user_ids dengan BULK_MODERATION_CONCURRENCY request paralel. progress(selesai) dipanggil berkala."""
+    results = {'done': 0, 'not_found': 0, 'forbidden': 0, 'failed': 0}
+    pending = iter(user_ids)
+
+    async def worker():
+        # Iterator dipakai bersama: tiap user_id diambil tepat satu worker
+        for user_id in pending:
+            try:
+                await apply_moderation(guild, discord.Object(user_id), action, reason,
+                                       delete_message_seconds=delete_message_seconds)
+                results['done'] += 1
+            except discord.NotFound:
+                results['not_found'] += 1
+            except discord.Forbidden:
+                results['forbidden'] += 1
+            except discord.HTTPException as e:
+                results['failed'] += 1
+                metrics.error('bulk_moderation', e)
+
+    # Route ban/kick satu bucket per guild: beberapa request paralel cukup untuk mengisi bucket,
+    # lebih dari itu hanya menunggu 429 di rate limiter discord.py
+    tasks = [asyncio.create_task(worker()) for _ in range(min(BULK_MODERATION_CONCURRENCY, len(user_ids)))]
+    running = set(tasks)
+    while running:
+        _, running = await asyncio.wait(running, timeout=BULK_PROGRESS_INTERVAL)
+        if running and progress:
+            await progress(sum(results.values()))
+    await asyncio.gather(*tasks)  # exception tak terduga dari worker diteruskan
+    return results
+
+def _bulk_embed(title: str, ctx: commands.Context, joined_minutes: int | None, account_days: int | None,
+                targets: str | None, user_ids: list[int], skipped: int, color: discord.Color) -> discord.Embed:
+    criteria = []
+    if targets:
+        criteria.append("dari daftar ID")
+    if joined_minutes:
+        criteria.append(f"join dalam {joined_minutes} menit terakhir")
+    if account_days:
+        criteria.append(f"akun berumur < {account_days} hari")
+    embed = discord.Embed(title=title, description=f"Kriteria: {', '.join(criteria)}", color=color)
+    embed.add_field(name="🎯 Target", value=len(user_ids), inline=True)
+    if skipped:
+        embed.add_field(name="🛡️ Dilewati", value=f"{skipped} (staff / role ≥ Anda / diri sendiri)", inline=True)
+    embed.set_footer(text=f"Moderator: {ctx.author}")
+    return embed
+
+def _preview_field(embed: discord.Embed, user_ids: list[int], limit: int = 30):
+    preview = " ".join(f"<@{user_id}>" for user_id in user_ids[:limit])
+    if len(user_ids) > limit:
+        preview += f" … +{len(user_ids) - limit} lagi"
+    embed.add_field(name="👀 Preview", value=preview or "Tidak ada user yang cocok", inline=False)
+
+async def _bulk_prepare(ctx: commands.Context, targets: str | None, joined_minutes: int | None,
+                        account_days: int | None) -> tuple[list[int], int] | None:
+    if not (targets or joined_minutes or account_days):
+        await send_ephemeral(ctx, "❌ Isi daftar ID/mention atau filter `joined_minutes` / `account_days`!")
+        return None
+    if any(value is not None and value < 1 for value in (joined_minutes, account_days)):
+        await send_ephemeral(ctx, "❌ `joined_minutes` dan `account_days` minimal 1!")
+        return None
+    await ctx.defer()
+    user_ids, skipped = await resolve_bulk_targets(ctx, targets, joined_minutes, account_days)
+    if len(user_ids) > BULK_MODERATION_MAX:
+        await ctx.send(f"❌ {len(user_ids)} user cocok, melebihi batas {BULK_MODERATION_MAX}. Persempit filternya!")
+        return None
+    return user_ids, skipped
+
+async def _mass_action(ctx: commands.Context, action: str, targets: str | None, joined_minutes: int | None,
+                       account_days: int | None, reason: str, dry_run: bool, delete_days: int = 0):
+    title, color = {'ban': ("🔨 Mass Ban", discord.Color.red()), 'kick': ("👢 Mass Kick", discord.Color.orange())}[action]
+    prepared = await _bulk_prepare(ctx, targets, joined_minutes, account_days)
+    if prepared is None:
+        return
+    user_ids, skipped = prepared
+    embed = _bulk_embed(title, ctx, joined_minutes, account_days, targets, user_ids, skipped, color)
+    if dry_run or not user_ids:
+        if dry_run:
+            embed.title += " (preview)"
+        _preview_field(embed, user_ids)
+        await ctx.send(embed=embed)
+        return
+
+    # Satu pesan saja: progress di-edit di tempat, lalu diganti embed ringkasan
+    status = await ctx.send(f"⏳ {title}: 0/{len(user_ids)}")
+
+    async def progress(done: int):
+        with contextlib.suppress(discord.HTTPException):
+            await status.edit(content=f"⏳ {title}: {done}/{len(user_ids)}")
+
+    started = time.monotonic()
+    results = await run_bulk_moderation(ctx.guild, action, user_ids, f"{reason} (mass {action} oleh {ctx.author})",
+                                        delete_message_seconds=delete_days * 86400, progress=progress)
+    embed.add_field(name="✅ Berhasil", value=results['done'], inline=True)
+    embed.add_field(name="❔ Tidak ditemukan", value=results['not_found'], inline=True)
+    embed.add_field(name="⛔ Ditolak Discord", value=results['forbidden'], inline=True)
+    if results['failed']:
+        embed.add_field(name="⚠️ Gagal", value=results['failed'], inline=True)
+    embed.add_field(name="Reason", value=reason, inline=False)
+    embed.add_field(name="⏱️ Durasi", value=f"{time.monotonic() - started:.1f} detik", inline=True)
+    await status.edit(content=None, embed=embed)
+
+_BULK_DESCRIBE = {
+    'targets': "ID/mention user, pisahkan dengan spasi atau koma",
+    'joined_minutes': "Member yang join dalam N menit terakhir",
+    'account_days': "Akun yang dibuat kurang dari N hari lalu",
+    'dry_run': "Hanya tampilkan preview, tanpa tindakan",
+}
+
+@bot.hybrid_command(name="massban", description="Ban banyak user sekaligus (daftar ID atau filter join / umur akun)")
+@commands.has_permissions(ban_members=True)
+@app_commands.describe(**_BULK_DESCRIBE, reason="Alasan ban", delete_days="Hapus pesan mereka di semua channel, N hari terakhir (0-7)")
+async def massban(ctx: commands.Context, targets: str | None = None, joined_minutes: int | None = None,
+                  account_days: int | None = None, reason: str = "Raid", delete_days: commands.Range[int, 0, 7] = 0,
+                  dry_run: bool = False):
+    await _mass_action(ctx, 'ban', targets, joined_minutes, account_days, reason, dry_run, delete_days)
+
+@bot.hybrid_command(name="masskick", description="Kick banyak user sekaligus (daftar ID atau filter join / umur akun)")
+@commands.has_permissions(kick_members=True)
+@app_commands.describe(**_BULK_DESCRIBE, reason="Alasan kick")
+async def masskick(ctx: commands.Context, targets: str | None = None, joined_minutes: int | None = None,
+                   account_days: int | None = None, reason: str = "Raid", dry_run: bool = False):
+    await _mass_action(ctx, 'kick', targets, joined_minutes, account_days, reason, dry_run)
+
+@bot.hybrid_command(name="purge_users", description="Hapus pesan terbaru user tertentu di channel ini (bulk delete)")
+@commands.has_permissions(manage_messages=True)
+@app_commands.describe(**_BULK_DESCRIBE, scan_limit="Jumlah pesan terbaru yang diperiksa")
+async def purge_users(ctx: commands.Context, targets: str | None = None, joined_minutes: int | None = None,
+                      account_days: int | None = None, scan_limit: commands.Range[int, 1, 5000] = 500,
+                      dry_run: bool = False):
+    prepared = await _bulk_prepare(ctx, targets, joined_minutes, account_days)
+    if prepared is None:
+        return
+    user_ids, skipped = prepared
+    wanted = set(user_ids)
+    # Bulk delete hanya untuk pesan < 14 hari; sisakan margin supaya request tidak ditolak
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE + timedelta(minutes=5)
+    scanned, messages = 0, []
+    if wanted:
+        async for message in ctx.channel.history(limit=scan_limit):
+            if message.created_at < cutoff:
+                break
+            scanned += 1
+            if message.author.id in wanted:
+                messages.append(message)
+    embed = _bulk_embed("🧹 Purge", ctx, joined_minutes, account_days, targets, user_ids, skipped, discord.Color.dark_grey())
+    embed.add_field(name="📜 Di-scan", value=scanned, inline=True)
+    embed.add_field(name="🧹 Pesan cocok", value=len(messages), inline=True)
+    if dry_run or not messages:
+        if dry_run:
+            embed.title += " (preview)"
+        _preview_field(embed, sorted({message.author.id for message in messages}))
+        await ctx.send(embed=embed)
+        return
+
+    status = await ctx.send(f"⏳ Purge: 0/{len(messages)} pesan")
+    deleted = 0
+    try:
+        for i in range(0, len(messages), BULK_DELETE_CHUNK):
+            chunk = messages[i:i + BULK_DELETE_CHUNK]
+            await ctx.channel.delete_messages(chunk, reason=f"Purge oleh {ctx.author}")
+            deleted += len(chunk)
+            if deleted < len(messages):
+                with contextlib.suppress(discord.HTTPException):
+                    await status.edit(content=f"⏳ Purge: {deleted}/{len(messages)} pesan")
+    except discord.Forbidden:
+        embed.add_field(name="⛔ Berhenti", value="Saya tidak memiliki izin Manage Messages di channel ini!", inline=False)
+    except discord.HTTPException as e:
+        metrics.error('purge', e)
+        embed.add_field(name="⚠️ Berhenti", value=str(e)[:200], inline=False)
+    embed.add_field(name="🗑️ Dihapus", value=deleted, inline=True)
+    await status.edit(content=None, embed=embed)
+
 # =====================
 # Info commands
 # =====================
 @bot.hybrid_command(name="stats", description="Lihat statistik server")
 async def stats(ctx: commands.Context):
-    async with aiosqlite.connect('bot_data.db') as db:
-        cursor = await db.execute('SELECT COUNT(*) FROM members')
-        total_members = await cursor.fetchone()
-        cursor = await db.execute('SELECT COUNT(*) FROM tickets WHERE status = "open"')
-        open_tickets = await cursor.fetchone()
-        cursor = await db.execute('SELECT COUNT(*) FROM tickets WHERE status = "closed"')
-        closed_tickets = await cursor.fetchone()
+    # Dari memori; database hanya dibaca setelah ada write untuk guild ini atau ttl habis
+    total_members, open_tickets, closed_tickets, total_messages = await stats_cache.counters(ctx.guild.id)
 
     embed = discord.Embed(title="📊 Server Statistics", color=discord.Color.gold())
-    embed.add_field(name="👥 Total Members", value=total_members[0], inline=True)
-    embed.add_field(name="🎫 Open Tickets", value=open_tickets[0], inline=True)
-    embed.add_field(name="✅ Closed Tickets", value=closed_tickets[0], inline=True)
+    embed.add_field(name="👥 Total Members", value=total_members, inline=True)
+    embed.add_field(name="🎫 Open Tickets", value=open_tickets, inline=True)
+    embed.add_field(name="✅ Closed Tickets", value=closed_tickets, inline=True)
+    embed.add_field(name="💬 Total Messages", value=total_messages + message_buffer.pending_total(ctx.guild.id), inline=True)
     embed.add_field(name="🏢 Server Created", value=ctx.guild.created_at.strftime("%Y-%m-%d"), inline=True)
+    clusters, bot_guilds, bot_members = await stats_cache.cluster_totals()
+    if clusters:
+        embed.add_field(name="🌐 Bot", value=f"{bot_guilds} server • {bot_members} member • {clusters} cluster", inline=True)
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name="leaderboard", description="Member paling aktif di server")
+@app_commands.describe(period="Rentang waktu")
+@app_commands.choices(period=[app_commands.Choice(name=label, value=value) for value, label in LEADERBOARD_PERIODS.items()])
+async def leaderboard(ctx: commands.Context, period: str = "week"):
+    if period not in LEADERBOARD_PERIODS:
+        await ctx.send("❌ Periode harus `day`, `week`, atau `all`!")
+        return
+    top = await activity_rollups.leaderboard(ctx.guild.id, period)
+    embed = discord.Embed(title="🏆 Leaderboard", description=LEADERBOARD_PERIODS[period], color=discord.Color.gold())
+    if top:
+        medals = ["🥇", "🥈", "🥉"]
+        embed.description += "\n\n" + "\n".join(
+            f"{medals[i] if i < len(medals) else f'`#{i + 1}`'} <@{user_id}> — {messages} pesan"
+            for i, (user_id, messages) in enumerate(top)
+        )
+    else:
+        embed.description += "\n\nBelum ada aktivitas."
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name="activity", description="Aktivitas pesan server 7 hari terakhir")
+async def activity(ctx: commands.Context):
+    summary = await activity_rollups.summary(ctx.guild.id)
+    embed = discord.Embed(title="📈 Aktivitas Server", color=discord.Color.gold())
+    embed.add_field(name="💬 24 Jam Terakhir", value=summary['last_24h'], inline=True)
+    embed.add_field(name="📅 7 Hari Terakhir", value=summary['last_7d'], inline=True)
+    if summary['busiest_hour']:
+        hour, messages = summary['busiest_hour']
+        embed.add_field(name="🔥 Jam Tersibuk", value=f"<t:{hour * 3600}:t> ({messages} pesan)", inline=True)
+    peak = max(summary['per_day'].values()) or 1
+    lines = [
+        f"`{time.strftime('%a %d/%m', time.gmtime(day * 86400))}` {'█' * round(messages / peak * 15) or '▏'} {messages}"
+        for day, messages in summary['per_day'].items()
+    ]
+    embed.add_field(name="Per Hari (UTC)", value="\n".join(lines), inline=False)
     await ctx.send(embed=embed)
 
+def _latency_lines(family: str, *, key=lambda h: h.count, limit: int = 5) -> str:
+    histograms = sorted(metrics.histograms.get(family, {}).items(), key=lambda item: key(item[1]), reverse=True)
+    lines = [
+        f"`{name}` {h.count}× • p50 {h.quantile(0.5) * 1000:.1f} • p95 {h.quantile(0.95) * 1000:.1f} • max {h.max * 1000:.0f} ms"
+        for name, h in histograms[:limit] if h.count
+    ]
+    return "\n".join(lines) or "Belum ada data"
+
+@bot.hybrid_command(name="perf", description="Metrics performa bot (Admin)")
+@commands.has_permissions(administrator=True)
+async def perf(ctx: commands.Context):
+    uptime = int(time.time() - metrics.started)
+    embed = discord.Embed(title="⏱️ Performa Bot", color=discord.Color.dark_grey(),
+                          description=f"Uptime {uptime // 3600}j {uptime % 3600 // 60}m • Cluster {CLUSTER_ID}")
+    embed.add_field(name="⌨️ Command", value=_latency_lines('command_seconds'), inline=False)
+    embed.add_field(name="📨 Event", value=_latency_lines('event_seconds'), inline=False)
+    embed.add_field(name="🗄️ Query DB (total waktu terbesar)", value=_latency_lines('db_query_seconds', key=lambda h: h.sum), inline=False)
+    embed.add_field(name="🎵 yt-dlp", value=_latency_lines('extract_seconds'), inline=False)
+    lag = metrics.histograms.get('loop_lag_seconds', {}).get('main')
+    embed.add_field(name="🔁 Lag Event Loop",
+                    value=f"sekarang {loop_lag.last * 1000:.1f} ms • p99 {(lag.quantile(0.99) if lag else 0) * 1000:.1f} ms • max {loop_lag.max * 1000:.0f} ms",
+                    inline=False)
+    embed.add_field(name="🔊 Playback", value=f"{playback_stats.underruns} underrun dari {playback_stats.frames} frame", inline=True)
+    embed.add_field(name="📤 Antrian", value=f"kirim {send_scheduler.queue_depth()} • welcome {len(welcome_pipeline.joins)}", inline=True)
+    errors = sorted(metrics.counters.get('errors_total', {}).items(), key=lambda item: item[1], reverse=True)[:5]
+    if errors:
+        embed.add_field(name="⚠️ Error Tertangkap", value="\n".join(
+            f"`{where}` {count}× — {metrics.last_errors.get(where, '')[:80]}" for where, count in errors
+        ), inline=False)
+    await send_ephemeral(ctx, embed=embed)
+
 @bot.hybrid_command(name="help", description="Menampilkan semua command")
 async def help_command(ctx: commands.Context):
     embed = discord.Embed(title="🤖 Bot Commands Help", description="Berikut adalah semua command yang tersedia:", color=discord.Color.blue())
-    embed.add_field(name="🎵 Music Commands", value="• `/play [query]` - Putar musik\n• `/stop` - Stop musik\n• `/skip` - Skip lagu\n• `/queue` - Lihat antrian", inline=False)
+    embed.add_field(name="🎵 Music Commands", value="• `/play [query]` - Putar musik\n• `/stop` - Stop musik\n• `/skip` - Skip lagu\n• `/queue` - Lihat antrian\n• `/remove`, `/move`, `/shuffle` - Atur antrian", inline=False)
     embed.add_field(name="🎫 Ticket Commands", value="• Klik tombol `Beli`/`Support` - Buat ticket\n• `/mytickets` - Lihat ticket Anda\n• `/set_ticket_category` - Set kategori (Admin)\n• `/show_ticket` - Pasang panel", inline=False)
     embed.add_field(name="👋 Welcome", value="• `/set_welcome_message [teks]` - Set pesan welcome (support placeholder {user}, {username}, {guild}, {member_count})", inline=False)
-    embed.add_field(name="🛠️ Moderation Commands", value="• `/ban [user] [reason]` - Ban member\n• `/kick [user] [reason]` - Kick member", inline=False)
-    embed.add_field(name="📊 Info Commands", value="• `/stats` - Statistik server\n• `/server_info` - Info pengaturan\n• `/dashboard` - Admin dashboard\n• `/help` - Bantuan", inline=False)
+    embed.add_field(name="🛠️ Moderation Commands", value="• `/ban [user] [reason]` - Ban member\n• `/kick [user] [reason]` - Kick member\n• `/timeout [user] [menit] [reason]` - Timeout member\n• `/automod` - Atur anti-spam otomatis (Admin)\n• `/massban`, `/masskick` - Tindak banyak user sekaligus (ID / join terbaru / akun baru)\n• `/purge_users` - Hapus pesan terbaru user tertentu", inline=False)
+    embed.add_field(name="📊 Info Commands", value="• `/stats` - Statistik server\n• `/leaderboard [day/week/all]` - Member paling aktif\n• `/activity` - Grafik aktivitas server\n• `/server_info` - Info pengaturan\n• `/dashboard` - Admin dashboard\n• `/perf` - Metrics performa (Admin)\n• `/help` - Bantuan", inline=False)
     await ctx.send(embed=embed)
 
 # =====================
 # Event untuk message counter
 # =====================
 @bot.event
+@instrumented('event_seconds')
 async def on_message(message: discord.Message):
-    if not message.author.bot:
-        async with aiosqlite.connect('bot_data.db') as db:
-            await db.execute('INSERT OR IGNORE INTO members (user_id, username, joined_at) VALUES (?, ?, ?)', (message.author.id, str(message.author), datetime.now().isoformat()))
-            await db.execute('UPDATE members SET messages_sent = messages_sent + 1 WHERE user_id = ?', (message.author.id,))
-            await db.commit()
+    if message.guild and not message.author.bot:
+        # Ditulis batch oleh MessageCounterBuffer, bukan satu commit per pesan
+        message_buffer.add(message.guild.id, message.author.id, str(message.author))
+        automod.check(message)
     await bot.process_commands(message)
 
+# =====================
+# Gateway tiruan untuk uji cluster lokal (FAKE_GATEWAY_GUILDS > 0)
+# =====================
+class FakeGateway:
+    """Bangkitkan event message & member_join untuk guild milik shard proses ini, tanpa koneksi ke Discord.
+
+    Guild tiruan memakai id (i << 22) | 1 sehingga guild ke-i jatuh ke shard i % SHARD_COUNT.
+    """
+
+    class Guild:
+        def __init__(self, guild_id: int):
+            self.id = guild_id
+            self.name = f"guild-{guild_id >> 22}"
+            self.member_count = 0
+
+        def get_channel(self, channel_id):
+            return None
+
+        def get_role(self, role_id):
+            return None
+
+    class Member:
+        bot = False
+
+        def __init__(self, guild, user_id: int):
+            self.guild = guild
+            self.id = user_id
+            self.name = f"user{user_id}"
+            self.mention = f"<@{user_id}>"
+            self.display_avatar = None
+
+        def __str__(self):
+            return self.name
+
+    class Message:
+        def __init__(self, author):
+            self.author = author
+            self.guild = author.guild
+            self.content = "halo"
+            self._state = bot._connection  # dipakai Context di process_commands
+
+    def __init__(self, guild_count: int, events: int, seed: int = 0):
+        shard_count = SHARD_COUNT or 1
+        self.guilds = [self.Guild((i << 22) | 1) for i in range(guild_count)
+                       if SHARD_IDS is None or i % shard_count in SHARD_IDS]
+        self.events = events
+        self.random = random.Random(seed + CLUSTER_ID)
+        self.expected: dict[int, dict] = {guild.id: {'messages': 0, 'users': set()} for guild in self.guilds}
+
+    async def run(self):
+        # Pengganti READY: bot.user dipakai process_commands
+        bot._connection.user = self.Member(None, 1)
+        cluster_heartbeat.guilds = lambda: self.guilds
+        for _ in range(self.events if self.guilds else 0):
+            guild = self.random.choice(self.guilds)
+            member = self.Member(guild, self.random.randint(2, 500))
+            expected = self.expected[guild.id]
+            if self.random.random() < 0.1:
+                guild.member_count += 1
+                bot.dispatch('member_join', member)
+            else:
+                expected['messages'] += 1
+                bot.dispatch('message', self.Message(member))
+            expected['users'].add(member.id)
+            await asyncio.sleep(0)
+        # Beri kesempatan handler yang sudah di-dispatch untuk selesai
+        await asyncio.sleep(0.1)
+
+    def result(self) -> dict:
+        return {str(guild_id): {'messages': e['messages'], 'members': len(e['users'])} for guild_id, e in self.expected.items()}
+
+async def run_fake_gateway():
+    gateway = FakeGateway(FAKE_GATEWAY_GUILDS, FAKE_GATEWAY_EVENTS)
+    # async with: inisialisasi loop/HTTP client tanpa login; keluar dari blok memanggil bot.close()
+    async with bot:
+        await bot.start_services()
+        started = time.perf_counter()
+        await gateway.run()
+    print(f"FAKE_GATEWAY_RESULT {json.dumps({'cluster': CLUSTER_ID, 'seconds': time.perf_counter() - started, 'guilds': gateway.result()})}")
+
 # =====================
 # Jalankan bot
 # =====================
 if __name__ == "__main__":
+    startup.mark('import')
+    if BOT_ROLE == 'write-service':
+        asyncio.run(serve_writes(DB_WRITE_SERVICE or '127.0.0.1:8765'))
+        raise SystemExit
+    if FAKE_GATEWAY_GUILDS:
+        asyncio.run(run_fake_gateway())
+        raise SystemExit
     token = os.getenv('DISCORD_BOT_TOKEN')
     if not token:
         raise ValueError("Token bot tidak ditemukan. Pastikan Anda telah mengatur DISCORD_BOT_TOKEN di file .env")